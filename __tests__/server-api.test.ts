@@ -114,6 +114,29 @@ describe('Server API', () => {
       });
     });
 
+    it('should request only the given sections and default the rest', async () => {
+      mockFetch.mockResolvedValueOnce({
+        ok: true,
+        json: async () => ({ tools: [], generated_at: new Date() }),
+      });
+
+      const result = await fetchMarketIntelligence(['tools']);
+
+      expect(mockFetch).toHaveBeenCalledWith(
+        'http://localhost:8000/api/market-intelligence?fields=tools',
+        expect.any(Object)
+      );
+      expect(result).toEqual({
+        trends: [],
+        news: [],
+        tools: [],
+        case_studies: [],
+        search_trends: [],
+        metrics: [],
+        generated_at: expect.any(Date),
+      });
+    });
+
     it('should use environment variable for API URL', async () => {
       process.env.NEXT_PUBLIC_BACKEND_URL = 'https://api.example.com';
 
@@ -33,7 +33,7 @@ export const metadata: Metadata = {
 
 export default async function InsightsPage() {
   // Fetch data server-side
-  const data = await fetchMarketIntelligence();
+  const data = await fetchMarketIntelligence(['news', 'case_studies']);
 
   return (
     <div className="pt-24 px-4">
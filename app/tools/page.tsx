@@ -33,7 +33,7 @@ export const metadata: Metadata = {
 
 export default async function ToolsPage() {
   // Fetch data server-side
-  const data = await fetchMarketIntelligence();
+  const data = await fetchMarketIntelligence(['tools']);
 
   // Generate unique categories from tools
   const categories = ['all', ...Array.from(new Set(data?.tools?.map(tool => tool.category) || []))];
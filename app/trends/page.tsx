@@ -35,7 +35,7 @@ export const metadata: Metadata = {
 
 export default async function TrendsPage() {
   // Fetch data server-side
-  const data = await fetchMarketIntelligence();
+  const data = await fetchMarketIntelligence(['trends', 'search_trends', 'metrics']);
 
   return (
     <div className="pt-24 px-4">
@@ -0,0 +1,88 @@
+"""Micro-benchmark: CPU per request on the /api/market-intelligence cache-hit path.
+
+Compares the old hit path (json.loads of the cached string, then JSONResponse
+re-encoding it) with the functions the app serves through: an L1 hit answered
+by cached_payload_response, an L2 read of a stored entry or a ?fields=
+projection (read_view), and the per-refresh render_cache_entries write.
+
+    python benchmarks/hit_path.py [iterations]
+
+The L2 reads use the fakeredis package (pip install fakeredis lupa) and are
+skipped without it; their timings include fakeredis' own CPU.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+
+import main  # noqa: E402
+
+ENCODING = main.negotiate_encoding("gzip, deflate, br")
+PROJECTION = ["news", "case_studies"]  # What the insights page requests
+
+
+def bench(label: str, fn, iterations: int) -> float:
+    fn()  # warm up
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    per_request = (time.process_time() - start) / iterations * 1e6
+    print(f"{label:<44} {per_request:>9.1f} us/request")
+    return per_request
+
+
+def request() -> Request:
+    return Request({
+        "type": "http", "method": "GET", "path": "/api/market-intelligence", "query_string": b"",
+        "headers": [(b"accept-encoding", b"gzip, deflate, br")],
+    })
+
+
+def bench_l2(entries: dict, iterations: int):
+    try:
+        import fakeredis
+    except ImportError:
+        print("Cache hit, L2: skipped, fakeredis is not installed\n")
+        return
+    main.redis_client = fakeredis.aioredis.FakeRedis()
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(main.write_cache_entries(entries))
+    print(f"Cache hit, L2 (Redis read, {ENCODING})")
+    bench("  read_view: full document", lambda: loop.run_until_complete(main.read_view(None, ENCODING)), iterations)
+    bench(f"  read_view: ?fields={','.join(PROJECTION)}",
+          lambda: loop.run_until_complete(main.read_view(PROJECTION, ENCODING)), iterations)
+    loop.close()
+    print()
+
+
+def main_bench(iterations: int):
+    data = main.fallback_data()
+    legacy_cached = json.dumps(data.model_dump(), default=str)
+    entries = main.render_cache_entries(data)
+    entry = entries[main.CACHE_KEY]
+    print(f"payload: {len(entry.variants['identity'])} bytes ({len(entry.variants[ENCODING])} {ENCODING}), "
+          f"{iterations} iterations\n")
+
+    print("Cache hit, L1 (served from memory)")
+    before = bench("  before: json.loads + JSONResponse", lambda: JSONResponse(content=json.loads(legacy_cached)), iterations)
+    after = bench(f"  after:  cached_payload_response ({ENCODING})",
+                  lambda: main.cached_payload_response(request(), entry, "hit", ENCODING), iterations)
+    print(f"  speedup: {before / after:.1f}x\n")
+
+    bench_l2(entries, iterations)
+
+    # Every variant is compressed at maximum ratio, so the write runs far fewer times
+    writes = max(5, iterations // 500)
+    print(f"Cache write (once per refresh, {writes} iterations)")
+    bench("  before: json.dumps(default=str)", lambda: json.dumps(data.model_dump(), default=str), writes)
+    bench("  after:  render_cache_entries", lambda: main.render_cache_entries(data), writes)
+
+
+if __name__ == "__main__":
+    main_bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,239 @@
+"""Load test: the FastAPI app against the Sonar stub and a local or fake Redis.
+
+Requests go to the app in-process over ASGI, so timings cover the service itself
+without HTTP parsing or network hops. Concurrent requests share one event loop, as
+they would in one uvicorn worker, so latency includes queueing behind each other. Scenarios:
+
+    cold-miss   every round starts from an empty Redis and a fresh worker; one request waits on the refresh
+    warm-hit    the cache is warm; requests are served from the in-process L1 cache or Redis
+    stampede    cache entries and per-category Sonar responses expire together, then
+                `concurrency` requests arrive at once and must share a single refresh
+    redis-down  Redis becomes unreachable after warming and the L1 cache is empty; requests get
+                the in-memory snapshot
+
+Each reports throughput, p50/p95/p99 latency, X-Cache-Status counts and Sonar calls.
+
+    python benchmarks/load_test.py [--scenarios cold-miss,warm-hit,stampede,redis-down]
+        [--requests 2000] [--concurrency 50] [--rounds 3]
+        [--sonar-latency 0.5] [--sonar-error-rate 0] [--redis-url redis://localhost:6379/15]
+        [--save-baseline FILE] [--baseline FILE] [--tolerance 0.25]
+
+Without --redis-url the fakeredis package is used (pip install fakeredis lupa). A
+--redis-url database is flushed between scenarios, so point it at a scratch database.
+With --baseline the run exits 1 when a scenario's p95/p99 latency, throughput or
+Sonar calls regress past the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+from sonar_stub import SonarStub  # noqa: E402
+
+SCENARIOS = ("cold-miss", "warm-hit", "stampede", "redis-down")
+UNREACHABLE_REDIS = "redis://127.0.0.1:1"
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class LoadTest:
+    def __init__(self, main, stub: SonarStub, redis_client, args):
+        self.main = main
+        self.stub = stub
+        self.redis = redis_client
+        self.args = args
+        self.headers = {"Accept-Encoding": args.accept_encoding}
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench",
+                                        timeout=None)
+
+    async def fire(self, total: int, concurrency: int, latencies: list, statuses: Counter):
+        """Send `total` requests from `concurrency` concurrent clients"""
+        remaining = total
+
+        async def client():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                async with self.client.stream("GET", self.args.path, headers=self.headers) as response:
+                    # Raw bytes: decompressing on the client would be billed to the service
+                    async for _ in response.aiter_raw():
+                        pass
+                latencies.append(time.perf_counter() - started)
+                statuses[response.headers.get("x-cache-status") if response.status_code == 200
+                         else f"http_{response.status_code}"] += 1
+
+        await asyncio.gather(*(client() for _ in range(min(concurrency, total))))
+
+    async def reset_worker(self):
+        """Forget this worker's in-process state, as a freshly started worker would"""
+        self.main.last_known_good = self.main.LastKnownGood()
+        self.main.search_index = self.main.SearchIndex()
+        self.main.l1_cache.clear()
+
+    async def expire_cache(self):
+        """Drop the cached payloads and per-category Sonar responses, as their TTLs would"""
+        patterns = (f"{self.main.CACHE_KEY}*", f"{self.main.SONAR_CATEGORY_KEY_PREFIX}:*")
+        for pattern in patterns:
+            keys = [key async for key in self.redis.scan_iter(match=pattern)]
+            if keys:
+                await self.redis.delete(*keys)
+        # L1 entries never outlive the Redis entries they were read from
+        self.main.l1_cache.clear()
+
+    async def warm(self):
+        response = await self.client.get(self.args.path, headers=self.headers)
+        if response.status_code != 200:
+            raise RuntimeError(f"Warm-up request failed with {response.status_code}")
+
+    async def run(self, scenario: str) -> dict:
+        args = self.args
+        latencies, statuses = [], Counter()
+        await self.redis.flushdb()
+        await self.reset_worker()
+        if scenario != "cold-miss":
+            await self.warm()
+            # One unmeasured wave so first-request costs (pool connects, lazy renders) stay out of the numbers
+            await self.fire(args.concurrency, args.concurrency, [], Counter())
+        calls_before = self.stub.calls
+        started = time.perf_counter()
+        if scenario == "cold-miss":
+            for _ in range(args.rounds):
+                await self.redis.flushdb()
+                await self.reset_worker()
+                await self.fire(1, 1, latencies, statuses)
+        elif scenario == "warm-hit":
+            await self.fire(args.requests, args.concurrency, latencies, statuses)
+        elif scenario == "stampede":
+            for _ in range(args.rounds):
+                await self.expire_cache()
+                await self.fire(args.concurrency, args.concurrency, latencies, statuses)
+        elif scenario == "redis-down":
+            self.main.redis_client = self.main.aioredis.from_url(UNREACHABLE_REDIS)
+            # Start past the L1 TTL, so requests have to find out Redis is gone
+            self.main.l1_cache.clear()
+            try:
+                await self.fire(args.requests, args.concurrency, latencies, statuses)
+            finally:
+                self.main.redis_client = self.redis
+                self.main.redis_health.record_success()
+        elapsed = time.perf_counter() - started
+        ordered = sorted(latencies)
+        return {
+            "requests": len(latencies),
+            "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(percentile(ordered, 0.5) * 1000, 3),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+            "sonar_calls": self.stub.calls - calls_before,
+            "statuses": dict(statuses),
+        }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions of each scenario against its stored baseline"""
+    regressions = []
+    for scenario, result in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        for name in ("p95_ms", "p99_ms"):
+            if result[name] > base[name] * (1 + tolerance):
+                regressions.append(f"{scenario}: {name} {result[name]} > baseline {base[name]}")
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {result['throughput']} < baseline {base['throughput']}")
+        if result["sonar_calls"] > base["sonar_calls"] * (1 + tolerance):
+            regressions.append(f"{scenario}: sonar_calls {result['sonar_calls']} > baseline {base['sonar_calls']}")
+    return regressions
+
+
+async def run_load_test(args) -> int:
+    stub = SonarStub(args.sonar_latency, args.sonar_jitter, args.sonar_error_rate, seed=args.seed)
+    # The app reads its configuration at import time, so the stub has to be up first
+    os.environ.update({
+        "PERPLEXITY_API_KEY": "stub",
+        "PERPLEXITY_BASE_URL": stub.start(),
+        "BACKGROUND_REFRESH_ENABLED": "false",
+        "SONAR_RPM_LIMIT": "1000000",
+    })
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+    import main
+    if args.redis_url:
+        redis_client = main.redis_client
+    else:
+        try:
+            import fakeredis
+        except ImportError:
+            print("fakeredis is not installed: pip install fakeredis lupa, or pass --redis-url", file=sys.stderr)
+            return 2
+        redis_client = fakeredis.aioredis.FakeRedis()
+        main.redis_client = redis_client
+
+    test = LoadTest(main, stub, redis_client, args)
+    results = {}
+    try:
+        print(f"{'scenario':<12} {'requests':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'sonar':>6}  statuses")
+        for scenario in args.scenarios:
+            result = results[scenario] = await test.run(scenario)
+            statuses = ", ".join(f"{name}={count}" for name, count in sorted(result["statuses"].items()))
+            print(f"{scenario:<12} {result['requests']:>8} {result['throughput']:>9.1f} {result['p50_ms']:>9.3f} "
+                  f"{result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f} {result['sonar_calls']:>6}  {statuses}")
+    finally:
+        await test.client.aclose()
+        stub.stop()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\nbaseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nregressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nno regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", type=lambda value: [name for name in value.split(",") if name],
+                        default=list(SCENARIOS), help="Comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per warm-hit and redis-down run")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3, help="Cold-miss and stampede repetitions")
+    parser.add_argument("--path", default="/api/market-intelligence")
+    parser.add_argument("--accept-encoding", default="br, gzip")
+    parser.add_argument("--sonar-latency", type=float, default=0.5, help="Seconds before the stub's first token")
+    parser.add_argument("--sonar-jitter", type=float, default=0.5)
+    parser.add_argument("--sonar-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1, help="Seeds the stub's latency and error draws")
+    parser.add_argument("--redis-url", help="Scratch Redis database (flushed); default is fakeredis")
+    parser.add_argument("--baseline", help="Fail on regressions against this results file")
+    parser.add_argument("--save-baseline", help="Write this run's results as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed regression, as a share of the baseline")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    logging.disable(logging.ERROR)  # Expected warnings (fallbacks, Redis outage) would swamp the report
+    sys.exit(asyncio.run(run_load_test(parse_args())))
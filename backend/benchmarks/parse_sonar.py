@@ -0,0 +1,149 @@
+"""Micro-benchmark: extracting response models from recorded Sonar Pro answers.
+
+Runs every answer in benchmarks/sonar_corpus through the extraction stage three
+ways: parsing the whole answer at once, feeding it in small chunks the way the
+stream delivers it, and the same answer repeated to max_tokens size. Timings
+include normalising and validating the records into the response models.
+
+Before timing, each answer's extraction is checked against EXPECTED, and the
+streamed result against the whole-answer one; the run fails on any mismatch.
+
+    python benchmarks/parse_sonar.py [iterations]
+"""
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sonar_corpus")
+CHUNK_SIZE = 16  # Roughly the size of one streamed delta
+LARGE_REPEAT = 3  # Repeats a recorded answer to about Sonar's 3000-token max
+# Per category: items extracted from the recorded answer (the one with missing
+# required fields is skipped), the first item's title, and fields every item fills
+EXPECTED = {
+    "news": (9, "Meta Opens Threads to Video Ads Across All Markets",
+             ("headline", "source", "summary", "category", "published_date", "url")),
+    "tools": (9, "Jasper Studio",
+              ("name", "company", "description", "category", "key_features", "pricing_info", "target_audience")),
+    "case_studies": (7, 'Heinz "A.I. Ketchup" Generative Campaign',
+                     ("title", "company", "industry", "solution", "results", "source")),
+    "trends": (7, "Generative Engine Optimisation Becomes a Budget Line",
+               ("title", "description", "category", "impact_score", "insight", "sources")),
+}
+RUN_STARTED = datetime.now()
+TOOL_FIELDS = {"pricing_info": "Free", "key_features": ["Drafts"]}
+# Malformed answers: (category, markdown content or raw records, items that must survive)
+MALFORMED = [
+    ("trends", "### 1. Zero Scale Trend\n- **Impact score:** 4/0\n- **Description:** Scored on a zero scale\n\n"
+               "### 2. Regular Trend\n- **Impact score:** 4.2\n- **Description:** Scored normally\n", 2),
+    ("tools", [{"name": {"x": 1}, "description": "Name is an object", **TOOL_FIELDS},
+               {"name": "Acme Studio", "description": "Launch date is an object", "launch_date": {"y": 2}, **TOOL_FIELDS},
+               {"name": "Plain Tool", "description": "Well formed", **TOOL_FIELDS}], 2),
+    ("case_studies", [{"title": "Numeric Results", "solution": "Solution text", "results": 42},
+                      {"title": "Good Study", "solution": "Solution text", "results": "Up 30% in revenue"}], 1),
+]
+
+
+def extract(category: str, content: str, citations: list, chunk_size: int = 0) -> list:
+    parser = main.SonarContentParser(category)
+    if chunk_size:
+        for start in range(0, len(content), chunk_size):
+            parser.feed(content[start:start + chunk_size])
+        records = parser.close()
+    else:
+        records = parser.parse(content)
+    return main.parse_structured_items(category, records, citations)
+
+
+def comparable(items: list) -> list:
+    # Datetimes taken from the clock (undated items, first_seen) differ between runs;
+    # the ones parsed from the answer are all in the past
+    return [
+        {name: None if isinstance(value, datetime) and value >= RUN_STARTED else value
+         for name, value in item.model_dump().items()}
+        for item in items
+    ]
+
+
+def check(label: str, category: str, items: list, streamed: list) -> list:
+    """Mismatches between what was extracted and what the answer holds"""
+    count, first, fields = EXPECTED[category]
+    problems = []
+    if len(items) != count:
+        problems.append(f"{label}: {len(items)} items, expected {count}")
+    title_field = main.SONAR_ITEM_TITLE_FIELD[category]
+    if items and getattr(items[0], title_field) != first:
+        problems.append(f"{label}: first item {getattr(items[0], title_field)!r}, expected {first!r}")
+    for position, item in enumerate(items):
+        empty = [name for name in fields if getattr(item, name) in (None, "", [])]
+        if empty:
+            problems.append(f"{label}: item {position} has no {', '.join(empty)}")
+    if comparable(streamed) != comparable(items):
+        problems.append(f"{label}: streamed extraction differs from the whole answer")
+    return problems
+
+
+def check_malformed() -> list:
+    """Malformed records must be skipped, never fail the rest of the answer"""
+    problems = []
+    for category, answer, expected in MALFORMED:
+        try:
+            if isinstance(answer, str):
+                items = extract(category, answer, [])
+            else:
+                items = main.parse_structured_items(category, answer, [])
+        except Exception as e:
+            problems.append(f"malformed {category}: raised {type(e).__name__}: {e}")
+            continue
+        if len(items) != expected:
+            problems.append(f"malformed {category}: {len(items)} items, expected {expected}")
+    return problems
+
+
+def bench(fn, iterations: int) -> float:
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main_bench(iterations: int):
+    logging.disable(logging.WARNING)  # Skipped-item warnings are expected in the corpus
+    print(f"{'answer':<22} {'bytes':>7} {'items':>6} {'whole ms':>9} {'streamed ms':>12} {'large ms':>9}")
+    worst = 0.0
+    problems = check_malformed()
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.json"))):
+        with open(path) as f:
+            recorded = json.load(f)
+        content, citations = recorded["content"], recorded["citations"]
+        # A batched answer holds every category in one JSON document
+        categories = list(main.SONAR_FIELD_ALIASES) if recorded["category"] == "batched" else [recorded["category"]]
+        for category in categories:
+            label = f"{recorded['category']}:{category}" if len(categories) > 1 else category
+            items = extract(category, content, citations)
+            problems += check(label, category, items, extract(category, content, citations, CHUNK_SIZE))
+            whole = bench(lambda: extract(category, content, citations), iterations)
+            streamed = bench(lambda: extract(category, content, citations, CHUNK_SIZE), iterations)
+            row = f"{label:<22} {len(content.encode()):>7} {len(items):>6} {whole:>9.3f} {streamed:>12.3f}"
+            if len(categories) == 1:
+                large = content + "\n\n" + "\n\n".join([content] * (LARGE_REPEAT - 1))
+                large_ms = bench(lambda: extract(category, large, citations, CHUNK_SIZE), iterations)
+                worst = max(worst, large_ms)
+                row += f" {large_ms:>9.3f}"
+            worst = max(worst, whole, streamed)
+            print(row)
+    print(f"\nslowest answer: {worst:.3f} ms")
+    if problems:
+        sys.exit("extraction mismatches:\n  " + "\n  ".join(problems))
+
+
+if __name__ == "__main__":
+    main_bench(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
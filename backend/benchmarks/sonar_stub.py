@@ -0,0 +1,105 @@
+"""OpenAI-compatible stand-in for the Sonar Pro API, replaying the answers in sonar_corpus.
+
+Each chat completion streams the recorded answer for the category named in the
+system prompt ("Category: news"), or the batched answer when a response_format is
+sent, after a configurable latency. A configurable share of calls fails with a 500.
+
+    python benchmarks/sonar_stub.py [--port 8081] [--latency 1.5] [--jitter 0.5] [--error-rate 0.05]
+
+Point the backend at it with PERPLEXITY_BASE_URL=http://127.0.0.1:8081 and any PERPLEXITY_API_KEY.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import random
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sonar_corpus")
+CHUNK_SIZE = 64  # Characters per streamed delta
+
+
+def load_corpus() -> dict:
+    corpus = {}
+    for path in glob.glob(os.path.join(CORPUS_DIR, "*.json")):
+        with open(path) as f:
+            recorded = json.load(f)
+        corpus[recorded["category"]] = recorded
+    return corpus
+
+
+class SonarStub:
+    """Replays recorded Sonar Pro answers and counts the calls it receives"""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.5, error_rate: float = 0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self.corpus = load_corpus()
+        self.random = random.Random(seed)
+        self.server = None
+        self.app = FastAPI()
+        self.app.post("/chat/completions")(self.completions)
+
+    def _recorded(self, body: dict) -> dict:
+        if body.get("response_format"):
+            return self.corpus["batched"]
+        system = body["messages"][0]["content"]
+        category = system.rsplit("Category:", 1)[-1].strip() if "Category:" in system else "news"
+        return self.corpus.get(category, self.corpus["news"])
+
+    async def completions(self, request: Request):
+        body = await request.json()
+        self.calls += 1
+        delay = self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(delay / 2)
+            return JSONResponse({"error": {"message": "stub upstream error", "type": "server_error"}}, status_code=500)
+        return StreamingResponse(self._stream(self._recorded(body), body.get("model", "sonar-pro"), delay),
+                                 media_type="text/event-stream")
+
+    async def _stream(self, recorded: dict, model: str, delay: float):
+        await asyncio.sleep(delay)
+        content = recorded["content"]
+        base = {"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "citations": recorded["citations"]}
+        for start in range(0, len(content), CHUNK_SIZE):
+            delta = {"content": content[start:start + CHUNK_SIZE]}
+            yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+        final = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": recorded["usage"]}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    def start(self, port: int = 0) -> str:
+        """Serve from a background thread; returns the base URL"""
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+        self.server = uvicorn.Server(config)
+        threading.Thread(target=self.server.run, daemon=True).start()
+        while not self.server.started:
+            time.sleep(0.01)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    def stop(self):
+        if self.server:
+            self.server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=1.5, help="Seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency varies by +/- this share")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls that fail with a 500")
+    args = parser.parse_args()
+    stub = SonarStub(args.latency, args.jitter, args.error_rate)
+    uvicorn.run(stub.app, host="127.0.0.1", port=args.port)
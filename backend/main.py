@@ -1,17 +1,43 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from datetime import datetime, timedelta
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import dataclass
+from email.utils import formatdate
+import gzip
+import hashlib
+import hmac
+import heapq
 import json
-import redis
+import math
+import orjson
+import time
+import redis.asyncio as aioredis
+from redis.exceptions import (ConnectionError as RedisConnectionError, ResponseError, TimeoutError as RedisTimeoutError,
+                              WatchError)
 import os
-from redis import Redis
-from typing import List, Optional
-from fastapi.responses import JSONResponse
-from openai import OpenAI
+import re
+import struct
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from openai import APIStatusError, AsyncOpenAI
+import prometheus_client as prom
+from prometheus_client import multiprocess
+import asyncio
 import logging
+import random
+import uuid
+import zlib
 from dotenv import load_dotenv
 
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip variants are stored
+    brotli = None
+
 # Load environment variables
 load_dotenv()
 
@@ -53,6 +79,7 @@ class NewsArticleResponse(BaseModel):
     business_impact: str
     published_date: datetime
     category: str
+    sources: Optional[List[str]] = []
 
 class ToolResponse(BaseModel):
     name: str
@@ -64,6 +91,7 @@ class ToolResponse(BaseModel):
     target_audience: str
     launch_date: Optional[datetime] = None
     website_url: Optional[str] = ""
+    sources: Optional[List[str]] = []
 
 class CaseStudyResponse(BaseModel):
     title: str
@@ -84,27 +112,218 @@ class MarketIntelligenceResponse(BaseModel):
     metrics: List[MetricResponse]
     generated_at: datetime
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run background tasks and release pooled Redis connections on shutdown"""
+    await sync_search_index()
+    try:
+        # Prime the last known good snapshot so an outage right after startup still has data to serve
+        await read_cache_entry()
+    except Exception as e:
+        logging.warning(f"Could not prime last known good payload: {str(e)}")
+    tasks = [asyncio.create_task(run_update_listener()), asyncio.create_task(run_scope_tracker())]
+    if BACKGROUND_REFRESH_ENABLED:
+        tasks.append(asyncio.create_task(run_background_refresher()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await redis_client.aclose()
+    await redis_pool.disconnect()
+
 # Initialize App
 app = FastAPI(title="Neural Signal API",
              description="Real-time AI Marketing Intelligence Engine with Perplexity Sonar Pro",
-             version="2.0.0")
+             version="2.0.0",
+             lifespan=lifespan)
 
 # Configuration
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
 PERPLEXITY_API_KEY = os.getenv('PERPLEXITY_API_KEY')
-redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
-CACHE_TTL = int(os.getenv('CACHE_TTL', 1800))  # 30 minutes
+PERPLEXITY_BASE_URL = os.getenv('PERPLEXITY_BASE_URL', 'https://api.perplexity.ai')
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 20))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 2.0))  # Wait for a free pooled connection
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 1.0))
+REDIS_CONNECT_TIMEOUT = float(os.getenv('REDIS_CONNECT_TIMEOUT', 1.0))
+
+# Bounded asyncio connection pool so Redis I/O never blocks the event loop
+redis_pool = aioredis.BlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT
+)
+redis_client = aioredis.Redis(connection_pool=redis_pool)
+REDIS_REQUEST_TIMEOUT = float(os.getenv('REDIS_REQUEST_TIMEOUT', 0.25))  # Deadline on cache reads in the request path
+REDIS_HEALTH_FAILURES = int(os.getenv('REDIS_HEALTH_FAILURES', 3))  # Consecutive failures before Redis is marked down
+REDIS_RECONNECT_BASE = float(os.getenv('REDIS_RECONNECT_BASE', 0.5))
+REDIS_RECONNECT_MAX = float(os.getenv('REDIS_RECONNECT_MAX', 30))
+# Errors that mean Redis is unreachable or too slow, as opposed to a bad command or entry
+REDIS_OUTAGE_ERRORS = (RedisConnectionError, RedisTimeoutError, asyncio.TimeoutError)
+
+class RedisHealth:
+    """Marks Redis down after consecutive failures so requests stop waiting on it, and pings it back up"""
+    
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self.failures = 0
+        self.down_since: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+    
+    @property
+    def available(self) -> bool:
+        return self.down_since is None
+    
+    def record_success(self):
+        if self.down_since is not None:
+            logging.warning(f"Redis reachable again after {time.monotonic() - self.down_since:.1f}s")
+        self.failures = 0
+        self.down_since = None
+    
+    def record_failure(self, error: Exception):
+        self.failures += 1
+        self.last_error = str(error) or type(error).__name__
+        if self.down_since is None and self.failures >= self.threshold:
+            logging.error(f"Redis marked down after {self.failures} consecutive failures: {self.last_error}")
+            self.down_since = time.monotonic()
+        if self.down_since is not None and (self._reconnect_task is None or self._reconnect_task.done()):
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+    
+    async def _reconnect(self):
+        """Ping with jittered exponential backoff until Redis answers again"""
+        attempts = 0
+        while self.down_since is not None:
+            attempts += 1
+            await asyncio.sleep(random.uniform(0, min(REDIS_RECONNECT_MAX, REDIS_RECONNECT_BASE * 2 ** attempts)))
+            try:
+                await asyncio.wait_for(redis_client.ping(), REDIS_SOCKET_TIMEOUT)
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                continue
+            self.record_success()
+    
+    def snapshot(self) -> dict:
+        return {
+            "state": "up" if self.available else "down",
+            "consecutive_failures": self.failures,
+            "down_for": round(time.monotonic() - self.down_since, 1) if self.down_since is not None else 0,
+            "last_error": self.last_error,
+        }
+
+redis_health = RedisHealth(REDIS_HEALTH_FAILURES)
+CACHE_TTL = int(os.getenv('CACHE_TTL', 1800))  # 30 minutes, soft TTL: older entries are served stale and refreshed
+CACHE_HARD_TTL = max(CACHE_TTL, int(os.getenv('CACHE_HARD_TTL', CACHE_TTL * 4)))  # Entries are evicted after this
+CACHE_KEY = "sonar_market_intelligence"
+REFRESH_LOCK_TTL = int(os.getenv('REFRESH_LOCK_TTL', 30))  # Lease in seconds, renewed while the refresh runs
+REFRESH_WAIT_TIMEOUT = float(os.getenv('REFRESH_WAIT_TIMEOUT', 60))  # Max wait on another worker's refresh
+REFRESH_POLL_INTERVAL = 0.25
+BACKGROUND_REFRESH_ENABLED = os.getenv('BACKGROUND_REFRESH_ENABLED', 'true').lower() == 'true'
+REFRESH_INTERVAL = int(os.getenv('REFRESH_INTERVAL', int(CACHE_TTL * 0.8)))  # Refresh ahead of the soft TTL
+REFRESH_LEADER_KEY = f"{CACHE_KEY}:refresh_leader"
+REFRESH_LEADER_TTL = int(os.getenv('REFRESH_LEADER_TTL', 90))
+REFRESH_BACKOFF_BASE = float(os.getenv('REFRESH_BACKOFF_BASE', 5))
+REFRESH_BACKOFF_MAX = float(os.getenv('REFRESH_BACKOFF_MAX', 300))
+UPDATES_CHANNEL = f"{CACHE_KEY}:updates"  # Pub/sub channel announcing new cache entries
+SSE_MAX_CONNECTIONS = int(os.getenv('SSE_MAX_CONNECTIONS', 500))  # Per worker
+SSE_HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', 15))
+SSE_RETRY_MS = int(os.getenv('SSE_RETRY_MS', 5000))  # Client reconnect delay
+# In-process L1 cache of rendered responses in front of Redis, invalidated over UPDATES_CHANNEL
+L1_CACHE_TTL = float(os.getenv('L1_CACHE_TTL', 300))  # Backstop in case an invalidation is missed
+L1_CACHE_MAX_ENTRIES = int(os.getenv('L1_CACHE_MAX_ENTRIES', 64))
+L1_CACHE_MAX_BYTES = int(os.getenv('L1_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# Scoped queries (?industry=&region=&topic=): each distinct scope costs its own Sonar calls
+# and Redis keys, so only the most requested ones are kept
+SCOPE_MAX_ACTIVE = int(os.getenv('SCOPE_MAX_ACTIVE', 50))  # Scopes with cached data; the least used are evicted
+SCOPE_HALF_LIFE = float(os.getenv('SCOPE_HALF_LIFE', 86400))  # Seconds for a scope's request count to decay by half
+SCOPE_BACKGROUND_REFRESH = int(os.getenv('SCOPE_BACKGROUND_REFRESH', 5))  # Top scopes the background refresher keeps warm
+SCOPE_TRACK_INTERVAL = float(os.getenv('SCOPE_TRACK_INTERVAL', 5))  # Seconds between flushes of request counts
+SCOPE_MAX_TERMS = 3  # Comma-separated values per parameter
+SCOPE_TERM_MAX_LENGTH = 40
+SCOPE_MAX_CANDIDATES = SCOPE_MAX_ACTIVE * 4  # Requested scopes waiting for admission
+SCOPE_PROMOTIONS_PER_REFRESH = int(os.getenv('SCOPE_PROMOTIONS_PER_REFRESH', 1))  # Admissions per background check
+SCOPE_TENANT_HEADER = "X-API-Key"
+# Tenant -> API key authenticating its requests, e.g. "acme:k3y,trial:t0k"
+SCOPE_TENANT_KEYS = {
+    tenant.strip(): key.strip()
+    for tenant, _, key in (pair.partition(":") for pair in os.getenv('SCOPE_TENANT_KEYS', '').split(",") if ":" in pair)
+}
+# Tenant -> weight of its requests when ranking scopes, e.g. "acme=5,trial=0.5"; others count 1
+SCOPE_TENANT_WEIGHTS = {
+    tenant.strip(): float(weight)
+    for tenant, _, weight in (pair.partition("=") for pair in os.getenv('SCOPE_TENANT_WEIGHTS', '').split(",") if "=" in pair)
+}
+SCOPE_REGISTRY_KEY = f"{CACHE_KEY}:scopes"  # Sorted set: scope ID -> decayed request count
+SCOPE_CANDIDATES_KEY = f"{CACHE_KEY}:scope_candidates"  # Same, for scopes not admitted yet
+SCOPE_PARAMS_KEY = f"{CACHE_KEY}:scope_params"  # Hash: scope ID -> normalized parameters
+
+# Time-series history of metric values and trend scores, appended on every refresh
+TIMESERIES_KEY_PREFIX = "timeseries"
+TIMESERIES_ROLLUPS = {"1h": 3600, "1d": 86400}  # Stored rollup tiers -> bucket width in seconds
+TIMESERIES_RETENTION = {
+    "raw": int(os.getenv('TIMESERIES_RAW_RETENTION', 2 * 86400)),
+    "1h": int(os.getenv('TIMESERIES_HOURLY_RETENTION', 30 * 86400)),
+    "1d": int(os.getenv('TIMESERIES_DAILY_RETENTION', 365 * 86400)),
+}
+TIMESERIES_TREND_RESOLUTION = os.getenv('TIMESERIES_TREND_RESOLUTION', '1d')  # Step of trend_data points
+TIMESERIES_TREND_POINTS = int(os.getenv('TIMESERIES_TREND_POINTS', 7))
+TIMESERIES_MAX_POINTS = 1000  # Per range query
+
+# Full-text search over every news item, tool and case study the API has returned
+SEARCH_INDEX_KEY = "search_index"  # Hash holding the index revision and the oldest one the change log covers
+SEARCH_DOCS_KEY = "search_index:docs"  # Document ID -> serialized document
+SEARCH_CHANGES_KEY = "search_index:changes"  # Document IDs by the revision that last changed or removed them
+SEARCH_CHANGE_LOG = 1000  # Revisions kept in the change log; workers further behind reload every document
+SEARCH_RETENTION = int(os.getenv('SEARCH_RETENTION', 90 * 86400))  # Items unseen this long are dropped
+SEARCH_MAX_RESULTS = 100
+SEARCH_WRITE_RETRIES = 5
+
+# Near-duplicate news and tools are merged using MinHash signatures and LSH buckets in Redis
+DEDUP_THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', 0.5))  # Estimated Jaccard similarity to merge at
+DEDUP_RETENTION = int(os.getenv('DEDUP_RETENTION', 30 * 86400))  # How long seen items are remembered
+DEDUP_KEY_PREFIX = "dedup"
+SONAR_CONCURRENCY = int(os.getenv('SONAR_CONCURRENCY', 4))  # Max in-flight Sonar calls per worker
+SONAR_QUERY_MODE = os.getenv('SONAR_QUERY_MODE', 'fanout').lower()  # 'fanout' (one call per category) or 'batched'
+SONAR_BATCH_MAX_TOKENS = int(os.getenv('SONAR_BATCH_MAX_TOKENS', 8000))
+# Cluster-wide Sonar budget, shared by every worker through Redis token buckets
+SONAR_RPM_LIMIT = int(os.getenv('SONAR_RPM_LIMIT', 50))
+SONAR_DAILY_TOKEN_BUDGET = int(os.getenv('SONAR_DAILY_TOKEN_BUDGET', 0))  # 0 disables the token budget
+SONAR_RATE_LIMIT_WAIT = float(os.getenv('SONAR_RATE_LIMIT_WAIT', 30))  # Max seconds a call waits for a slot
+SONAR_BUDGET_LOW = float(os.getenv('SONAR_BUDGET_LOW', 0.25))  # Share of budget left below which TTLs stretch
+SONAR_BUDGET_CRITICAL = float(os.getenv('SONAR_BUDGET_CRITICAL', 0.1))  # ...and only the top category refreshes
+SONAR_BUDGET_TTL_STRETCH = float(os.getenv('SONAR_BUDGET_TTL_STRETCH', 4))
+# Per-call resilience: deadlines, retries, hedging and a circuit breaker per worker
+SONAR_CALL_TIMEOUT = float(os.getenv('SONAR_CALL_TIMEOUT', 45))  # Seconds per attempt
+SONAR_REQUEST_BUDGET = float(os.getenv('SONAR_REQUEST_BUDGET', 90))  # Seconds for a query, retries included
+SONAR_MAX_RETRIES = int(os.getenv('SONAR_MAX_RETRIES', 2))
+SONAR_RETRY_BASE = float(os.getenv('SONAR_RETRY_BASE', 1))
+SONAR_RETRY_MAX = float(os.getenv('SONAR_RETRY_MAX', 10))
+SONAR_HEDGE_PERCENTILE = float(os.getenv('SONAR_HEDGE_PERCENTILE', 0))  # e.g. 0.95; 0 disables hedging
+SONAR_HEDGE_MIN_SAMPLES = 20  # Latencies observed before hedging starts
+SONAR_BREAKER_FAILURES = int(os.getenv('SONAR_BREAKER_FAILURES', 5))  # Consecutive failed queries to open
+SONAR_BREAKER_COOLDOWN = float(os.getenv('SONAR_BREAKER_COOLDOWN', 60))  # Seconds open before a probe
+SONAR_RATE_LIMIT_KEY = "sonar_ratelimit"
+SONAR_USAGE_KEY_PREFIX = "sonar_usage"
+SONAR_USAGE_RETENTION = 35 * 86400
 
 # Initialize Perplexity client
 if PERPLEXITY_API_KEY:
-    perplexity_client = OpenAI(
+    # query_sonar_pro owns retries and deadlines; SDK retries would multiply its
+    # attempts unseen by the rate limiter and usage counters
+    perplexity_client = AsyncOpenAI(
         api_key=PERPLEXITY_API_KEY,
-        base_url="https://api.perplexity.ai"
+        base_url=PERPLEXITY_BASE_URL,
+        max_retries=0,
+        timeout=SONAR_CALL_TIMEOUT
     )
 else:
     perplexity_client = None
     logging.warning("PERPLEXITY_API_KEY not found, using fallback data")
 
+# Caps concurrent Sonar Pro calls so a cold refresh can't flood Perplexity
+sonar_semaphore = asyncio.Semaphore(max(1, SONAR_CONCURRENCY))
+
 # High-Quality Marketing Sources for Sonar Pro
 MARKETING_SOURCES = [
     "marketingland.com", "adage.com", "marketingprofs.com", "contentmarketinginstitute.com",
@@ -114,6 +333,21 @@ MARKETING_SOURCES = [
     "mit.edu", "stanford.edu", "reuters.com", "wsj.com", "bloomberg.com"
 ]
 
+# Per-category freshness: news goes stale in hours, case studies in days
+SONAR_CATEGORY_TTLS = {
+    "news": int(os.getenv('SONAR_TTL_NEWS', CACHE_TTL)),
+    "trends": int(os.getenv('SONAR_TTL_TRENDS', 6 * 3600)),
+    "tools": int(os.getenv('SONAR_TTL_TOOLS', 24 * 3600)),
+    "case_studies": int(os.getenv('SONAR_TTL_CASE_STUDIES', 72 * 3600)),
+}
+# Last good response per category is kept this long so a failed call can reuse it
+SONAR_CATEGORY_RETENTION = int(os.getenv('SONAR_CATEGORY_RETENTION', 7 * 24 * 3600))
+SONAR_CATEGORY_KEY_PREFIX = "sonar_category"
+# Refresh order of preference when the token budget runs low
+SONAR_CATEGORY_PRIORITY = [
+    category.strip() for category in os.getenv('SONAR_CATEGORY_PRIORITY', 'news,trends,tools,case_studies').split(',')
+]
+
 # Business-Focused Marketing Intelligence Queries
 MARKETING_QUERIES = {
     "news": f"""
@@ -145,331 +379,1322 @@ MARKETING_QUERIES = {
     """
 }
 
-async def query_sonar_pro(query: str, context: str = "") -> dict:
-    """Query Perplexity Sonar Pro API for market intelligence from high-quality sources"""
-    if not perplexity_client:
-        return {"error": "Perplexity API not configured"}
+# Query scope: industry/region/topic narrow every category query. Values are
+# normalized so equivalent requests (case, spacing, order) share one cache keyspace.
+SCOPE_FIELDS = ("industry", "region", "topic")
+_SCOPE_TERM = re.compile(r"^[a-z0-9][a-z0-9 &'./+-]*$")
+_SCOPE_ANY_TERMS = {"all", "any", "global", "worldwide"}  # Same as leaving the parameter out
+
+@dataclass(frozen=True)
+class IntelligenceScope:
+    """Normalized industry/region/topic terms a market intelligence query is narrowed to"""
+    industry: tuple = ()
+    region: tuple = ()
+    topic: tuple = ()
+
+    @classmethod
+    def from_params(cls, params: dict) -> "IntelligenceScope":
+        return cls(**{name: tuple(params.get(name) or ()) for name in SCOPE_FIELDS})
+
+    def params(self) -> dict:
+        return {name: list(getattr(self, name)) for name in SCOPE_FIELDS if getattr(self, name)}
+
+    @property
+    def id(self) -> str:
+        """Short stable ID used in Redis keys; empty for the unscoped default"""
+        params = self.params()
+        return hashlib.blake2b(orjson.dumps(params), digest_size=8).hexdigest() if params else ""
+
+    @property
+    def cache_key(self) -> str:
+        return scope_cache_key(self.id)
+
+    def queries(self) -> Dict[str, str]:
+        """Category -> Sonar query, with the scope appended to each"""
+        if not self.id:
+            return MARKETING_QUERIES
+        focus = "; ".join(f"{name}: {', '.join(getattr(self, name))}" for name in SCOPE_FIELDS if getattr(self, name))
+        return {category: f"{query.rstrip()}\n    Only include results relevant to {focus}.\n"
+                for category, query in MARKETING_QUERIES.items()}
+
+DEFAULT_SCOPE = IntelligenceScope()
+
+def scope_cache_key(scope_id: str) -> str:
+    return f"{CACHE_KEY}:scope:{scope_id}" if scope_id else CACHE_KEY
+
+def _scope_terms(name: str, value: Optional[str]) -> tuple:
+    terms = set()
+    for term in (value or "").split(","):
+        term = " ".join(term.lower().split())
+        if not term or term in _SCOPE_ANY_TERMS:
+            continue
+        if len(term) > SCOPE_TERM_MAX_LENGTH or not _SCOPE_TERM.match(term):
+            raise HTTPException(status_code=400, detail=f"Invalid {name}: {term[:SCOPE_TERM_MAX_LENGTH]}")
+        terms.add(term)
+    if len(terms) > SCOPE_MAX_TERMS:
+        raise HTTPException(status_code=400, detail=f"At most {SCOPE_MAX_TERMS} {name} values")
+    return tuple(sorted(terms))
+
+def parse_scope(industry: Optional[str] = None, region: Optional[str] = None,
+                topic: Optional[str] = None) -> IntelligenceScope:
+    """Normalize ?industry=&region=&topic= into a scope; none of them means the default"""
+    return IntelligenceScope(_scope_terms("industry", industry), _scope_terms("region", region),
+                             _scope_terms("topic", topic))
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through once the cooldown passes"""
     
-    try:
-        messages = [
-            {
-                "role": "system",
-                "content": f"""You are a senior marketing intelligence analyst providing actionable insights 
-                for marketing executives and professionals. Focus on business impact, ROI, and strategic implications.
-                Only cite information from reputable marketing publications, industry reports, and authoritative sources.
-                Provide specific metrics, case studies, and business outcomes when available. {context}"""
-            },
-            {
-                "role": "user",
-                "content": query
-            }
-        ]
-        
-        response = perplexity_client.chat.completions.create(
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+    
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+    
+    def release(self):
+        """Give back a probe that was never sent"""
+        self.probing = False
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+    
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logging.error(f"Sonar Pro circuit breaker opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+    
+    def snapshot(self) -> dict:
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self.failures,
+            "retry_in": round(self.cooldown - (time.monotonic() - self.opened_at), 1) if state == "open" else 0,
+        }
+
+class LatencyTracker:
+    """Recent successful attempt durations, for hedging and /health"""
+    
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+    
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+    
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+sonar_breaker = CircuitBreaker(SONAR_BREAKER_FAILURES, SONAR_BREAKER_COOLDOWN)
+sonar_latency = LatencyTracker()
+
+# Prometheus metrics. With several uvicorn workers, point PROMETHEUS_MULTIPROC_DIR at an
+# empty directory before start-up and /metrics aggregates every worker's samples
+STAGE_SECONDS = prom.Histogram(
+    "market_intelligence_stage_seconds", "Time spent in each stage of serving and refreshing market intelligence",
+    ["stage"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+SONAR_CALL_SECONDS = prom.Histogram(
+    "sonar_call_seconds", "Sonar Pro query time per category, including retries",
+    ["category", "outcome"], buckets=(0.5, 1, 2, 5, 10, 15, 20, 30, 45, 60, 90)
+)
+CACHE_RESPONSES = prom.Counter(
+    "market_intelligence_responses_total", "Market intelligence responses by cache status (hit, stale, miss, fallback)",
+    ["status"]
+)
+SONAR_REQUESTS = prom.Counter("sonar_requests_total", "Sonar Pro calls sent", ["category"])
+SONAR_ERRORS = prom.Counter("sonar_errors_total", "Sonar Pro calls that failed", ["category"])
+SONAR_TOKENS = prom.Counter("sonar_tokens_total", "Sonar Pro tokens used", ["category", "type"])
+SCOPE_EVICTIONS = prom.Counter(
+    "market_intelligence_scope_evictions_total", "Scopes whose cached data was dropped as least used"
+)
+CACHE_LOOKUPS = prom.Counter(
+    "market_intelligence_cache_lookups_total", "Cache lookups by tier (l1 in-process, l2 Redis) and result",
+    ["tier", "result"]
+)
+
+def _estimate_usage(query: str, content: str) -> dict:
+    """~4 characters per token, for calls whose stream didn't report usage"""
+    usage = {"prompt_tokens": len(query) // 4, "completion_tokens": len(content) // 4}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    return usage
+
+def _is_retryable(error: Exception) -> bool:
+    # Bad requests and auth errors fail the same way every time
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return True
+
+def _describe_error(error: Exception) -> str:
+    if isinstance(error, asyncio.TimeoutError):
+        return "Sonar Pro call timed out"
+    return str(error) or type(error).__name__
+
+async def _sonar_attempt(messages: list, max_tokens: int, extra: dict, parts: List[str],
+                         on_content: Optional[Callable[[Optional[str]], None]], hedge: bool = False) -> dict:
+    """One streamed Sonar Pro call; content is collected into parts as it arrives
+
+    A hedge skips the concurrency cap: its primary already holds a slot, and waiting
+    behind other primaries would defeat the point of racing it.
+    """
+    citations = []
+    usage = {}
+    async with nullcontext() if hedge else sonar_semaphore:
+        # Stream the completion so tokens are consumed as Sonar produces them
+        stream = await perplexity_client.chat.completions.create(
             model="sonar-pro",
             messages=messages,
             temperature=0.1,
-            max_tokens=3000
+            max_tokens=max_tokens,
+            stream=True,
+            **extra
         )
-        
-        content = response.choices[0].message.content
-        
-        # Extract citations if available
-        citations = []
-        if hasattr(response.choices[0].message, 'citations'):
-            citations = response.choices[0].message.citations
-        
-        return {
-            "content": content,
-            "citations": citations,
-            "usage": response.usage.dict() if response.usage else {}
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                if on_content:
+                    on_content(chunk.choices[0].delta.content)
+            # Perplexity attaches citations and final usage to the chunks themselves
+            citations = getattr(chunk, 'citations', None) or citations
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage.dict()
+    return {"content": "".join(parts), "citations": citations, "usage": usage}
+
+async def _hedged_attempt(query: str, messages: list, max_tokens: int, extra: dict, timeout: float,
+                          on_content: Optional[Callable[[Optional[str]], None]], category: str) -> dict:
+    """Run one attempt; if it outlives the latency percentile, race an identical second call"""
+    started = time.monotonic()
+    attempts = {}  # task -> content parts
+    primary_parts: List[str] = []
+    primary = asyncio.create_task(
+        asyncio.wait_for(_sonar_attempt(messages, max_tokens, extra, primary_parts, on_content), timeout)
+    )
+    attempts[primary] = primary_parts
+    hedge_after = None
+    if SONAR_HEDGE_PERCENTILE and len(sonar_latency.samples) >= SONAR_HEDGE_MIN_SAMPLES:
+        hedge_after = sonar_latency.percentile(SONAR_HEDGE_PERCENTILE)
+    try:
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            # A hedge costs a request slot too, but never waits for one
+            if not done and await acquire_sonar_call(wait=False) is None:
+                hedge_parts: List[str] = []
+                hedge = asyncio.create_task(asyncio.wait_for(
+                    _sonar_attempt(messages, max_tokens, extra, hedge_parts, None, hedge=True), timeout - hedge_after
+                ))
+                attempts[hedge] = hedge_parts
+        pending = set(attempts)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if task.exception() is None), None)
+            if winner is not None:
+                break
+            if not pending:
+                raise next(iter(done)).exception()
+        result = winner.result()
+        if winner is not primary and on_content:
+            # The hedge won: replace what the primary streamed with the hedge's answer
+            on_content(None)
+            on_content(result["content"])
+        sonar_latency.observe(time.monotonic() - started)
+        return result
+    finally:
+        losers = [task for task in attempts if not task.done()]
+        for task in losers:
+            task.cancel()
+        await asyncio.gather(*losers, return_exceptions=True)
+        for task, parts in attempts.items():
+            # A loser cancelled once the other call won was still sent, but didn't fail
+            failed = not task.cancelled() and task.exception() is not None
+            succeeded = not task.cancelled() and not failed
+            usage = (task.result()["usage"] if succeeded else {}) or _estimate_usage(query, "".join(parts))
+            await record_sonar_usage(category, usage, failed=failed)
+
+async def query_sonar_pro(query: str, context: str = "", response_format: Optional[dict] = None,
+                          max_tokens: int = 3000, on_content: Optional[Callable[[Optional[str]], None]] = None,
+                          category: str = "other") -> dict:
+    """Query Perplexity Sonar Pro API for market intelligence from high-quality sources
+
+    Attempts get SONAR_CALL_TIMEOUT each and SONAR_REQUEST_BUDGET overall. on_content
+    receives the answer as it streams, and None when a retry or hedge replaces it.
+    """
+    if not perplexity_client:
+        return {"error": "Perplexity API not configured"}
+    if not sonar_breaker.allow():
+        # Sonar is unhealthy: callers fall back to cached responses right away
+        return {"error": "Sonar Pro circuit breaker open"}
+    
+    messages = [
+        {
+            "role": "system",
+            "content": f"""You are a senior marketing intelligence analyst providing actionable insights 
+            for marketing executives and professionals. Focus on business impact, ROI, and strategic implications.
+            Only cite information from reputable marketing publications, industry reports, and authoritative sources.
+            Provide specific metrics, case studies, and business outcomes when available. {context}"""
+        },
+        {
+            "role": "user",
+            "content": query
         }
-        
+    ]
+    extra = {"response_format": response_format} if response_format else {}
+    started = time.perf_counter()
+    deadline = time.monotonic() + SONAR_REQUEST_BUDGET
+    error: Optional[Exception] = None
+    for attempt in range(SONAR_MAX_RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        budget_error = await acquire_sonar_call()
+        if budget_error:
+            logging.warning(f"Skipping Sonar Pro {category} call: {budget_error}")
+            if error is None:
+                sonar_breaker.release()
+                return {"error": budget_error}
+            break
+        try:
+            result = await _hedged_attempt(query, messages, max_tokens, extra, min(SONAR_CALL_TIMEOUT, remaining),
+                                           on_content, category)
+            sonar_breaker.record_success()
+            SONAR_CALL_SECONDS.labels(category=category, outcome="ok").observe(time.perf_counter() - started)
+            if not result["usage"]:
+                result["usage"] = _estimate_usage(query, result["content"])
+            return result
+        except Exception as e:
+            error = e
+            if on_content:
+                on_content(None)
+            if not _is_retryable(e) or attempt == SONAR_MAX_RETRIES:
+                break
+            # Full jitter, and never sleep past the overall budget
+            delay = random.uniform(0, min(SONAR_RETRY_MAX, SONAR_RETRY_BASE * 2 ** attempt))
+            logging.warning(f"Sonar Pro {category} attempt {attempt + 1} failed, retrying in {delay:.1f}s: {_describe_error(e)}")
+            if time.monotonic() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+    
+    sonar_breaker.record_failure()
+    SONAR_CALL_SECONDS.labels(category=category, outcome="error").observe(time.perf_counter() - started)
+    message = _describe_error(error) if error else "Sonar Pro request budget exhausted"
+    logging.error(f"Sonar Pro API error: {message}")
+    return {"error": message}
+
+# Sonar budget: token buckets in Redis so the limits hold across every worker.
+# Each bucket is a hash of (tokens, ts) refilled continuously up to its capacity.
+_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if ARGV[5] == '1' or tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('pexpire', KEYS[1], math.ceil(capacity / rate) + 60000)
+local wait = 0
+if allowed == 0 then
+    wait = math.ceil((cost - tokens) / rate)
+end
+return {allowed, tostring(tokens), wait}
+"""
+
+async def _take_tokens(bucket: str, capacity: float, per_second: float, cost: float, force: bool = False) -> tuple:
+    """Take cost tokens from a bucket; returns (allowed, tokens left, seconds to wait if not allowed)"""
+    allowed, remaining, wait_ms = await redis_client.eval(
+        _TOKEN_BUCKET_SCRIPT, 1, f"{SONAR_RATE_LIMIT_KEY}:{bucket}",
+        capacity, per_second / 1000, int(time.time() * 1000), cost, "1" if force else "0"
+    )
+    return bool(allowed), float(remaining), wait_ms / 1000
+
+async def _daily_tokens_left() -> Optional[float]:
+    if not SONAR_DAILY_TOKEN_BUDGET:
+        return None
+    _, remaining, _ = await _take_tokens("tokens", SONAR_DAILY_TOKEN_BUDGET, SONAR_DAILY_TOKEN_BUDGET / 86400, 0)
+    return remaining
+
+async def acquire_sonar_call(wait: bool = True) -> Optional[str]:
+    """Wait for a cluster-wide request slot; returns why the call can't be made, if it can't"""
+    try:
+        remaining = await _daily_tokens_left()
+        if remaining is not None and remaining <= 0:
+            return "Daily Sonar token budget exhausted"
+        deadline = time.monotonic() + SONAR_RATE_LIMIT_WAIT
+        while True:
+            allowed, _, delay = await _take_tokens("requests", SONAR_RPM_LIMIT, SONAR_RPM_LIMIT / 60, 1)
+            if allowed:
+                return None
+            if not wait or time.monotonic() + delay > deadline:
+                return "Sonar requests-per-minute limit reached"
+            await asyncio.sleep(delay)
+    except Exception as e:
+        # Fail open: an unreachable limiter shouldn't stop refreshes
+        logging.warning(f"Sonar rate limiter unavailable, allowing call: {str(e)}")
+        return None
+
+async def record_sonar_usage(category: str, usage: dict, failed: bool = False):
+    """Count a call's tokens per day and category, and charge them to the daily budget"""
+    key = f"{SONAR_USAGE_KEY_PREFIX}:{datetime.utcnow().strftime('%Y-%m-%d')}"
+    SONAR_REQUESTS.labels(category=category).inc()
+    if failed:
+        SONAR_ERRORS.labels(category=category).inc()
+    for name in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        if usage.get(name):
+            SONAR_TOKENS.labels(category=category, type=name.removesuffix("_tokens")).inc(int(usage[name]))
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for prefix in ("", f"{category}:"):
+                pipe.hincrby(key, f"{prefix}requests", 1)
+                if failed:
+                    pipe.hincrby(key, f"{prefix}errors", 1)
+                for name in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                    if usage.get(name):
+                        pipe.hincrby(key, f"{prefix}{name}", int(usage[name]))
+            pipe.expire(key, SONAR_USAGE_RETENTION)
+            await pipe.execute()
+        if SONAR_DAILY_TOKEN_BUDGET and usage.get("total_tokens"):
+            await _take_tokens("tokens", SONAR_DAILY_TOKEN_BUDGET, SONAR_DAILY_TOKEN_BUDGET / 86400,
+                               usage["total_tokens"], force=True)
+    except Exception as e:
+        logging.warning(f"Failed to record Sonar usage: {str(e)}")
+
+async def sonar_budget_level() -> str:
+    """'ok', 'low', 'critical' or 'exhausted', from the share of the daily token budget left"""
+    try:
+        remaining = await _daily_tokens_left()
     except Exception as e:
-        logging.error(f"Sonar Pro API error: {str(e)}")
-        return {"error": str(e)}
+        logging.warning(f"Failed to read Sonar token budget: {str(e)}")
+        return "ok"
+    if remaining is None:
+        return "ok"
+    share = remaining / SONAR_DAILY_TOKEN_BUDGET
+    if share <= 0:
+        return "exhausted"
+    if share < SONAR_BUDGET_CRITICAL:
+        return "critical"
+    if share < SONAR_BUDGET_LOW:
+        return "low"
+    return "ok"
+
+# Scoped keys are only written while the scope is registered, checked in the same
+# script, so a scope evicted mid-refresh can't leave untracked keys behind.
+# ARGV: scope ID, then per key: 'hash' or 'string', TTL, value count, values
+_WRITE_SCOPE_SCRIPT = """
+if not redis.call('zscore', KEYS[1], ARGV[1]) then
+    return 0
+end
+local i = 2
+for k = 2, #KEYS do
+    local n = tonumber(ARGV[i + 2])
+    if ARGV[i] == 'hash' then
+        redis.call('del', KEYS[k])
+        redis.call('hset', KEYS[k], unpack(ARGV, i + 3, i + 2 + n))
+        redis.call('expire', KEYS[k], ARGV[i + 1])
+    else
+        redis.call('set', KEYS[k], ARGV[i + 3], 'EX', ARGV[i + 1])
+    end
+    i = i + 3 + n
+end
+return 1
+"""
+
+async def write_scope_keys(scope: IntelligenceScope, writes: List[tuple]) -> bool:
+    """Write (key, hash mapping or string, TTL) for a registered scope; False if it isn't registered"""
+    keys, args = [], []
+    for key, value, ttl in writes:
+        keys.append(key)
+        if isinstance(value, dict):
+            values = [item for pair in value.items() for item in pair]
+            args += ["hash", ttl, len(values), *values]
+        else:
+            args += ["string", ttl, 1, value]
+    return bool(await redis_client.eval(_WRITE_SCOPE_SCRIPT, len(keys) + 1, SCOPE_REGISTRY_KEY, *keys, scope.id, *args))
+
+def scope_category_retention(category: str) -> int:
+    # A scope's responses live as long as its cache entries, or until they are due again, not for days
+    return max(CACHE_HARD_TTL, SONAR_CATEGORY_TTLS.get(category, CACHE_TTL))
+
+def _category_key(category: str, scope_id: str = "") -> str:
+    return f"{SONAR_CATEGORY_KEY_PREFIX}:{scope_id}:{category}" if scope_id else f"{SONAR_CATEGORY_KEY_PREFIX}:{category}"
+
+async def read_category_cache(categories: List[str], scope: IntelligenceScope = DEFAULT_SCOPE) -> dict:
+    """Load the last good Sonar response for each category in one round trip"""
+    raw = await redis_client.mget([_category_key(category, scope.id) for category in categories])
+    cached = {}
+    for category, value in zip(categories, raw):
+        if value is not None:
+            cached[category] = json.loads(value)
+    return cached
+
+async def write_category_cache(entries: dict, scope: IntelligenceScope = DEFAULT_SCOPE):
+    """Store successful Sonar responses, keyed by scope and category"""
+    if not entries:
+        return
+    if scope.id:
+        writes = [(_category_key(category, scope.id), json.dumps(entry), scope_category_retention(category))
+                  for category, entry in entries.items()]
+        if not await write_scope_keys(scope, writes):
+            logging.info("Market intelligence scope was evicted during its refresh, dropping its Sonar responses")
+        return
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for category, entry in entries.items():
+            pipe.set(_category_key(category), json.dumps(entry), ex=SONAR_CATEGORY_RETENTION)
+        await pipe.execute()
+
+async def _query_category(category: str, query: str) -> tuple:
+    # Items are extracted while the answer streams in and cached alongside the content
+    parser = SonarContentParser(category)
+    response = await query_sonar_pro(query, f"Category: {category}",
+                                     on_content=lambda chunk: parser.reset() if chunk is None else parser.feed(chunk),
+                                     category=category)
+    if not response.get("error"):
+        response["items"] = parser.close()
+    return category, response
+
+# Batched mode: one Sonar call covering every due category, with a JSON schema
+# that maps straight onto the response models. Category -> (model, fields Sonar fills in)
+STRUCTURED_OUTPUT_FIELDS = {
+    "news": (NewsArticleResponse, ["headline", "source", "url", "summary", "business_impact", "published_date", "category"]),
+    "trends": (TrendResponse, ["title", "description", "category", "impact_score", "insight", "sources"]),
+    "tools": (ToolResponse, ["name", "company", "description", "category", "key_features",
+                             "pricing_info", "target_audience", "website_url"]),
+    "case_studies": (CaseStudyResponse, ["title", "company", "industry", "challenge", "solution",
+                                         "results", "metrics", "source"]),
+}
+
+def structured_output_schema(categories: List[str]) -> dict:
+    """JSON schema asking for one array of items per category"""
+    properties = {}
+    for category in categories:
+        model, fields = STRUCTURED_OUTPUT_FIELDS[category]
+        model_schema = model.model_json_schema()
+        properties[category] = {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {name: model_schema["properties"][name] for name in fields},
+                "required": [name for name in fields if name in model_schema.get("required", [])],
+            },
+        }
+    return {"type": "object", "properties": properties, "required": list(categories)}
+
+def _strip_code_fence(content: str) -> str:
+    content = content.strip()
+    if content.startswith("```"):
+        content = content.split("\n", 1)[1] if "\n" in content else ""
+        content = content.rsplit("```", 1)[0]
+    return content
 
-def parse_market_intelligence(sonar_responses: dict) -> MarketIntelligenceResponse:
-    """Parse REAL Sonar Pro responses into business-focused marketing intelligence"""
+async def query_sonar_batched(categories: List[str], queries: Dict[str, str] = MARKETING_QUERIES) -> dict:
+    """Ask Sonar Pro for every category in one structured call, split back per category"""
+    tasks = "\n".join(f"- {category}: {' '.join(queries[category].split())}" for category in categories)
+    query = f"""Complete each of these research tasks and answer with a single JSON object
+    that has one array per task key, following the provided schema:
+    {tasks}"""
+    response = await query_sonar_pro(
+        query,
+        f"Categories: {', '.join(categories)}",
+        response_format={"type": "json_schema", "json_schema": {"schema": structured_output_schema(categories)}},
+        max_tokens=SONAR_BATCH_MAX_TOKENS,
+        category="batched"
+    )
+    if response.get("error"):
+        return {category: response for category in categories}
+    try:
+        document = json.loads(_strip_code_fence(response["content"]))
+    except ValueError as e:
+        logging.error(f"Sonar Pro batched response is not valid JSON: {str(e)}")
+        return {category: {"error": "Invalid JSON in batched response"} for category in categories}
     
-    # Initialize with real data from Perplexity responses
-    trends_data = []
-    news_data = []
-    tools_data = []
-    case_studies_data = []
-    search_trends_data = []
-    metrics_data = []
+    responses = {}
+    for index, category in enumerate(categories):
+        items = document.get(category) if isinstance(document, dict) else None
+        if not isinstance(items, list):
+            responses[category] = {"error": f"Batched response is missing {category}"}
+            continue
+        responses[category] = {
+            "content": json.dumps(items),
+            "citations": response["citations"],
+            # The single call's usage is attributed to the first category only so totals add up
+            "usage": response["usage"] if index == 0 else {},
+            "items": items,
+        }
+    return responses
+
+# Token usage and wall time of the most recent Sonar fetch, to compare query modes
+last_sonar_fetch: dict = {}
+
+def _record_sonar_fetch(mode: str, fetched: dict, started: float):
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    for response in fetched.values():
+        for key in usage:
+            usage[key] += (response.get("usage") or {}).get(key) or 0
+    last_sonar_fetch.clear()
+    last_sonar_fetch.update({
+        "mode": mode,
+        "categories": list(fetched),
+        "wall_time_ms": round((time.perf_counter() - started) * 1000, 1),
+        **usage,
+        "finished_at": datetime.now().isoformat(),
+    })
+    logging.info(f"Sonar Pro fetch ({mode}): {last_sonar_fetch}")
+
+async def fetch_sonar_responses(on_response: Optional[Callable[[str, dict], None]] = None,
+                                scope: IntelligenceScope = DEFAULT_SCOPE) -> Tuple[dict, float]:
+    """Query Sonar Pro concurrently for categories whose cached response expired or failed
+
+    on_response is called with each category's response as soon as it is available.
+    Returns the responses and when the newest of them was fetched.
+    """
+    queries = scope.queries()
+    categories = list(queries.keys())
+    cached = await read_category_cache(categories, scope)
+    now = time.time()
+    # Degrade instead of failing as the token budget runs out: stretch TTLs,
+    # then refresh only the top-priority category, then reuse cached responses only
+    level = await sonar_budget_level()
+    stretch = SONAR_BUDGET_TTL_STRETCH if level != "ok" else 1
+    # Refreshes run every REFRESH_INTERVAL, so a category expiring before the next one is due now;
+    # otherwise a TTL equal to the interval would only be refetched every other cycle
+    due = [
+        category for category in categories
+        if category not in cached
+        or now - cached[category]["fetched_at"] + REFRESH_INTERVAL
+        >= SONAR_CATEGORY_TTLS.get(category, CACHE_TTL) * stretch
+    ]
+    if level == "critical":
+        due = sorted(due, key=lambda category: SONAR_CATEGORY_PRIORITY.index(category)
+                     if category in SONAR_CATEGORY_PRIORITY else len(SONAR_CATEGORY_PRIORITY))[:1]
+    elif level == "exhausted":
+        due = []
+    if level != "ok":
+        logging.warning(f"Sonar token budget {level}, refreshing only: {', '.join(due) or 'nothing'}")
     
-    # Parse marketing news from REAL Sonar Pro response
-    if "news" in sonar_responses and not sonar_responses["news"].get("error"):
-        news_content = sonar_responses["news"]["content"]
-        citations = sonar_responses["news"].get("citations", [])
-        
-        # Parse real news from Perplexity response content
-        logging.info(f"Processing news content: {news_content[:200]}...")
-        
-        # Extract multiple news stories from the content
-        # This would typically use NLP parsing, but for now we'll create realistic examples
-        # based on the actual Perplexity response patterns
-        real_news = [
-            {
-                "headline": "Meta's Threads Surpasses 200M Monthly Active Users as Brands Shift Ad Spend",
-                "source": "AdAge",
-                "summary": "Meta reports Threads now hosts over 200 million monthly users, with major brands like Nike and Coca-Cola increasing their social media budget allocations to the platform",
-                "business_impact": "Early advertising partners report 23% lower cost-per-engagement compared to traditional social platforms",
-                "category": "Social Media Marketing"
-            },
-            {
-                "headline": "OpenAI Partners with WPP to Transform Creative Agency Workflows",
-                "source": "Campaign",
-                "summary": "Global advertising giant WPP announces strategic partnership with OpenAI to integrate advanced AI tools across its creative and media planning processes",
-                "business_impact": "Initial pilot programs show 40% reduction in concept-to-delivery timelines while maintaining creative quality standards",
-                "category": "AI & Creativity"
-            },
-            {
-                "headline": "Apple's Vision Pro Drives 300% Surge in Spatial Commerce Investment",
-                "source": "Retail Dive",
-                "summary": "Following Apple Vision Pro launch, retail brands report significant increases in spatial commerce and 3D shopping experience development budgets",
-                "business_impact": "Early adopters see 67% higher engagement rates and 28% increase in average order values for spatial commerce experiences",
-                "category": "Emerging Technology"
-            },
-            {
-                "headline": "TikTok Shop Expands to European Markets Amid Regulatory Scrutiny",
-                "source": "Marketing Week",
-                "summary": "ByteDance launches TikTok's e-commerce platform across UK, Germany, and France despite ongoing regulatory challenges and data privacy concerns",
-                "business_impact": "Beta merchants report conversion rates 45% higher than traditional social commerce platforms",
-                "category": "Social Commerce"
-            }
-        ]
-        
-        for i, article in enumerate(real_news):
-            news_data.append(NewsArticleResponse(
-                headline=article["headline"],
-                source=article["source"],
-                summary=article["summary"],
-                business_impact=article["business_impact"],
-                published_date=datetime.now() - timedelta(hours=i*8),
-                category=article["category"]
-            ))
-
-    # Parse trending marketing tools from REAL Sonar Pro response
-    if "tools" in sonar_responses and not sonar_responses["tools"].get("error"):
-        tools_content = sonar_responses["tools"]["content"]
-        citations = sonar_responses["tools"].get("citations", [])
-        
-        logging.info(f"Processing tools content: {tools_content[:200]}...")
-        
-        # Real marketing tools based on current market analysis
-        comprehensive_tools = [
-            {
-                "name": "ChatGPT Enterprise",
-                "company": "OpenAI",
-                "description": "Enterprise-grade AI assistant for marketing teams with advanced content generation and strategy capabilities",
-                "category": "AI Content Creation",
-                "features": ["Brand-compliant content generation", "Campaign ideation", "A/B testing copy", "Multilingual support"],
-                "target_audience": "Enterprise marketing teams and agencies",
-                "pricing": "Contact for enterprise pricing"
-            },
-            {
-                "name": "Klaviyo AI",
-                "company": "Klaviyo",
-                "description": "AI-powered email and SMS marketing platform with predictive analytics and automated optimization",
-                "category": "Email Marketing Automation",
-                "features": ["Predictive analytics", "Smart segmentation", "A/B testing", "Cross-channel orchestration"],
-                "target_audience": "E-commerce and retail marketers",
-                "pricing": "From $45/month"
-            },
-            {
-                "name": "Jasper AI",
-                "company": "Jasper",
-                "description": "AI content creation platform specialized for marketing campaigns and brand-consistent messaging",
-                "category": "AI Content Creation",
-                "features": ["Brand voice training", "Campaign templates", "Content optimization", "Team collaboration"],
-                "target_audience": "Content marketing teams and agencies",
-                "pricing": "From $49/month per user"
-            },
-            {
-                "name": "Adobe Real-Time CDP",
-                "company": "Adobe",
-                "description": "Customer data platform with AI-driven insights and real-time personalization capabilities",
-                "category": "Customer Data Platform",
-                "features": ["Real-time data unification", "AI-powered insights", "Cross-channel activation", "Privacy compliance"],
-                "target_audience": "Enterprise marketing and data teams",
-                "pricing": "Contact for enterprise pricing"
-            },
-            {
-                "name": "HubSpot Marketing AI",
-                "company": "HubSpot",
-                "description": "Integrated AI marketing suite with content creation, lead scoring, and campaign optimization",
-                "category": "Marketing Automation",
-                "features": ["AI content assistant", "Smart lead scoring", "Automated workflows", "Performance optimization"],
-                "target_audience": "SMB and enterprise marketing teams",
-                "pricing": "From $800/month"
-            },
-            {
-                "name": "Persado AI",
-                "company": "Persado",
-                "description": "AI-powered message optimization platform that uses emotional intelligence to improve campaign performance",
-                "category": "Message Optimization",
-                "features": ["Emotional AI analysis", "Dynamic message testing", "Performance prediction", "Multichannel optimization"],
-                "target_audience": "Performance marketing teams",
-                "pricing": "Enterprise only - contact for pricing"
-            }
-        ]
-        
-        for tool in comprehensive_tools:
-            tools_data.append(ToolResponse(
-                name=tool["name"],
-                company=tool["company"],
-                description=tool["description"],
-                category=tool["category"],
-                key_features=tool["features"],
-                target_audience=tool["target_audience"],
-                pricing_info=tool["pricing"],
-                launch_date=datetime.now() - timedelta(days=30),
-                website_url=f"https://{tool['company'].lower().replace(' ', '')}.com"
-            ))
-
-    # Parse case studies from REAL Sonar Pro response
-    if "case_studies" in sonar_responses and not sonar_responses["case_studies"].get("error"):
-        case_studies_content = sonar_responses["case_studies"]["content"]
-        
-        logging.info(f"Processing case studies content: {case_studies_content[:200]}...")
-        
-        # Real case studies with detailed business outcomes
-        real_case_studies = [
-            {
-                "title": "Spotify Increases User Engagement 35% with AI-Driven Playlist Personalization",
-                "company": "Spotify",
-                "industry": "Music Streaming",
-                "challenge": "Users struggling to discover new music leading to decreased session time and engagement",
-                "solution": "Deployed machine learning algorithms analyzing listening patterns, user context, and mood to create hyper-personalized playlists",
-                "results": "35% increase in average session duration, 28% improvement in user retention, 42% growth in playlist completion rates",
-                "metrics": ["35% longer sessions", "28% better retention", "42% playlist completion", "15% premium conversion lift"],
-                "source": "MIT Technology Review"
-            },
-            {
-                "title": "Coca-Cola Achieves 25% ROI Improvement Through AI Campaign Optimization",
-                "company": "The Coca-Cola Company",
-                "industry": "Consumer Beverages",
-                "challenge": "Managing marketing spend efficiency across 200+ markets with varying consumer preferences and competitive landscapes",
-                "solution": "Implemented AI-powered media mix modeling and real-time campaign optimization using machine learning algorithms",
-                "results": "25% improvement in marketing ROI, 18% reduction in cost per acquisition, 32% increase in brand awareness",
-                "metrics": ["25% ROI improvement", "18% lower CAC", "32% brand awareness lift", "$2.3M annual savings"],
-                "source": "McKinsey Global Institute"
-            },
-            {
-                "title": "Sephora Drives 40% Increase in Online Conversions with AI-Powered Personalization",
-                "company": "Sephora",
-                "industry": "Beauty Retail",
-                "challenge": "Personalizing product recommendations across diverse customer base with varying beauty preferences and skin types",
-                "solution": "Developed AI recommendation engine using computer vision, purchase history, and beauty profile data for personalized product matching",
-                "results": "40% increase in online conversion rates, 55% improvement in customer satisfaction scores, 30% higher average order value",
-                "metrics": ["40% conversion increase", "55% satisfaction improvement", "30% higher AOV", "22% repeat purchase rate"],
-                "source": "Harvard Business Review"
-            }
-        ]
-        
-        for case_study in real_case_studies:
-            case_studies_data.append(CaseStudyResponse(
-                title=case_study["title"],
-                company=case_study["company"],
-                industry=case_study["industry"],
-                challenge=case_study["challenge"],
-                solution=case_study["solution"],
-                results=case_study["results"],
-                metrics=case_study["metrics"],
-                source=case_study["source"]
-            ))
-
-    # Parse marketing trends from REAL Sonar Pro response
-    if "trends" in sonar_responses and not sonar_responses["trends"].get("error"):
-        trends_content = sonar_responses["trends"]["content"]
-        citations = sonar_responses["trends"].get("citations", [])
-        
-        logging.info(f"Processing trends content: {trends_content[:200]}...")
-        
-        # Real, current marketing trends with business impact
-        current_trends = [
-            {
-                "title": "Zero-Party Data Collection Becomes Critical for Customer Insights",
-                "description": "Brands are investing heavily in zero-party data strategies as privacy regulations tighten and third-party cookies disappear",
-                "category": "Data Privacy & Strategy",
-                "insight": "Companies with comprehensive zero-party data collection see 3.2x higher customer lifetime value and 45% better personalization effectiveness. Leading brands report 60% improvement in campaign targeting accuracy.",
-                "impact_score": 4.8
-            },
-            {
-                "title": "Generative AI Transforms Content Marketing at Enterprise Scale", 
-                "description": "Large enterprises are deploying generative AI for content creation, resulting in 70% faster content production and consistent brand voice across channels",
-                "category": "AI Content Technology",
-                "insight": "Enterprise adoption of generative AI for content marketing delivers 65% reduction in content creation time and 38% improvement in content engagement rates. ROI averages 280% within first year.",
-                "impact_score": 4.7
-            },
-            {
-                "title": "Real-Time Personalization Engines Drive Revenue Growth",
-                "description": "Advanced real-time personalization using machine learning is becoming table stakes for competitive e-commerce and subscription businesses",
-                "category": "Personalization Technology",
-                "insight": "Real-time personalization implementations show average revenue increases of 19% and conversion rate improvements of 25%. Customer satisfaction scores improve by 33% on average.",
-                "impact_score": 4.6
-            },
-            {
-                "title": "Marketing Attribution Gets AI-Powered Accuracy Boost",
-                "description": "AI-enhanced attribution models are helping marketers understand true campaign impact across complex customer journeys in privacy-first world",
-                "category": "Attribution & Analytics", 
-                "insight": "AI-powered attribution provides 40% more accurate campaign performance measurement and enables 25% better budget optimization. Marketing efficiency improves by average of 22%.",
-                "impact_score": 4.5
-            }
+    responses = {}
+    newest = 0.0
+    for category in categories:
+        if category in cached and category not in due:
+            responses[category] = cached[category]["response"]
+            newest = max(newest, cached[category]["fetched_at"])
+            if on_response:
+                on_response(category, responses[category])
+    
+    async def arrivals():
+        if SONAR_QUERY_MODE == "batched" and due:
+            for category, response in (await query_sonar_batched(due, queries)).items():
+                yield category, response
+        else:
+            for next_done in asyncio.as_completed([_query_category(category, queries[category]) for category in due]):
+                yield await next_done
+    
+    updates = {}
+    fetched = {}
+    started = time.perf_counter()
+    async for category, response in arrivals():
+        fetched[category] = response
+        if not response.get("error"):
+            updates[category] = {"response": response, "fetched_at": now}
+            newest = now
+        elif category in cached:
+            # Keep serving the last good value instead of dropping the section
+            logging.warning(f"Sonar Pro {category} refresh failed, reusing last good response")
+            response = cached[category]["response"]
+            newest = max(newest, cached[category]["fetched_at"])
+        responses[category] = response
+        if on_response:
+            on_response(category, response)
+    
+    if due:
+        _record_sonar_fetch("batched" if SONAR_QUERY_MODE == "batched" else "fanout", fetched, started)
+    await write_category_cache(updates, scope)
+    logging.info(f"Sonar Pro refreshed {len(updates)}/{len(due)} due categories, reused {len(categories) - len(due)}")
+    return responses, newest
+
+# Sonar content extraction: one pass over the markdown (or JSON) answer groups
+# lines into raw item records, which normalize_section_item maps onto the models.
+# Label (lowercased) -> model field, per category
+SONAR_FIELD_ALIASES = {
+    "news": {
+        "headline": "headline", "title": "headline", "source": "source", "publication": "source",
+        "outlet": "source", "summary": "summary", "key insight": "summary", "insight": "summary",
+        "details": "summary", "what happened": "summary", "business impact": "business_impact",
+        "impact": "business_impact", "why it matters": "business_impact", "category": "category",
+        "topic": "category", "date": "published_date", "published": "published_date",
+        "published date": "published_date", "url": "url", "link": "url",
+    },
+    "tools": {
+        "name": "name", "tool": "name", "tool name": "name", "company": "company", "vendor": "company",
+        "developer": "company", "provider": "company", "description": "description",
+        "overview": "description", "what it does": "description", "competitive advantage": "description",
+        "category": "category", "type": "category", "key features": "key_features",
+        "features": "key_features", "capabilities": "key_features", "pricing": "pricing_info",
+        "price": "pricing_info", "pricing info": "pricing_info", "target audience": "target_audience",
+        "audience": "target_audience", "best for": "target_audience", "launch date": "launch_date",
+        "launched": "launch_date", "release date": "launch_date", "website": "website_url",
+        "website url": "website_url", "url": "website_url", "link": "website_url",
+    },
+    "case_studies": {
+        "title": "title", "campaign": "title", "company": "company", "brand": "company",
+        "industry": "industry", "sector": "industry", "challenge": "challenge", "problem": "challenge",
+        "solution": "solution", "approach": "solution", "strategy": "solution", "results": "results",
+        "outcome": "results", "outcomes": "results", "business outcomes": "results",
+        "metrics": "metrics", "key metrics": "metrics", "source": "source",
+    },
+    "trends": {
+        "title": "title", "trend": "title", "description": "description", "overview": "description",
+        "insight": "insight", "key insight": "insight", "business impact": "insight",
+        "impact": "insight", "key data": "insight", "data": "insight", "category": "category",
+        "impact score": "impact_score", "score": "impact_score", "sources": "sources",
+    },
+}
+SONAR_ITEM_TITLE_FIELD = {"news": "headline", "tools": "name", "case_studies": "title", "trends": "title"}
+# Unlabelled body text fills the first of these that is still empty; the first is required
+SONAR_ITEM_BODY_FIELDS = {
+    "news": ["summary", "business_impact"],
+    "tools": ["description"],
+    "case_studies": ["results", "solution"],
+    "trends": ["description", "insight"],
+}
+SONAR_LIST_FIELDS = {"key_features", "metrics", "sources"}
+
+_RULE_LINE = re.compile(r"^[-*_=\s]+$")
+_HEADING_LINE = re.compile(r"^#{1,6}\s+(.*)$")
+_NUMBERED_LINE = re.compile(r"^\d{1,2}[.)]\s+(.*)$")
+_BULLET_LINE = re.compile(r"^[-*+\u2022]\s+(.*)$")
+_BOLD_LABEL = re.compile(r"^\*\*([^*]{1,80}?)\*\*\s*:?\s*(.*)$")
+_PLAIN_LABEL = re.compile(r"^([A-Za-z][A-Za-z /&-]{0,30}):\s*(.*)$")
+_CITATION_REF = re.compile(r"\[(\d{1,3})\]")
+_MARKDOWN_LINK = re.compile(r"\[([^\]]+)\]\((https?://[^)\s]+)\)")
+_LIST_SPLIT = re.compile(r";\s*|,\s+")
+_PERCENT_PHRASE = re.compile(r"\d+(?:\.\d+)?%[^,;.]*")
+_SCORE = re.compile(r"(\d+(?:\.\d+)?)(?:\s*/\s*(\d+))?")
+_TOOL_TITLE = re.compile(r"^(.+?)\s+(?:\((.+)\)|by\s+(.+))$")
+# Section headings that frame the answer rather than name an item
+_SKIPPED_TITLES = re.compile(
+    r"^(key takeaways|summary|conclusion|overview|sources|references|citations|introduction|"
+    r"bottom line|strategic implications|recommendations|notes?)\b", re.IGNORECASE)
+_DATE_FORMATS = ("%Y-%m-%d", "%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%B %Y")
+
+class SonarContentParser:
+    """Incremental extractor for one category's Sonar answer: feed() chunks as they stream, then close()"""
+
+    def __init__(self, category: str):
+        self.category = category
+        self.aliases = SONAR_FIELD_ALIASES[category]
+        self.title_field = SONAR_ITEM_TITLE_FIELD[category]
+        self.records: List[dict] = []
+        self._record: Optional[dict] = None
+        self._list_field: Optional[str] = None
+        self._pending: List[str] = []
+        self._json: Optional[List[str]] = None  # Set once the answer turns out to be JSON
+        self._started = False
+    
+    def feed(self, chunk: str):
+        """Consume a streamed chunk, handling every line it completes"""
+        if self._json is not None:
+            self._json.append(chunk)
+            return
+        if "\n" not in chunk:
+            self._pending.append(chunk)
+            if not self._started:
+                self._sniff()
+            return
+        self._pending.append(chunk)
+        if not self._started and self._sniff():
+            return
+        lines = "".join(self._pending).split("\n")
+        self._pending = [lines.pop()]
+        for line in lines:
+            self._line(line)
+    
+    def close(self) -> List[dict]:
+        """Flush the last line and return the raw item records"""
+        if not self._started:
+            self._sniff(final=True)
+        if self._json is not None:
+            return self._json_records("".join(self._json))
+        self._line("".join(self._pending))
+        self._pending = []
+        self._start(None)
+        return self.records
+    
+    def reset(self):
+        """Discard everything fed so far, e.g. when the call is retried"""
+        self.__init__(self.category)
+    
+    def parse(self, content: str) -> List[dict]:
+        self.feed(content)
+        return self.close()
+    
+    def _sniff(self, final: bool = False) -> bool:
+        """Decide from the first characters whether the answer is JSON or markdown"""
+        head = "".join(self._pending).lstrip()
+        if len(head) < 8 and not final:
+            return False
+        self._started = True
+        if head.startswith(("{", "```json", "```JSON")) or (head.startswith("[") and head[1:].lstrip()[:1] in ("{", "")):
+            self._json = self._pending
+            self._pending = []
+            return True
+        return False
+    
+    def _json_records(self, text: str) -> List[dict]:
+        try:
+            document = json.loads(_strip_code_fence(text))
+        except ValueError as e:
+            logging.warning(f"Sonar Pro {self.category} answer looked like JSON but did not parse: {str(e)}")
+            return []
+        if isinstance(document, dict):
+            document = document.get(self.category) or document.get("items") or next(
+                (value for value in document.values() if isinstance(value, list)), [])
+        return [record for record in document if isinstance(record, dict)] if isinstance(document, list) else []
+    
+    def _clean(self, text: str) -> str:
+        """Strip markdown from a value, keeping its citation refs and links on the current record"""
+        if "[" in text:
+            if self._record is not None:
+                self._record["_refs"].extend(int(ref) for ref in _CITATION_REF.findall(text))
+                self._record["_links"].extend(_MARKDOWN_LINK.findall(text))
+            text = _MARKDOWN_LINK.sub(r"\1", _CITATION_REF.sub("", text))
+        return " ".join(text.replace("**", "").replace("__", "").split()).strip(" -\u2013\u2014:\"")
+    
+    def _start(self, title: Optional[str]):
+        """Close the current record and, unless title is None, open the next one"""
+        record = self._record
+        if record is not None:
+            fields = record["fields"]
+            title_text = fields.get(self.title_field, "")
+            # Bare headings that only group the items below them are dropped
+            if (len(fields) > 1 or record["_text"]) and not _SKIPPED_TITLES.match(title_text):
+                self.records.append({
+                    **fields,
+                    "_text": " ".join(record["_text"]),
+                    "_refs": sorted(set(record["_refs"])),
+                    "_links": [url for _, url in record["_links"]],
+                })
+        self._record = None
+        self._list_field = None
+        if title is None:
+            return
+        self._record = {"fields": {}, "_text": [], "_refs": [], "_links": []}
+        numbered = _NUMBERED_LINE.match(title)
+        title = numbered.group(1) if numbered else title
+        bold = _BOLD_LABEL.match(title)
+        rest = ""
+        if bold:
+            title, rest = bold.group(1), bold.group(2)
+        title = self._clean(title)
+        if title:
+            self._record["fields"][self.title_field] = title
+        if rest:
+            self._add_text(rest)
+    
+    def _set_field(self, field: str, value: str):
+        fields = self._record["fields"] if self._record is not None else None
+        if fields is None or (field == self.title_field and fields.get(field)):
+            self._start("")
+            fields = self._record["fields"]
+        text = self._clean(value)
+        if field in SONAR_LIST_FIELDS:
+            # An empty list label collects the bullets that follow it
+            self._list_field = field
+            fields.setdefault(field, []).extend(part for part in _LIST_SPLIT.split(text) if part)
+            return
+        self._list_field = None
+        if text:
+            fields[field] = f"{fields[field]} {text}" if fields.get(field) else text
+    
+    def _add_text(self, text: str):
+        self._list_field = None
+        if self._record is not None:
+            text = self._clean(text)
+            if text:
+                self._record["_text"].append(text)
+    
+    def _line(self, line: str):
+        stripped = line.strip()
+        if not stripped or stripped[0] == "|" or _RULE_LINE.match(stripped):
+            return
+        heading = _HEADING_LINE.match(stripped)
+        if heading:
+            self._start(heading.group(1))
+            return
+        item = _NUMBERED_LINE.match(stripped)
+        bullet = None if item else _BULLET_LINE.match(stripped)
+        body = (item or bullet).group(1) if item or bullet else stripped
+        bold = _BOLD_LABEL.match(body)
+        label = bold or _PLAIN_LABEL.match(body)
+        if label:
+            field = self.aliases.get(label.group(1).strip().rstrip(":").strip().lower())
+            if field:
+                self._set_field(field, label.group(2))
+                return
+        top_level = len(line) - len(line.lstrip()) < 2
+        if top_level and (item or (bullet and bold)):
+            # A numbered entry, or a bullet led by a bold title, starts the next item
+            self._start(body)
+        elif bullet and self._list_field:
+            self._record["fields"][self._list_field].append(self._clean(body))
+        else:
+            self._add_text(body)
+
+def _parse_date(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    text = str(value).strip()
+    try:
+        return datetime.fromisoformat(text.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        pass
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return None
+
+def _parse_score(value) -> Optional[float]:
+    """Impact score on the dashboard's 0-5 scale from '4.5', '8/10', '92%' and the like"""
+    if isinstance(value, (int, float)):
+        score, scale = float(value), None
+    else:
+        match = _SCORE.search(str(value))
+        if not match:
+            return None
+        score, scale = float(match.group(1)), match.group(2)
+        if scale is not None and float(scale) == 0:
+            # '4/0' has no meaningful scale
+            return None
+    if scale:
+        score = score / float(scale) * 5
+    elif score > 10:
+        score = score / 20
+    elif score > 5:
+        score = score / 2
+    return round(min(max(score, 0.0), 5.0), 1)
+
+def _domain(url: str) -> str:
+    netloc = urlsplit(url).netloc if url.startswith("http") else ""
+    return netloc[4:] if netloc.startswith("www.") else netloc
+
+def normalize_section_item(category: str, record: dict, citations: list, rank: int) -> Optional[dict]:
+    """Map one raw record onto its model's fields, or None if the required ones are missing"""
+    aliases = SONAR_FIELD_ALIASES[category]
+    item = {}
+    for key, value in record.items():
+        if key.startswith("_") or value is None or value == "" or value == []:
+            continue
+        name = key.lower().replace("_", " ").strip()
+        field = aliases.get(name) or (key if key in STRUCTURED_OUTPUT_FIELDS[category][0].model_fields else None)
+        if not field or field in item or isinstance(value, dict):
+            continue
+        if field in SONAR_LIST_FIELDS:
+            item[field] = [str(part) for part in value] if isinstance(value, list) else [
+                part for part in _LIST_SPLIT.split(str(value)) if part]
+        elif isinstance(value, list):
+            item[field] = "; ".join(str(part) for part in value)
+        else:
+            item[field] = value
+    body_fields = SONAR_ITEM_BODY_FIELDS[category]
+    text = record.get("_text")
+    if text:
+        empty = next((name for name in body_fields if not item.get(name)), None)
+        if empty:
+            item[empty] = text
+    if not item.get(SONAR_ITEM_TITLE_FIELD[category]) or not item.get(body_fields[0]):
+        return None
+    for name in body_fields[1:]:
+        item.setdefault(name, "")
+    
+    cited = [citations[ref - 1] for ref in record.get("_refs") or [] if isinstance(ref, int) and 0 < ref <= len(citations)]
+    links = record.get("_links") or []
+    now = datetime.now()
+    if category == "news":
+        item.setdefault("url", (links + cited + [""])[0])
+        item.setdefault("source", _domain(item["url"]) or "Perplexity Sonar")
+        item.setdefault("category", "Marketing News")
+        item["published_date"] = _parse_date(item.get("published_date", "")) or now
+    elif category == "tools":
+        title = _TOOL_TITLE.match(item["name"]) if isinstance(item["name"], str) else None
+        if title and "company" not in item:
+            item["name"], item["company"] = title.group(1), title.group(2) or title.group(3)
+        item.setdefault("company", "")
+        item.setdefault("category", "Marketing Technology")
+        item.setdefault("target_audience", "Marketing teams")
+        item.setdefault("website_url", (links + [""])[0])
+        item.setdefault("sources", cited[:3])
+        item["launch_date"] = _parse_date(item["launch_date"]) if "launch_date" in item else None
+    elif category == "case_studies":
+        item.setdefault("company", "")
+        item.setdefault("industry", "Marketing")
+        item.setdefault("challenge", "")
+        item.setdefault("metrics", [phrase.strip() for phrase in _PERCENT_PHRASE.findall(str(item["results"]))][:4])
+        item.setdefault("source", _domain((cited + [""])[0]))
+    elif category == "trends":
+        # Sonar lists the most significant trends first, so rank stands in for a missing score
+        score = _parse_score(item["impact_score"]) if "impact_score" in item else None
+        item["impact_score"] = score if score is not None else round(max(4.9 - 0.1 * rank, 1.0), 1)
+        item.update(base_score=item["impact_score"], variance=0.0, first_seen=now, last_updated=now)
+        item.setdefault("category", "Marketing Trends")
+        item.setdefault("sources", (cited or citations)[:3])
+    return item
+
+# Curated catalogs and fallback data are built once against a fixed anchor time,
+# validated and serialized, and only their relative timestamps are filled in per use
+SNAPSHOT_ANCHOR = datetime(2000, 1, 1)
+RELATIVE_DATE_FIELDS = {"date"}  # "%Y-%m-%d" strings relative to render time, like SearchTrendResponse.date
+_SNAPSHOT_SLOT = re.compile(rb'"@@slot:(\d+)@@"')
+
+class CatalogSnapshot:
+    """Validated items stored with their timestamps as offsets from SNAPSHOT_ANCHOR
+
+    models() returns shallow copies that share list fields with the snapshot, so
+    callers must assign new lists rather than mutate them in place.
+    """
+    
+    def __init__(self, items: list):
+        self.items = tuple(items)
+        self.relative = []  # Per item: [(field, offset, is_date)]
+        self._slots = []
+        dumped = []
+        for item in self.items:
+            fields = []
+            data = item.model_dump()
+            for name, value in data.items():
+                if isinstance(value, datetime):
+                    fields.append((name, SNAPSHOT_ANCHOR - value, False))
+                elif name in RELATIVE_DATE_FIELDS:
+                    fields.append((name, SNAPSHOT_ANCHOR - datetime.strptime(value, "%Y-%m-%d"), True))
+                else:
+                    continue
+                data[name] = f"@@slot:{len(self._slots)}@@"
+                self._slots.append(fields[-1][1:])
+            self.relative.append(fields)
+            dumped.append(data)
+        # Literal bytes alternating with slot numbers
+        self._parts = _SNAPSHOT_SLOT.split(orjson.dumps(dumped))
+    
+    @staticmethod
+    def _value(offset: timedelta, is_date: bool, now: datetime):
+        value = now - offset
+        return value.strftime("%Y-%m-%d") if is_date else value
+    
+    def models(self, now: Optional[datetime] = None, **overrides) -> list:
+        """Copies of the items with timestamps relative to now, plus overrides for every item"""
+        now = now or datetime.now()
+        return [
+            item.model_copy(update={**{name: self._value(offset, is_date, now) for name, offset, is_date in fields},
+                                    **overrides})
+            for item, fields in zip(self.items, self.relative)
         ]
-        
-        for i, trend in enumerate(current_trends):
-            trends_data.append(TrendResponse(
-                title=trend["title"],
-                description=trend["description"],
-                base_score=4.3 + (i * 0.1),
-                variance=0.12,
-                category=trend["category"],
-                impact_score=trend["impact_score"],
-                first_seen=datetime.now() - timedelta(days=2+i),
-                last_updated=datetime.now(),
-                insight=trend["insight"],
-                sources=citations[:3] if citations else ["Forrester Research", "Gartner", "McKinsey Global Institute"]
-            ))
-    
-    # Parse search trends
-    if "search_trends" in sonar_responses and not sonar_responses["search_trends"].get("error"):
-        citations = sonar_responses["search_trends"].get("citations", [])
-        search_terms = ["AI Marketing Automation", "Conversion Rate Optimization", "Customer Data Platform", "Marketing Attribution", "Personalization Engine"]
-        
-        for i, term in enumerate(search_terms):
-            search_trends_data.append(SearchTrendResponse(
-                term=term,
-                growth=25.5 + (i * 5.2),
-                date=(datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d"),
-                industry="MarTech",
-                region=["Global", "North America"][i % 2:i % 2 + 1],
-                sources=citations[:1] if citations else []
-            ))
-    
-    # Parse metrics
-    if "metrics" in sonar_responses and not sonar_responses["metrics"].get("error"):
-        citations = sonar_responses["metrics"].get("citations", [])
-        metric_names = ["Email Engagement Rate", "Social Media Conversion Rate", "Content Marketing ROI"]
-        
-        for i, name in enumerate(metric_names):
-            metrics_data.append(MetricResponse(
-                name=name,
-                value=65.3 + (i * 7.2),
-                change=8.5 + (i * 2.1),
-                trend_data=[60+i*5, 62+i*5, 65+i*5, 67+i*5, 70+i*5, 68+i*5, 65+i*5],
-                sources=citations[:1] if citations else []
-            ))
-    
-    # Real search trends with growth data
-    comprehensive_search_trends = [
+    
+    def render(self, now: Optional[datetime] = None) -> bytes:
+        """The items as a JSON array, formatting only the timestamps"""
+        now = now or datetime.now()
+        parts = self._parts
+        out = [parts[0]]
+        for index in range(1, len(parts), 2):
+            out.append(orjson.dumps(self._value(*self._slots[int(parts[index])], now)))
+            out.append(parts[index + 1])
+        return b"".join(out)
+
+def curated_news(now: datetime) -> List[NewsArticleResponse]:
+    """Curated marketing news, used when nothing can be extracted from the Sonar Pro answer"""
+    real_news = [
+        {
+            "headline": "Meta's Threads Surpasses 200M Monthly Active Users as Brands Shift Ad Spend",
+            "source": "AdAge",
+            "summary": "Meta reports Threads now hosts over 200 million monthly users, with major brands like Nike and Coca-Cola increasing their social media budget allocations to the platform",
+            "business_impact": "Early advertising partners report 23% lower cost-per-engagement compared to traditional social platforms",
+            "category": "Social Media Marketing"
+        },
+        {
+            "headline": "OpenAI Partners with WPP to Transform Creative Agency Workflows",
+            "source": "Campaign",
+            "summary": "Global advertising giant WPP announces strategic partnership with OpenAI to integrate advanced AI tools across its creative and media planning processes",
+            "business_impact": "Initial pilot programs show 40% reduction in concept-to-delivery timelines while maintaining creative quality standards",
+            "category": "AI & Creativity"
+        },
+        {
+            "headline": "Apple's Vision Pro Drives 300% Surge in Spatial Commerce Investment",
+            "source": "Retail Dive",
+            "summary": "Following Apple Vision Pro launch, retail brands report significant increases in spatial commerce and 3D shopping experience development budgets",
+            "business_impact": "Early adopters see 67% higher engagement rates and 28% increase in average order values for spatial commerce experiences",
+            "category": "Emerging Technology"
+        },
+        {
+            "headline": "TikTok Shop Expands to European Markets Amid Regulatory Scrutiny",
+            "source": "Marketing Week",
+            "summary": "ByteDance launches TikTok's e-commerce platform across UK, Germany, and France despite ongoing regulatory challenges and data privacy concerns",
+            "business_impact": "Beta merchants report conversion rates 45% higher than traditional social commerce platforms",
+            "category": "Social Commerce"
+        }
+    ]
+    
+    return [
+        NewsArticleResponse(
+            headline=article["headline"],
+            source=article["source"],
+            summary=article["summary"],
+            business_impact=article["business_impact"],
+            published_date=now - timedelta(hours=i*8),
+            category=article["category"]
+        )
+        for i, article in enumerate(real_news)
+    ]
+
+CURATED_NEWS = CatalogSnapshot(curated_news(SNAPSHOT_ANCHOR))
+
+def parse_news_section(response: Optional[dict]) -> List[NewsArticleResponse]:
+    """Curated news for a Sonar Pro answer nothing could be extracted from"""
+    if not response or response.get("error"):
+        return []
+    
+    logging.debug(f"Processing news content: {response['content'][:200]}...")
+    return CURATED_NEWS.models()
+
+def curated_tools(now: datetime) -> List[ToolResponse]:
+    """Curated marketing tools, used when nothing can be extracted from the Sonar Pro answer"""
+    # Real marketing tools based on current market analysis
+    comprehensive_tools = [
+        {
+            "name": "ChatGPT Enterprise",
+            "company": "OpenAI",
+            "description": "Enterprise-grade AI assistant for marketing teams with advanced content generation and strategy capabilities",
+            "category": "AI Content Creation",
+            "features": ["Brand-compliant content generation", "Campaign ideation", "A/B testing copy", "Multilingual support"],
+            "target_audience": "Enterprise marketing teams and agencies",
+            "pricing": "Contact for enterprise pricing"
+        },
+        {
+            "name": "Klaviyo AI",
+            "company": "Klaviyo",
+            "description": "AI-powered email and SMS marketing platform with predictive analytics and automated optimization",
+            "category": "Email Marketing Automation",
+            "features": ["Predictive analytics", "Smart segmentation", "A/B testing", "Cross-channel orchestration"],
+            "target_audience": "E-commerce and retail marketers",
+            "pricing": "From $45/month"
+        },
+        {
+            "name": "Jasper AI",
+            "company": "Jasper",
+            "description": "AI content creation platform specialized for marketing campaigns and brand-consistent messaging",
+            "category": "AI Content Creation",
+            "features": ["Brand voice training", "Campaign templates", "Content optimization", "Team collaboration"],
+            "target_audience": "Content marketing teams and agencies",
+            "pricing": "From $49/month per user"
+        },
+        {
+            "name": "Adobe Real-Time CDP",
+            "company": "Adobe",
+            "description": "Customer data platform with AI-driven insights and real-time personalization capabilities",
+            "category": "Customer Data Platform",
+            "features": ["Real-time data unification", "AI-powered insights", "Cross-channel activation", "Privacy compliance"],
+            "target_audience": "Enterprise marketing and data teams",
+            "pricing": "Contact for enterprise pricing"
+        },
+        {
+            "name": "HubSpot Marketing AI",
+            "company": "HubSpot",
+            "description": "Integrated AI marketing suite with content creation, lead scoring, and campaign optimization",
+            "category": "Marketing Automation",
+            "features": ["AI content assistant", "Smart lead scoring", "Automated workflows", "Performance optimization"],
+            "target_audience": "SMB and enterprise marketing teams",
+            "pricing": "From $800/month"
+        },
+        {
+            "name": "Persado AI",
+            "company": "Persado",
+            "description": "AI-powered message optimization platform that uses emotional intelligence to improve campaign performance",
+            "category": "Message Optimization",
+            "features": ["Emotional AI analysis", "Dynamic message testing", "Performance prediction", "Multichannel optimization"],
+            "target_audience": "Performance marketing teams",
+            "pricing": "Enterprise only - contact for pricing"
+        }
+    ]
+    
+    return [
+        ToolResponse(
+            name=tool["name"],
+            company=tool["company"],
+            description=tool["description"],
+            category=tool["category"],
+            key_features=tool["features"],
+            target_audience=tool["target_audience"],
+            pricing_info=tool["pricing"],
+            launch_date=now - timedelta(days=30),
+            website_url=f"https://{tool['company'].lower().replace(' ', '')}.com"
+        )
+        for tool in comprehensive_tools
+    ]
+
+CURATED_TOOLS = CatalogSnapshot(curated_tools(SNAPSHOT_ANCHOR))
+
+def parse_tools_section(response: Optional[dict]) -> List[ToolResponse]:
+    """Curated tools for a Sonar Pro answer nothing could be extracted from"""
+    if not response or response.get("error"):
+        return []
+    
+    logging.debug(f"Processing tools content: {response['content'][:200]}...")
+    return CURATED_TOOLS.models()
+
+def curated_case_studies() -> List[CaseStudyResponse]:
+    """Curated case studies, used when nothing can be extracted from the Sonar Pro answer"""
+    # Real case studies with detailed business outcomes
+    real_case_studies = [
+        {
+            "title": "Spotify Increases User Engagement 35% with AI-Driven Playlist Personalization",
+            "company": "Spotify",
+            "industry": "Music Streaming",
+            "challenge": "Users struggling to discover new music leading to decreased session time and engagement",
+            "solution": "Deployed machine learning algorithms analyzing listening patterns, user context, and mood to create hyper-personalized playlists",
+            "results": "35% increase in average session duration, 28% improvement in user retention, 42% growth in playlist completion rates",
+            "metrics": ["35% longer sessions", "28% better retention", "42% playlist completion", "15% premium conversion lift"],
+            "source": "MIT Technology Review"
+        },
+        {
+            "title": "Coca-Cola Achieves 25% ROI Improvement Through AI Campaign Optimization",
+            "company": "The Coca-Cola Company",
+            "industry": "Consumer Beverages",
+            "challenge": "Managing marketing spend efficiency across 200+ markets with varying consumer preferences and competitive landscapes",
+            "solution": "Implemented AI-powered media mix modeling and real-time campaign optimization using machine learning algorithms",
+            "results": "25% improvement in marketing ROI, 18% reduction in cost per acquisition, 32% increase in brand awareness",
+            "metrics": ["25% ROI improvement", "18% lower CAC", "32% brand awareness lift", "$2.3M annual savings"],
+            "source": "McKinsey Global Institute"
+        },
+        {
+            "title": "Sephora Drives 40% Increase in Online Conversions with AI-Powered Personalization",
+            "company": "Sephora",
+            "industry": "Beauty Retail",
+            "challenge": "Personalizing product recommendations across diverse customer base with varying beauty preferences and skin types",
+            "solution": "Developed AI recommendation engine using computer vision, purchase history, and beauty profile data for personalized product matching",
+            "results": "40% increase in online conversion rates, 55% improvement in customer satisfaction scores, 30% higher average order value",
+            "metrics": ["40% conversion increase", "55% satisfaction improvement", "30% higher AOV", "22% repeat purchase rate"],
+            "source": "Harvard Business Review"
+        }
+    ]
+    
+    return [CaseStudyResponse(**case_study) for case_study in real_case_studies]
+
+CURATED_CASE_STUDIES = CatalogSnapshot(curated_case_studies())
+
+def parse_case_studies_section(response: Optional[dict]) -> List[CaseStudyResponse]:
+    """Curated case studies for a Sonar Pro answer nothing could be extracted from"""
+    if not response or response.get("error"):
+        return []
+    
+    logging.debug(f"Processing case studies content: {response['content'][:200]}...")
+    return CURATED_CASE_STUDIES.models()
+
+def curated_trends(now: datetime) -> List[TrendResponse]:
+    """Curated marketing trends, used when nothing can be extracted from the Sonar Pro answer"""
+    # Real, current marketing trends with business impact
+    current_trends = [
+        {
+            "title": "Zero-Party Data Collection Becomes Critical for Customer Insights",
+            "description": "Brands are investing heavily in zero-party data strategies as privacy regulations tighten and third-party cookies disappear",
+            "category": "Data Privacy & Strategy",
+            "insight": "Companies with comprehensive zero-party data collection see 3.2x higher customer lifetime value and 45% better personalization effectiveness. Leading brands report 60% improvement in campaign targeting accuracy.",
+            "impact_score": 4.8
+        },
+        {
+            "title": "Generative AI Transforms Content Marketing at Enterprise Scale", 
+            "description": "Large enterprises are deploying generative AI for content creation, resulting in 70% faster content production and consistent brand voice across channels",
+            "category": "AI Content Technology",
+            "insight": "Enterprise adoption of generative AI for content marketing delivers 65% reduction in content creation time and 38% improvement in content engagement rates. ROI averages 280% within first year.",
+            "impact_score": 4.7
+        },
+        {
+            "title": "Real-Time Personalization Engines Drive Revenue Growth",
+            "description": "Advanced real-time personalization using machine learning is becoming table stakes for competitive e-commerce and subscription businesses",
+            "category": "Personalization Technology",
+            "insight": "Real-time personalization implementations show average revenue increases of 19% and conversion rate improvements of 25%. Customer satisfaction scores improve by 33% on average.",
+            "impact_score": 4.6
+        },
+        {
+            "title": "Marketing Attribution Gets AI-Powered Accuracy Boost",
+            "description": "AI-enhanced attribution models are helping marketers understand true campaign impact across complex customer journeys in privacy-first world",
+            "category": "Attribution & Analytics", 
+            "insight": "AI-powered attribution provides 40% more accurate campaign performance measurement and enables 25% better budget optimization. Marketing efficiency improves by average of 22%.",
+            "impact_score": 4.5
+        }
+    ]
+    
+    return [
+        TrendResponse(
+            title=trend["title"],
+            description=trend["description"],
+            base_score=4.3 + (i * 0.1),
+            variance=0.12,
+            category=trend["category"],
+            impact_score=trend["impact_score"],
+            first_seen=now - timedelta(days=2+i),
+            last_updated=now,
+            insight=trend["insight"],
+            sources=["Forrester Research", "Gartner", "McKinsey Global Institute"]
+        )
+        for i, trend in enumerate(current_trends)
+    ]
+
+CURATED_TRENDS = CatalogSnapshot(curated_trends(SNAPSHOT_ANCHOR))
+
+def parse_trends_section(response: Optional[dict]) -> List[TrendResponse]:
+    """Curated trends, citing the answer's sources, for a Sonar Pro answer nothing could be extracted from"""
+    if not response or response.get("error"):
+        return []
+    
+    citations = response.get("citations", [])
+    logging.debug(f"Processing trends content: {response['content'][:200]}...")
+    return CURATED_TRENDS.models(sources=citations[:3]) if citations else CURATED_TRENDS.models()
+
+def tracked_search_trends(now: datetime) -> List[SearchTrendResponse]:
+    """Search terms reported whenever Sonar Pro answers, with its first citation as the source"""
+    search_terms = ["AI Marketing Automation", "Conversion Rate Optimization", "Customer Data Platform", "Marketing Attribution", "Personalization Engine"]
+    return [
+        SearchTrendResponse(
+            term=term,
+            growth=25.5 + (i * 5.2),
+            date=(now - timedelta(days=i)).strftime("%Y-%m-%d"),
+            industry="MarTech",
+            region=["Global", "North America"][i % 2:i % 2 + 1],
+            sources=[]
+        )
+        for i, term in enumerate(search_terms)
+    ]
+
+def curated_search_trends(now: datetime) -> List[SearchTrendResponse]:
+    """Real search trends with growth data, always included"""
+    return [
         SearchTrendResponse(
             term="AI marketing automation",
             growth=247.3,
-            date=datetime.now().strftime("%Y-%m-%d"),
+            date=now.strftime("%Y-%m-%d"),
             industry="MarTech",
             region=["North America", "Europe", "Asia-Pacific"],
             sources=["Google Trends", "SEMrush", "Ahrefs"]
@@ -477,7 +1702,7 @@ def parse_market_intelligence(sonar_responses: dict) -> MarketIntelligenceRespon
         SearchTrendResponse(
             term="zero party data collection",
             growth=189.5,
-            date=(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d"),
+            date=(now - timedelta(days=1)).strftime("%Y-%m-%d"),
             industry="Data & Privacy",
             region=["Global"],
             sources=["Google Trends", "BrightEdge"]
@@ -485,16 +1710,43 @@ def parse_market_intelligence(sonar_responses: dict) -> MarketIntelligenceRespon
         SearchTrendResponse(
             term="real-time personalization",
             growth=156.2,
-            date=(datetime.now() - timedelta(days=2)).strftime("%Y-%m-%d"),
+            date=(now - timedelta(days=2)).strftime("%Y-%m-%d"),
             industry="E-commerce",
             region=["North America", "Europe"],
             sources=["SEMrush", "Moz"]
         )
     ]
-    search_trends_data.extend(comprehensive_search_trends)
-    
-    # Professional marketing metrics with benchmarks
-    professional_metrics = [
+
+TRACKED_SEARCH_TRENDS = CatalogSnapshot(tracked_search_trends(SNAPSHOT_ANCHOR))
+CURATED_SEARCH_TRENDS = CatalogSnapshot(curated_search_trends(SNAPSHOT_ANCHOR))
+
+def parse_search_trends_section(response: Optional[dict]) -> List[SearchTrendResponse]:
+    """Parse search trends, always including the benchmark search terms"""
+    now = datetime.now()
+    search_trends_data = []
+    if response and not response.get("error"):
+        citations = response.get("citations", [])
+        search_trends_data.extend(TRACKED_SEARCH_TRENDS.models(now, sources=citations[:1]))
+    search_trends_data.extend(CURATED_SEARCH_TRENDS.models(now))
+    return search_trends_data
+
+def tracked_metrics() -> List[MetricResponse]:
+    """Metrics reported whenever Sonar Pro answers, with its first citation as the source"""
+    metric_names = ["Email Engagement Rate", "Social Media Conversion Rate", "Content Marketing ROI"]
+    return [
+        MetricResponse(
+            name=name,
+            value=65.3 + (i * 7.2),
+            change=8.5 + (i * 2.1),
+            trend_data=[60+i*5, 62+i*5, 65+i*5, 67+i*5, 70+i*5, 68+i*5, 65+i*5],
+            sources=[]
+        )
+        for i, name in enumerate(metric_names)
+    ]
+
+def curated_metrics() -> List[MetricResponse]:
+    """Professional marketing metrics with benchmarks, always included"""
+    return [
         MetricResponse(
             name="AI-Enhanced Email Open Rate",
             value=28.4,
@@ -517,280 +1769,1921 @@ def parse_market_intelligence(sonar_responses: dict) -> MarketIntelligenceRespon
             sources=["Salesforce Research", "HubSpot", "Marketo"]
         )
     ]
-    metrics_data.extend(professional_metrics)
 
+TRACKED_METRICS = CatalogSnapshot(tracked_metrics())
+CURATED_METRICS = CatalogSnapshot(curated_metrics())
+
+def parse_metrics_section(response: Optional[dict]) -> List[MetricResponse]:
+    """Parse metrics, always including the professional benchmarks"""
+    metrics_data = []
+    if response and not response.get("error"):
+        citations = response.get("citations", [])
+        metrics_data.extend(TRACKED_METRICS.models(sources=citations[:1]))
+    metrics_data.extend(CURATED_METRICS.models())
+    return metrics_data
+
+# Section name -> (Sonar category it is parsed from, parser)
+SECTION_PARSERS = {
+    "trends": ("trends", parse_trends_section),
+    "news": ("news", parse_news_section),
+    "tools": ("tools", parse_tools_section),
+    "case_studies": ("case_studies", parse_case_studies_section),
+    "search_trends": ("search_trends", parse_search_trends_section),
+    "metrics": ("metrics", parse_metrics_section),
+}
+
+def parse_structured_items(category: str, records: list, citations: Optional[list] = None) -> list:
+    """Validate extracted records into response models, skipping malformed ones"""
+    model, _ = STRUCTURED_OUTPUT_FIELDS[category]
+    items = []
+    for rank, record in enumerate(records):
+        try:
+            fields = normalize_section_item(category, record, citations or [], rank) if isinstance(record, dict) else None
+            if fields is None:
+                logging.warning(f"Skipping incomplete {category} item from Sonar Pro")
+                continue
+            items.append(model(**fields))
+        except ValidationError as e:
+            logging.warning(f"Skipping malformed {category} item from Sonar Pro: {e.errors()[0]['msg']}")
+        except Exception as e:
+            # One odd record must not cost the whole section, and with it the refresh
+            logging.warning(f"Skipping malformed {category} item from Sonar Pro: {type(e).__name__}: {str(e)}")
+    return items
+
+def parse_section(section: str, sonar_responses: dict) -> list:
+    """Parse one response section from whichever Sonar category feeds it"""
+    category, parser = SECTION_PARSERS[section]
+    response = sonar_responses.get(category)
+    if category in SONAR_FIELD_ALIASES and response and not response.get("error"):
+        records = response.get("items")
+        if records is None:
+            # Cached before items were extracted at fetch time
+            records = SonarContentParser(category).parse(response.get("content") or "")
+        items = parse_structured_items(category, records, response.get("citations"))
+        if items:
+            return items
+        logging.warning(f"No {category} items extracted from Sonar Pro content, using curated list")
+    return parser(response)
+
+def parse_market_intelligence(sonar_responses: dict, parsed: Optional[dict] = None) -> MarketIntelligenceResponse:
+    """Assemble the response from Sonar Pro answers, one section at a time"""
+    # Sections already parsed while their categories streamed in are reused as-is
+    parsed = parsed or {}
+    sections = {
+        section: parsed[section] if section in parsed else parse_section(section, sonar_responses)
+        for section in SECTION_PARSERS
+    }
+    return MarketIntelligenceResponse(**sections, generated_at=datetime.now())
+
+# Section -> its curated snapshot, served as fallback on every error path, so it must stay cheap
+FALLBACK_SNAPSHOT = {
+    "trends": CURATED_TRENDS,
+    "news": CURATED_NEWS,
+    "tools": CURATED_TOOLS,
+    "case_studies": CURATED_CASE_STUDIES,
+    "search_trends": CURATED_SEARCH_TRENDS,
+    "metrics": CURATED_METRICS,
+}
+_fallback_renders: Dict[tuple, tuple] = {}  # Sections -> (second rendered for, body)
+
+def fallback_data(now: Optional[datetime] = None) -> MarketIntelligenceResponse:
+    """Fallback data as models, copied from the snapshot instead of rebuilt"""
+    now = now or datetime.now()
     return MarketIntelligenceResponse(
-        trends=trends_data,
-        news=news_data,
-        tools=tools_data,
-        case_studies=case_studies_data,
-        search_trends=search_trends_data,
-        metrics=metrics_data,
-        generated_at=datetime.now()
+        **{section: snapshot.models(now) for section, snapshot in FALLBACK_SNAPSHOT.items()},
+        generated_at=now
     )
 
-# Fallback data for when Sonar Pro is unavailable
-def generate_fallback_data() -> MarketIntelligenceResponse:
-    """Generate comprehensive professional fallback data with real marketing intelligence"""
-    return MarketIntelligenceResponse(
-        trends=[
-            TrendResponse(
-                title="Zero-Party Data Collection Becomes Critical for Customer Insights",
-                description="Brands are investing heavily in zero-party data strategies as privacy regulations tighten and third-party cookies disappear",
-                base_score=4.6,
-                variance=0.12,
-                category="Data Privacy & Strategy",
-                impact_score=4.8,
-                first_seen=datetime.now() - timedelta(days=2),
-                last_updated=datetime.now(),
-                insight="Companies with comprehensive zero-party data collection see 3.2x higher customer lifetime value and 45% better personalization effectiveness. Leading brands report 60% improvement in campaign targeting accuracy.",
-                sources=["Forrester Research", "Gartner", "McKinsey Global Institute"]
-            ),
-            TrendResponse(
-                title="Generative AI Transforms Content Marketing at Enterprise Scale",
-                description="Large enterprises are deploying generative AI for content creation, resulting in 70% faster content production and consistent brand voice across channels",
-                base_score=4.4,
-                variance=0.12,
-                category="AI Content Technology",
-                impact_score=4.7,
-                first_seen=datetime.now() - timedelta(days=3),
-                last_updated=datetime.now(),
-                insight="Enterprise adoption of generative AI for content marketing delivers 65% reduction in content creation time and 38% improvement in content engagement rates. ROI averages 280% within first year.",
-                sources=["Forrester Research", "Gartner", "McKinsey Global Institute"]
-            )
-        ],
-        news=[
-            NewsArticleResponse(
-                headline="Meta's Threads Surpasses 200M Monthly Active Users as Brands Shift Ad Spend",
-                source="AdAge",
-                summary="Meta reports Threads now hosts over 200 million monthly users, with major brands like Nike and Coca-Cola increasing their social media budget allocations to the platform",
-                business_impact="Early advertising partners report 23% lower cost-per-engagement compared to traditional social platforms",
-                published_date=datetime.now() - timedelta(hours=6),
-                category="Social Media Marketing"
-            ),
-            NewsArticleResponse(
-                headline="OpenAI Partners with WPP to Transform Creative Agency Workflows",
-                source="Campaign",
-                summary="Global advertising giant WPP announces strategic partnership with OpenAI to integrate advanced AI tools across its creative and media planning processes",
-                business_impact="Initial pilot programs show 40% reduction in concept-to-delivery timelines while maintaining creative quality standards",
-                published_date=datetime.now() - timedelta(hours=14),
-                category="AI & Creativity"
-            ),
-            NewsArticleResponse(
-                headline="Apple's Vision Pro Drives 300% Surge in Spatial Commerce Investment",
-                source="Retail Dive",
-                summary="Following Apple Vision Pro launch, retail brands report significant increases in spatial commerce and 3D shopping experience development budgets",
-                business_impact="Early adopters see 67% higher engagement rates and 28% increase in average order values for spatial commerce experiences",
-                published_date=datetime.now() - timedelta(hours=22),
-                category="Emerging Technology"
-            ),
-            NewsArticleResponse(
-                headline="TikTok Shop Expands to European Markets Amid Regulatory Scrutiny",
-                source="Marketing Week",
-                summary="ByteDance launches TikTok's e-commerce platform across UK, Germany, and France despite ongoing regulatory challenges and data privacy concerns",
-                business_impact="Beta merchants report conversion rates 45% higher than traditional social commerce platforms",
-                published_date=datetime.now() - timedelta(hours=30),
-                category="Social Commerce"
-            )
-        ],
-        tools=[
-            ToolResponse(
-                name="ChatGPT Enterprise",
-                company="OpenAI",
-                description="Enterprise-grade AI assistant for marketing teams with advanced content generation and strategy capabilities",
-                category="AI Content Creation",
-                key_features=["Brand-compliant content generation", "Campaign ideation", "A/B testing copy", "Multilingual support"],
-                target_audience="Enterprise marketing teams and agencies",
-                pricing_info="Contact for enterprise pricing",
-                launch_date=datetime.now() - timedelta(days=30),
-                website_url="https://openai.com"
-            ),
-            ToolResponse(
-                name="Klaviyo AI",
-                company="Klaviyo",
-                description="AI-powered email and SMS marketing platform with predictive analytics and automated optimization",
-                category="Email Marketing Automation",
-                key_features=["Predictive analytics", "Smart segmentation", "A/B testing", "Cross-channel orchestration"],
-                target_audience="E-commerce and retail marketers",
-                pricing_info="From $45/month",
-                launch_date=datetime.now() - timedelta(days=30),
-                website_url="https://klaviyo.com"
-            ),
-            ToolResponse(
-                name="Jasper AI",
-                company="Jasper",
-                description="AI content creation platform specialized for marketing campaigns and brand-consistent messaging",
-                category="AI Content Creation",
-                key_features=["Brand voice training", "Campaign templates", "Content optimization", "Team collaboration"],
-                target_audience="Content marketing teams and agencies",
-                pricing_info="From $49/month per user",
-                launch_date=datetime.now() - timedelta(days=30),
-                website_url="https://jasper.ai"
-            ),
-            ToolResponse(
-                name="Adobe Real-Time CDP",
-                company="Adobe",
-                description="Customer data platform with AI-driven insights and real-time personalization capabilities",
-                category="Customer Data Platform",
-                key_features=["Real-time data unification", "AI-powered insights", "Cross-channel activation", "Privacy compliance"],
-                target_audience="Enterprise marketing and data teams",
-                pricing_info="Contact for enterprise pricing",
-                launch_date=datetime.now() - timedelta(days=30),
-                website_url="https://adobe.com"
-            ),
-            ToolResponse(
-                name="HubSpot Marketing AI",
-                company="HubSpot",
-                description="Integrated AI marketing suite with content creation, lead scoring, and campaign optimization",
-                category="Marketing Automation",
-                key_features=["AI content assistant", "Smart lead scoring", "Automated workflows", "Performance optimization"],
-                target_audience="SMB and enterprise marketing teams",
-                pricing_info="From $800/month",
-                launch_date=datetime.now() - timedelta(days=30),
-                website_url="https://hubspot.com"
-            ),
-            ToolResponse(
-                name="Persado AI",
-                company="Persado",
-                description="AI-powered message optimization platform that uses emotional intelligence to improve campaign performance",
-                category="Message Optimization",
-                key_features=["Emotional AI analysis", "Dynamic message testing", "Performance prediction", "Multichannel optimization"],
-                target_audience="Performance marketing teams",
-                pricing_info="Enterprise only - contact for pricing",
-                launch_date=datetime.now() - timedelta(days=30),
-                website_url="https://persado.com"
-            )
-        ],
-        case_studies=[
-            CaseStudyResponse(
-                title="Spotify Increases User Engagement 35% with AI-Driven Playlist Personalization",
-                company="Spotify",
-                industry="Music Streaming",
-                challenge="Users struggling to discover new music leading to decreased session time and engagement",
-                solution="Deployed machine learning algorithms analyzing listening patterns, user context, and mood to create hyper-personalized playlists",
-                results="35% increase in average session duration, 28% improvement in user retention, 42% growth in playlist completion rates",
-                metrics=["35% longer sessions", "28% better retention", "42% playlist completion", "15% premium conversion lift"],
-                source="MIT Technology Review"
-            ),
-            CaseStudyResponse(
-                title="Coca-Cola Achieves 25% ROI Improvement Through AI Campaign Optimization",
-                company="The Coca-Cola Company",
-                industry="Consumer Beverages",
-                challenge="Managing marketing spend efficiency across 200+ markets with varying consumer preferences and competitive landscapes",
-                solution="Implemented AI-powered media mix modeling and real-time campaign optimization using machine learning algorithms",
-                results="25% improvement in marketing ROI, 18% reduction in cost per acquisition, 32% increase in brand awareness",
-                metrics=["25% ROI improvement", "18% lower CAC", "32% brand awareness lift", "$2.3M annual savings"],
-                source="McKinsey Global Institute"
-            ),
-            CaseStudyResponse(
-                title="Sephora Drives 40% Increase in Online Conversions with AI-Powered Personalization",
-                company="Sephora",
-                industry="Beauty Retail",
-                challenge="Personalizing product recommendations across diverse customer base with varying beauty preferences and skin types",
-                solution="Developed AI recommendation engine using computer vision, purchase history, and beauty profile data for personalized product matching",
-                results="40% increase in online conversion rates, 55% improvement in customer satisfaction scores, 30% higher average order value",
-                metrics=["40% conversion increase", "55% satisfaction improvement", "30% higher AOV", "22% repeat purchase rate"],
-                source="Harvard Business Review"
-            )
-        ],
-        search_trends=[
-            SearchTrendResponse(
-                term="AI marketing automation",
-                growth=247.3,
-                date=datetime.now().strftime("%Y-%m-%d"),
-                industry="MarTech",
-                region=["North America", "Europe", "Asia-Pacific"],
-                sources=["Google Trends", "SEMrush", "Ahrefs"]
-            ),
-            SearchTrendResponse(
-                term="zero party data collection",
-                growth=189.5,
-                date=(datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d"),
-                industry="Data & Privacy",
-                region=["Global"],
-                sources=["Google Trends", "BrightEdge"]
-            ),
-            SearchTrendResponse(
-                term="real-time personalization",
-                growth=156.2,
-                date=(datetime.now() - timedelta(days=2)).strftime("%Y-%m-%d"),
-                industry="E-commerce",
-                region=["North America", "Europe"],
-                sources=["SEMrush", "Moz"]
-            )
-        ],
-        metrics=[
-            MetricResponse(
-                name="AI-Enhanced Email Open Rate",
-                value=28.4,
-                change=12.7,
-                trend_data=[22, 24, 26, 27, 28, 29, 28],
-                sources=["Mailchimp Industry Report", "Campaign Monitor", "Litmus"]
-            ),
-            MetricResponse(
-                name="Personalized Content Engagement Rate",
-                value=67.8,
-                change=23.5,
-                trend_data=[52, 58, 62, 65, 67, 68, 68],
-                sources=["Adobe Analytics", "Dynamic Yield", "Optimizely"]
-            ),
-            MetricResponse(
-                name="AI Campaign ROI Improvement",
-                value=32.1,
-                change=18.9,
-                trend_data=[15, 18, 22, 26, 30, 32, 32],
-                sources=["Salesforce Research", "HubSpot", "Marketo"]
-            )
-        ],
-        generated_at=datetime.now()
+def render_fallback(sections: Optional[List[str]] = None) -> bytes:
+    """Fallback payload bytes (or the requested sections), rendered at most once a second"""
+    now = datetime.now().replace(microsecond=0)
+    key = tuple(sections or SECTION_PARSERS)
+    rendered = _fallback_renders.get(key)
+    if rendered is None or rendered[0] != now:
+        fragments = b",".join(orjson.dumps(section) + b":" + FALLBACK_SNAPSHOT[section].render(now) for section in key)
+        rendered = _fallback_renders[key] = (now, b"{" + fragments + b',"generated_at":' + orjson.dumps(now) + b"}")
+    return rendered[1]
+
+# Near-duplicate detection: the same story from several outlets, or the same tool
+# across refreshes, is merged into one item. Items are compared by MinHash
+# signatures over their terms; LSH bands index signatures in Redis sets so a
+# lookup only reads the buckets an item falls into, not the whole history.
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16  # 4 rows per band: pairs above ~0.5 similarity become candidates
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_random = random.Random(17)  # Fixed seed: every worker must derive the same permutations
+_MINHASH_PARAMS = [
+    (_minhash_random.randrange(1, _MINHASH_PRIME), _minhash_random.randrange(0, _MINHASH_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+_SIGNATURE = struct.Struct(f"<{MINHASH_PERMUTATIONS}I")
+# Text compared per section: news by headline and summary, tools by name, company and description
+DEDUP_FIELDS = {"news": ("headline", "summary"), "tools": ("name", "company", "description")}
+
+def minhash_signature(text: str) -> tuple:
+    """MinHash of the text's term set, truncated to 32-bit values"""
+    hashes = {
+        int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little")
+        for term in search_terms(text)
+    } or {0}
+    return tuple(
+        min((a * value + b) % _MINHASH_PRIME for value in hashes) & 0xFFFFFFFF
+        for a, b in _MINHASH_PARAMS
     )
 
-@app.get("/api/market-intelligence", response_model=MarketIntelligenceResponse)
-async def get_market_intelligence():
-    """Get real-time market intelligence using Perplexity Sonar Pro"""
+def signature_similarity(left: tuple, right: tuple) -> float:
+    """Estimated Jaccard similarity: the fraction of matching MinHash values"""
+    return sum(1 for x, y in zip(left, right) if x == y) / MINHASH_PERMUTATIONS
+
+def lsh_bands(signature: tuple) -> List[str]:
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    return [
+        f"{band}:{hashlib.blake2b(_SIGNATURE.pack(*signature)[band * rows * 4:(band + 1) * rows * 4], digest_size=8).hexdigest()}"
+        for band in range(LSH_BANDS)
+    ]
+
+def _item_sources(kind: str, item) -> List[str]:
+    if kind == "news":
+        return list(item.sources or [item.source])
+    return list(item.sources or [])
+
+def _merge_sources(*source_lists: List[str]) -> List[str]:
+    merged = []
+    for sources in source_lists:
+        for source in sources:
+            if source and source not in merged:
+                merged.append(source)
+    return merged
+
+async def dedupe_section(kind: str, items: list, now: Optional[float] = None) -> list:
+    """Merge near-duplicate items within the snapshot and against items seen before"""
+    if not items:
+        return items
+    now = now or time.time()
+    prefix = f"{DEDUP_KEY_PREFIX}:{kind}"
+    fields = DEDUP_FIELDS[kind]
+    
+    # Within the snapshot: keep the first (highest ranked) item of each cluster
+    kept = []  # (item, signature, bands)
+    local_buckets: Dict[str, List[int]] = {}
+    for item in items:
+        signature = minhash_signature(" ".join(getattr(item, name) for name in fields))
+        bands = lsh_bands(signature)
+        candidates = {position for band in bands for position in local_buckets.get(band, [])}
+        duplicate = next((position for position in sorted(candidates)
+                          if signature_similarity(signature, kept[position][1]) >= DEDUP_THRESHOLD), None)
+        if duplicate is not None:
+            original = kept[duplicate][0]
+            original.sources = _merge_sources(_item_sources(kind, original), _item_sources(kind, item))
+            if kind == "news" and not original.url:
+                original.url = item.url
+            continue
+        item.sources = _item_sources(kind, item)
+        for band in bands:
+            local_buckets.setdefault(band, []).append(len(kept))
+        kept.append((item, signature, bands))
+    
+    # Against history: only the LSH buckets these items fall into are read
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for _, _, bands in kept:
+            for band in bands:
+                pipe.smembers(f"{prefix}:band:{band}")
+        bucket_members = await pipe.execute()
+    candidate_ids = []
+    for position in range(len(kept)):
+        members = set().union(*bucket_members[position * LSH_BANDS:(position + 1) * LSH_BANDS])
+        candidate_ids.append(sorted(member.decode() for member in members))
+    unique_ids = sorted({item_id for ids in candidate_ids for item_id in ids})
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for item_id in unique_ids:
+            pipe.hmget(f"{prefix}:item:{item_id}", ["signature", "sources"])
+        records = dict(zip(unique_ids, await pipe.execute()))
+    
+    merged = []
+    claimed: Dict[str, tuple] = {}  # Item ID -> (item, signature, bands)
+    expired = set()
+    for (item, signature, bands), ids in zip(kept, candidate_ids):
+        best_id, best_similarity = None, DEDUP_THRESHOLD
+        for item_id in ids:
+            stored_signature = records[item_id][0]
+            if stored_signature is None:
+                expired.add(item_id)
+                continue
+            similarity = signature_similarity(signature, _SIGNATURE.unpack(stored_signature))
+            if similarity >= best_similarity:
+                best_id, best_similarity = item_id, similarity
+        if best_id is not None:
+            item.sources = _merge_sources(json.loads(records[best_id][1]), item.sources)
+            if best_id in claimed:
+                # Two distinct items in this snapshot matched the same earlier one
+                original = claimed[best_id][0]
+                original.sources = _merge_sources(original.sources, item.sources)
+                continue
+        item_id = best_id or hashlib.blake2b(_SIGNATURE.pack(*signature), digest_size=8).hexdigest()
+        claimed[item_id] = (item, signature, bands)
+        merged.append(item)
+    
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for item_id, (item, signature, bands) in claimed.items():
+            # The newest wording becomes the reference for later comparisons
+            key = f"{prefix}:item:{item_id}"
+            pipe.hset(key, mapping={"signature": _SIGNATURE.pack(*signature), "sources": json.dumps(item.sources), "last_seen": now})
+            pipe.expire(key, DEDUP_RETENTION)
+            for band in bands:
+                pipe.sadd(f"{prefix}:band:{band}", item_id)
+                pipe.expire(f"{prefix}:band:{band}", DEDUP_RETENTION)
+        for position, ids in enumerate(candidate_ids):
+            # Expired items are dropped from the buckets lazily
+            for band in kept[position][2]:
+                for item_id in expired.intersection(ids) - claimed.keys():
+                    pipe.srem(f"{prefix}:band:{band}", item_id)
+        await pipe.execute()
+    if len(merged) < len(items):
+        logging.info(f"Merged {len(items) - len(merged)} near-duplicate {kind} items")
+    return merged
+
+class SonarRefreshError(Exception):
+    """Raised when every Sonar Pro category failed during a refresh"""
+
+async def process_section(section: str, items: list, scope: IntelligenceScope = DEFAULT_SCOPE,
+                          now: Optional[float] = None) -> list:
+    """Merge near-duplicates and apply history to one parsed section, ready to serve"""
+    if section in DEDUP_FIELDS:
+        try:
+            with STAGE_SECONDS.labels(stage="dedupe").time():
+                items = await dedupe_section(section, items, now)
+        except Exception as e:
+            logging.error(f"Near-duplicate detection failed, keeping {section} as parsed: {str(e)}")
     try:
-        # Check cache first
-        cache_key = "sonar_market_intelligence"
-        if redis_client.exists(cache_key):
-            cached = redis_client.get(cache_key)
-            return JSONResponse(content=json.loads(cached))
+        # Scopes share the same curated metrics, so only the default scope records them
+        with STAGE_SECONDS.labels(stage="history").time():
+            await apply_section_history(section, items, now, pending=not scope.id)
+    except Exception as e:
+        logging.error(f"Failed to apply {section} history: {str(e)}")
+    return items
+
+async def build_market_intelligence(on_section: Optional[Callable[[str, list], None]] = None,
+                                    scope: IntelligenceScope = DEFAULT_SCOPE,
+                                    since: Optional[float] = None,
+                                    now: Optional[float] = None) -> Optional[MarketIntelligenceResponse]:
+    """Build a fresh market intelligence snapshot from Sonar Pro
+
+    on_section is called with each section, already deduplicated and with its history,
+    as soon as its category completes. Returns None if no Sonar response is newer than
+    since, the time the current snapshot was written: rebuilding it would only change
+    generated_at and the ETag. History is applied as of now, when the caller records it.
+    """
+    now = now or time.time()
+    if perplexity_client:
+        parsed = {}
+        processed = {}
+        processing = []
         
-        # Query Sonar Pro for each category
-        sonar_responses = {}
+        async def process_arrived(section: str):
+            processed[section] = await process_section(section, parsed[section], scope, now)
+            on_section(section, processed[section])
         
-        if perplexity_client:
-            for category, query in MARKETING_QUERIES.items():
-                response = await query_sonar_pro(query, f"Category: {category}")
-                sonar_responses[category] = response
-                
-            # Parse responses into structured data
-            data = parse_market_intelligence(sonar_responses)
-        else:
-            # Use fallback data if Perplexity is not configured
-            data = generate_fallback_data()
+        def parse_arrived(category: str, response: dict):
+            if response.get("error"):
+                # Nothing to stream: the section is left to the finished snapshot, or the fallback data
+                return
+            for section, (source, _) in SECTION_PARSERS.items():
+                if source == category:
+                    with STAGE_SECONDS.labels(stage="parse_section").time():
+                        parsed[section] = parse_section(section, {category: response})
+                    if on_section:
+                        processing.append(asyncio.create_task(process_arrived(section)))
         
-        # Cache the results
-        redis_client.setex(
-            cache_key,
-            CACHE_TTL,
-            json.dumps(data.dict(), default=str)
-        )
+        if on_section:
+            # Sections no Sonar category feeds (curated and tracked ones) are ready before any call returns
+            queried = scope.queries()
+            for section, (source, _) in SECTION_PARSERS.items():
+                if source not in queried:
+                    parsed[section] = parse_section(section, {})
+                    processing.append(asyncio.create_task(process_arrived(section)))
+        
+        # Query Sonar Pro for all categories concurrently
+        try:
+            with STAGE_SECONDS.labels(stage="sonar_fetch").time():
+                sonar_responses, fetched_at = await fetch_sonar_responses(on_response=parse_arrived, scope=scope)
+            await asyncio.gather(*processing)
+        finally:
+            for task in processing:
+                task.cancel()
+        if all(response.get("error") for response in sonar_responses.values()):
+            # Don't overwrite a good cache entry with an empty snapshot
+            raise SonarRefreshError("All Sonar Pro category queries failed")
+        if since is not None and fetched_at <= since:
+            return None
         
+        # Parse responses into structured data
+        with STAGE_SECONDS.labels(stage="build").time():
+            with STAGE_SECONDS.labels(stage="parse").time():
+                data = parse_market_intelligence(sonar_responses, {**parsed, **processed})
+            for section in SECTION_PARSERS:
+                if section not in processed:
+                    setattr(data, section, await process_section(section, getattr(data, section), scope, now))
         return data
+    
+    # Use fallback data if Perplexity is not configured
+    data = fallback_data()
+    for section in SECTION_PARSERS:
+        try:
+            with STAGE_SECONDS.labels(stage="history").time():
+                await apply_section_history(section, getattr(data, section), now, pending=not scope.id)
+        except Exception as e:
+            logging.error(f"Failed to apply {section} history: {str(e)}")
+    return data
+
+def payload_response(body: bytes, headers: dict) -> Response:
+    """Return pre-rendered JSON bytes as-is, without parsing or model validation"""
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def payload_etag(body: bytes) -> str:
+    """Content hash of a rendered body, computed once at cache-write time"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+# Content-Encodings stored with each cache entry, in server preference order
+PAYLOAD_ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+def compress_payload(body: bytes) -> Dict[str, bytes]:
+    """Compress a rendered body once at write time, at maximum ratio"""
+    variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli:
+        variants["br"] = brotli.compress(body, quality=11)
+    return variants
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> str:
+    """Pick the preferred stored encoding the client accepts (q > 0)"""
+    if not accept_encoding:
+        return "identity"
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in PAYLOAD_ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+def _variant_field(encoding: str) -> str:
+    return f"body:{encoding}"
+
+@dataclass
+class CacheEntry:
+    """Serialized market intelligence payload plus its write time and ETag"""
+    written_at: float
+    etag: str
+    variants: Dict[str, bytes]  # Content-Encoding -> body bytes
+
+    @classmethod
+    def from_body(cls, body: bytes, written_at: Optional[float] = None) -> "CacheEntry":
+        return cls(
+            written_at=written_at if written_at is not None else time.time(),
+            etag=payload_etag(body),
+            variants=compress_payload(body)
+        )
+
+    def variant(self, encoding: str) -> tuple:
+        """Return (encoding, bytes), falling back to identity if that variant isn't loaded"""
+        if encoding in self.variants:
+            return encoding, self.variants[encoding]
+        return "identity", self.variants["identity"]
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.written_at)
+
+    @property
+    def is_stale(self) -> bool:
+        return self.age > CACHE_TTL
+
+class LastKnownGood:
+    """The newest full payload this worker has seen, served from memory while Redis is down"""
+    
+    def __init__(self):
+        self.entry: Optional[CacheEntry] = None
+        self._views: Dict[tuple, CacheEntry] = {}  # Section projections rendered from the entry
+    
+    def update(self, entry: CacheEntry):
+        if "identity" not in entry.variants:
+            return
+        current = self.entry
+        if current is not None and current.etag == entry.etag:
+            # Same snapshot, possibly renewed without a rewrite
+            current.written_at = max(current.written_at, entry.written_at)
+            for encoding, body in entry.variants.items():
+                current.variants.setdefault(encoding, body)
+            return
+        if current is not None and entry.written_at < current.written_at:
+            return
+        self.entry = CacheEntry(written_at=entry.written_at, etag=entry.etag, variants=dict(entry.variants))
+        self._views = {}
+    
+    def view(self, sections: Optional[List[str]] = None) -> Optional[CacheEntry]:
+        """The snapshot, or the requested sections of it, rendered once per snapshot"""
+        if self.entry is None or sections is None:
+            return self.entry
+        key = tuple(sections)
+        if key not in self._views:
+            payload = orjson.loads(self.entry.variants["identity"])
+            body = orjson.dumps({**{section: payload[section] for section in sections}, "generated_at": payload["generated_at"]})
+            self._views[key] = CacheEntry.from_body(body, self.entry.written_at)
+        return self._views[key]
+
+last_known_good = LastKnownGood()
+
+class ResponseCache:
+    """In-process LRU of cache entries in front of Redis, bounded by entry count and bytes"""
+    
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()  # (scope, sections, encoding) -> (expires_at, size, entry)
+        self.size = 0
+        self.generation = 0  # Bumped on every invalidation
+        self.lookups = Counter()  # (tier, result) -> count
+    
+    def get(self, key: tuple) -> Optional[CacheEntry]:
+        cached = self.entries.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self.entries.move_to_end(key)
+            self.count("l1", "hit")
+            return cached[2]
+        if cached is not None:
+            self._evict(key)
+        self.count("l1", "miss")
+        return None
+    
+    def put(self, key: tuple, entry: CacheEntry, generation: int):
+        """Store an entry read from Redis, unless the cache was invalidated while it was read"""
+        size = sum(len(body) for body in entry.variants.values())
+        if generation != self.generation or size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._evict(key)
+        # Never outlive the hard TTL Redis would have evicted the entry at
+        ttl = min(self.ttl, CACHE_HARD_TTL - entry.age)
+        if ttl <= 0:
+            return
+        self.entries[key] = (time.monotonic() + ttl, size, entry)
+        self.size += size
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self._evict(next(iter(self.entries)))
+    
+    def _evict(self, key: tuple):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+    
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.generation += 1
+    
+    def count(self, tier: str, result: str):
+        self.lookups[tier, result] += 1
+        CACHE_LOOKUPS.labels(tier=tier, result=result).inc()
+    
+    def snapshot(self) -> dict:
+        tiers = {}
+        for tier in ("l1", "l2"):
+            hits, misses = self.lookups[tier, "hit"], self.lookups[tier, "miss"]
+            tiers[tier] = {"hits": hits, "misses": misses,
+                           "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None}
+        tiers["l1"].update(entries=len(self.entries), bytes=self.size)
+        return tiers
+
+l1_cache = ResponseCache(L1_CACHE_MAX_ENTRIES, L1_CACHE_MAX_BYTES, L1_CACHE_TTL)
+
+def section_key(section: str, scope: IntelligenceScope = DEFAULT_SCOPE) -> str:
+    return f"{scope.cache_key}:section:{section}"
+
+def render_section_entries(payload: dict, written_at: float,
+                           scope: IntelligenceScope = DEFAULT_SCOPE) -> Dict[str, CacheEntry]:
+    """Pre-render one cache entry per section"""
+    return {
+        section_key(section, scope): CacheEntry.from_body(
+            orjson.dumps({section: payload[section], "generated_at": payload["generated_at"]}), written_at
+        )
+        for section in SECTION_PARSERS
+    }
+
+def render_cache_entries(data: MarketIntelligenceResponse,
+                         scope: IntelligenceScope = DEFAULT_SCOPE) -> Dict[str, CacheEntry]:
+    """Serialize and compress the full payload and each of its sections"""
+    payload = data.model_dump()
+    entry = CacheEntry.from_body(orjson.dumps(payload))
+    return {scope.cache_key: entry, **render_section_entries(payload, entry.written_at, scope)}
+
+async def read_cache_entry(encoding: str = "identity", key: str = CACHE_KEY) -> Optional[CacheEntry]:
+    """Read a cached payload in one round trip, fetching only the requested encoding
+
+    Only compressed variants are stored; identity is decompressed from gzip.
+    """
+    stored = "gzip" if encoding == "identity" else encoding
+    try:
+        written_at, etag, body = await redis_client.hmget(
+            key, ["written_at", "etag", _variant_field(stored)]
+        )
+        if written_at is not None and body is None and stored != "gzip":
+            # Variant not stored (e.g. written without brotli installed)
+            encoding, stored = "identity", "gzip"
+            body = await redis_client.hget(key, _variant_field(stored))
+    except ResponseError as e:
+        # Pre-hash string entry left by an older deploy; treat it as a miss
+        logging.warning(f"Unreadable market intelligence cache entry: {str(e)}")
+        return None
+    if written_at is None or body is None:
+        return None
+    variants = {encoding: body}
+    if encoding == "identity":
+        variants = {"identity": gzip.decompress(body), "gzip": body}
+    entry = CacheEntry(
+        written_at=float(written_at),
+        etag=etag.decode() if etag else payload_etag(variants["identity"] if encoding == "identity" else body),
+        variants=variants
+    )
+    if key == CACHE_KEY:
+        last_known_good.update(entry)
+    return entry
+
+_GENERATED_AT_FIELD = b',"generated_at":'
+
+def assemble_projection(section_bodies: List[bytes], encoding: str) -> Dict[str, bytes]:
+    """Splice gzipped single-section bodies into one document and compress it for the client
+
+    Runs off the event loop. Projections are built on demand and kept only in the
+    L1 cache, so they get a cheaper compression level than the stored entries.
+    """
+    fragments, tail = [], b"}"
+    for section_body in map(gzip.decompress, section_bodies):
+        # Section bodies are {"<section>":[...],"generated_at":"..."}; keep the section member
+        split = section_body.rindex(_GENERATED_AT_FIELD)
+        fragments.append(section_body[1:split])
+        tail = section_body[split:]
+    body = b"{" + b",".join(fragments) + tail
+    if encoding == "gzip":
+        return {"gzip": gzip.compress(body, compresslevel=6, mtime=0)}
+    if encoding == "br":
+        return {"br": brotli.compress(body, quality=5)}
+    return {"identity": body}
+
+async def read_projection(sections: List[str], encoding: str = "identity",
+                          scope: IntelligenceScope = DEFAULT_SCOPE) -> Optional[CacheEntry]:
+    """Assemble a multi-section body from the stored per-section entries in one atomic round trip"""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for section in sections:
+            pipe.hmget(section_key(section, scope), ["written_at", "etag", _variant_field("gzip")])
+        rows = await pipe.execute()
+    if any(None in row for row in rows):
+        return None
+    variants = await asyncio.to_thread(assemble_projection, [row[2] for row in rows], encoding)
+    return CacheEntry(
+        written_at=min(float(row[0]) for row in rows),
+        # Derived from the section ETags, so a projection changes only when one of its sections does
+        etag=payload_etag(b"|".join(row[1] for row in rows)),
+        variants=variants
+    )
+
+def _entry_mapping(entry: CacheEntry) -> dict:
+    # Identity is left out: it is the largest variant and is cheap to decompress from gzip
+    mapping = {"written_at": entry.written_at, "etag": entry.etag}
+    for encoding, body in entry.variants.items():
+        if encoding != "identity":
+            mapping[_variant_field(encoding)] = body
+    return mapping
+
+async def write_cache_entries(entries: Dict[str, CacheEntry], scope: IntelligenceScope = DEFAULT_SCOPE) -> bool:
+    """Atomically replace cached payloads; Redis evicts them once the hard TTL passes
+
+    Returns False, writing nothing, if the scope was evicted in the meantime.
+    """
+    if scope.id:
+        return await write_scope_keys(
+            scope, [(key, _entry_mapping(entry), CACHE_HARD_TTL) for key, entry in entries.items()]
+        )
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for key, entry in entries.items():
+            mapping = _entry_mapping(entry)
+            pipe.delete(key)
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, CACHE_HARD_TTL)
+        await pipe.execute()
+    return True
+
+# Mark a snapshot fresh again without rewriting it, so its ETag and generated_at
+# stay put; only while every key still exists and a scope is still registered
+_TOUCH_ENTRIES_SCRIPT = """
+if ARGV[1] ~= '' and not redis.call('zscore', KEYS[1], ARGV[1]) then
+    return 0
+end
+for k = 2, #KEYS do
+    if redis.call('exists', KEYS[k]) == 0 then
+        return 0
+    end
+end
+for k = 2, #KEYS do
+    redis.call('hset', KEYS[k], 'written_at', ARGV[2])
+    redis.call('expire', KEYS[k], ARGV[3])
+end
+return 1
+"""
+
+async def touch_cache_entries(scope: IntelligenceScope = DEFAULT_SCOPE) -> Optional[CacheEntry]:
+    """Renew a scope's cached snapshot as of now, or None if it is gone and needs a rebuild"""
+    keys = [scope.cache_key] + [section_key(section, scope) for section in SECTION_PARSERS]
+    if not await redis_client.eval(
+        _TOUCH_ENTRIES_SCRIPT, len(keys) + 1, SCOPE_REGISTRY_KEY, *keys, scope.id, time.time(), CACHE_HARD_TTL
+    ):
+        return None
+    return await read_cache_entry(key=scope.cache_key)
+
+# Scope registry: scopes with cached data live in one sorted set, and scopes that
+# were requested but not admitted in a bounded candidate set. Both rank by request
+# count, weighted per tenant and decaying by half every SCOPE_HALF_LIFE. Scores are
+# log2(count) + now / half-life, so scopes last touched at different times compare
+# directly: the lowest score is the least used one. Requests admit a scope only
+# while the registry has room; past that, the background refresher promotes the
+# best candidate once it has twice the requests of the least used scope (a score
+# 1 higher), evicting that one, so equally requested scopes don't churn.
+_TOUCH_SCOPES_SCRIPT = """
+local now = tonumber(ARGV[1])
+for i = 4, #ARGV, 3 do
+    local id = ARGV[i]
+    local set = KEYS[1]
+    local score = tonumber(redis.call('zscore', KEYS[1], id))
+    if not score then
+        set = KEYS[2]
+        score = tonumber(redis.call('zscore', KEYS[2], id))
+    end
+    local count = tonumber(ARGV[i + 1])
+    if score then
+        count = count + 2 ^ (score - now)
+    end
+    if set == KEYS[2] and redis.call('zcard', KEYS[1]) < tonumber(ARGV[2]) then
+        redis.call('zrem', KEYS[2], id)
+        set = KEYS[1]
+    end
+    redis.call('zadd', set, math.log(count) / math.log(2) + now, id)
+    redis.call('hset', KEYS[3], id, ARGV[i + 2])
+end
+local excess = redis.call('zcard', KEYS[2]) - tonumber(ARGV[3])
+if excess > 0 then
+    for _, id in ipairs(redis.call('zrange', KEYS[2], 0, excess - 1)) do
+        redis.call('hdel', KEYS[3], id)
+    end
+    redis.call('zremrangebyrank', KEYS[2], 0, excess - 1)
+end
+return 0
+"""
+
+_PROMOTE_SCOPES_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local promoted, evicted = {}, {}
+local function evict(count)
+    for _, id in ipairs(redis.call('zrange', KEYS[1], 0, count - 1)) do
+        redis.call('zrem', KEYS[1], id)
+        redis.call('hdel', KEYS[3], id)
+        table.insert(evicted, id)
+    end
+end
+local excess = redis.call('zcard', KEYS[1]) - limit
+if excess > 0 then
+    evict(excess)
+end
+for _ = 1, tonumber(ARGV[2]) do
+    local best = redis.call('zrevrange', KEYS[2], 0, 0, 'WITHSCORES')
+    if #best == 0 or limit <= 0 then
+        break
+    end
+    if redis.call('zcard', KEYS[1]) >= limit then
+        local worst = redis.call('zrange', KEYS[1], 0, 0, 'WITHSCORES')
+        if tonumber(best[2]) < tonumber(worst[2]) + 1 then
+            break
+        end
+        evict(1)
+    end
+    redis.call('zrem', KEYS[2], best[1])
+    redis.call('zadd', KEYS[1], best[2], best[1])
+    table.insert(promoted, best[1])
+end
+return {promoted, evicted}
+"""
+
+def scope_keys(scope_id: str) -> List[str]:
+    """Every Redis key holding one scope's cached data"""
+    cache_key = scope_cache_key(scope_id)
+    return [cache_key, *(f"{cache_key}:section:{section}" for section in SECTION_PARSERS),
+            *(_category_key(category, scope_id) for category in MARKETING_QUERIES)]
+
+def request_tenant(request: Request) -> Optional[str]:
+    """The tenant whose API key the request carries; None for unauthenticated requests"""
+    key = request.headers.get(SCOPE_TENANT_HEADER)
+    if not key:
+        return None
+    for tenant, tenant_key in SCOPE_TENANT_KEYS.items():
+        if hmac.compare_digest(key.encode(), tenant_key.encode()):
+            return tenant
+    return None
+
+class ScopeTracker:
+    """Counts requests per scope in memory and flushes them into the Redis registry"""
+
+    def __init__(self):
+        self.pending = Counter()  # Scope -> weighted requests since the last flush
+        self.evicted = 0
+
+    def touch(self, scope: IntelligenceScope, tenant: Optional[str] = None):
+        # Only authenticated tenants get their configured weight
+        weight = SCOPE_TENANT_WEIGHTS.get(tenant, 1.0) if tenant else 1.0
+        if scope.id and weight > 0:
+            self.pending[scope] += weight
+
+    async def flush(self):
+        """Record pending counts; scopes are admitted while the registry has room"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, Counter()
+        args = []
+        for scope, count in pending.items():
+            args += [scope.id, count, orjson.dumps(scope.params())]
+        try:
+            await redis_client.eval(_TOUCH_SCOPES_SCRIPT, 3, SCOPE_REGISTRY_KEY, SCOPE_CANDIDATES_KEY, SCOPE_PARAMS_KEY,
+                                    time.time() / SCOPE_HALF_LIFE, SCOPE_MAX_ACTIVE, SCOPE_MAX_CANDIDATES, *args)
+        except Exception:
+            self.pending.update(pending)  # Counted again on the next flush
+            raise
+
+    async def admitted(self, scope: IntelligenceScope) -> bool:
+        """Whether the scope may be refreshed on demand, admitting it if there is room"""
+        await self.flush()
+        return await redis_client.zscore(SCOPE_REGISTRY_KEY, scope.id) is not None
+
+    async def promote(self, limit: int) -> List[IntelligenceScope]:
+        """Admit up to `limit` candidates that outrank the least used scopes, dropping those scopes' data"""
+        await self.flush()
+        promoted, evicted = await redis_client.eval(_PROMOTE_SCOPES_SCRIPT, 3, SCOPE_REGISTRY_KEY, SCOPE_CANDIDATES_KEY,
+                                                    SCOPE_PARAMS_KEY, SCOPE_MAX_ACTIVE, limit)
+        if evicted:
+            await redis_client.delete(*(key for scope_id in evicted for key in scope_keys(scope_id.decode())))
+            self.evicted += len(evicted)
+            SCOPE_EVICTIONS.inc(len(evicted))
+            logging.info(f"Evicted {len(evicted)} least used market intelligence scopes")
+        return await scopes_by_id(promoted)
+
+    def snapshot(self) -> dict:
+        return {"pending": len(self.pending), "evicted": self.evicted, "max_active": SCOPE_MAX_ACTIVE}
+
+scope_tracker = ScopeTracker()
+
+async def scopes_by_id(scope_ids: list) -> List[IntelligenceScope]:
+    if not scope_ids:
+        return []
+    params = await redis_client.hmget(SCOPE_PARAMS_KEY, scope_ids)
+    return [IntelligenceScope.from_params(orjson.loads(value)) for value in params if value is not None]
+
+async def top_scopes(limit: int) -> List[IntelligenceScope]:
+    """The most requested scopes, highest first"""
+    if limit <= 0:
+        return []
+    return await scopes_by_id(await redis_client.zrevrange(SCOPE_REGISTRY_KEY, 0, limit - 1))
+
+async def run_scope_tracker():
+    """Flush scope request counts every SCOPE_TRACK_INTERVAL"""
+    while True:
+        await asyncio.sleep(SCOPE_TRACK_INTERVAL)
+        try:
+            await scope_tracker.flush()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Failed to flush scope request counts: {str(e)}")
+
+# Time-series history: each series keeps raw samples plus hourly and daily rollups
+# in Redis sorted sets scored by timestamp. Members are packed little-endian doubles:
+# (ts, value) for raw samples, (bucket, count, sum, sum of squares, min, max) for rollups.
+# Rollups are updated in place as samples arrive, so windows are read in O(points).
+_RAW_SAMPLE = struct.Struct("<2d")
+_ROLLUP_BUCKET = struct.Struct("<6d")
+_RESOLUTION = re.compile(r"^(\d+)([mhd])$")
+_RESOLUTION_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+def _series_slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+def _series_key(series: str, tier: str) -> str:
+    return f"{TIMESERIES_KEY_PREFIX}:{series}:{tier}"
+
+def section_history_samples(section: str, items: list) -> Dict[str, float]:
+    """Series name -> value recorded for one section's items; only metrics and trends have history"""
+    if section == "metrics":
+        return {f"metric:{_series_slug(metric.name)}": metric.value for metric in items}
+    if section == "trends":
+        return {f"trend:{_series_slug(trend.title)}": trend.impact_score for trend in items}
+    return {}
+
+def history_samples(data: MarketIntelligenceResponse) -> Dict[str, float]:
+    """Series name -> value recorded for this snapshot"""
+    samples = section_history_samples("metrics", data.metrics)
+    samples.update(section_history_samples("trends", data.trends))
+    return samples
+
+def parse_resolution(resolution: str) -> Optional[int]:
+    """Step in seconds for 'raw', '15m', '1h', '6h', '1d' and the like; None if invalid"""
+    if resolution == "raw":
+        return 0
+    match = _RESOLUTION.match(resolution)
+    if not match or int(match.group(1)) == 0:
+        return None
+    return int(match.group(1)) * _RESOLUTION_UNITS[match.group(2)]
+
+def _source_tier(step: int) -> str:
+    """Coarsest stored tier whose buckets divide the requested step evenly"""
+    for tier in ("1d", "1h"):
+        if step and step % TIMESERIES_ROLLUPS[tier] == 0:
+            return tier
+    return "raw"
+
+def _merge_bucket(bucket: Optional[tuple], start: float, value: float) -> tuple:
+    if bucket is None:
+        return (start, 1, value, value * value, value, value)
+    _, count, total, squares, low, high = bucket
+    return (start, count + 1, total + value, squares + value * value, min(low, value), max(high, value))
+
+async def record_history(samples: Dict[str, float], now: Optional[float] = None):
+    """Append one sample per series and fold it into the hourly and daily rollups"""
+    if not samples:
+        return
+    now = now or time.time()
+    series_names = list(samples)
+    # Only one refresher writes at a time (it holds the refresh lock), so the
+    # current buckets can be read and rewritten without a script
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for series in series_names:
+            for tier, width in TIMESERIES_ROLLUPS.items():
+                bucket = now - now % width
+                pipe.zrangebyscore(_series_key(series, tier), bucket, bucket)
+        current = await pipe.execute()
+    
+    async with redis_client.pipeline(transaction=True) as pipe:
+        position = 0
+        for series in series_names:
+            value = float(samples[series])
+            raw_key = _series_key(series, "raw")
+            pipe.zadd(raw_key, {_RAW_SAMPLE.pack(now, value): now})
+            pipe.zremrangebyscore(raw_key, "-inf", f"({now - TIMESERIES_RETENTION['raw']}")
+            pipe.expire(raw_key, TIMESERIES_RETENTION["raw"])
+            for tier, width in TIMESERIES_ROLLUPS.items():
+                bucket = now - now % width
+                existing = current[position]
+                position += 1
+                merged = _merge_bucket(_ROLLUP_BUCKET.unpack(existing[0]) if existing else None, bucket, value)
+                key = _series_key(series, tier)
+                pipe.zremrangebyscore(key, bucket, bucket)
+                pipe.zadd(key, {_ROLLUP_BUCKET.pack(*merged): bucket})
+                pipe.zremrangebyscore(key, "-inf", f"({now - TIMESERIES_RETENTION[tier]}")
+                pipe.expire(key, TIMESERIES_RETENTION[tier])
+            pipe.hsetnx(f"{TIMESERIES_KEY_PREFIX}:first_seen", series, now)
+            pipe.zadd(f"{TIMESERIES_KEY_PREFIX}:index", {series: now})
+        await pipe.execute()
+    
+    # Forget series that have had no samples for longer than the longest retention
+    cutoff = now - max(TIMESERIES_RETENTION.values())
+    expired = await redis_client.zrangebyscore(f"{TIMESERIES_KEY_PREFIX}:index", "-inf", f"({cutoff}")
+    if expired:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.zrem(f"{TIMESERIES_KEY_PREFIX}:index", *expired)
+            pipe.hdel(f"{TIMESERIES_KEY_PREFIX}:first_seen", *expired)
+            await pipe.execute()
+
+def _aggregate(members: List[bytes], tier: str, step: int) -> List[tuple]:
+    """Fold stored members into (bucket, count, sum, sum of squares, min, max) per step"""
+    buckets: Dict[float, tuple] = {}
+    for member in members:
+        if tier == "raw":
+            ts, value = _RAW_SAMPLE.unpack(member)
+            point = (ts, 1, value, value * value, value, value)
+        else:
+            point = _ROLLUP_BUCKET.unpack(member)
+        start = point[0] - point[0] % step
+        bucket = buckets.get(start)
+        if bucket is None:
+            buckets[start] = (start,) + point[1:]
+        else:
+            buckets[start] = (start, bucket[1] + point[1], bucket[2] + point[2], bucket[3] + point[3],
+                              min(bucket[4], point[4]), max(bucket[5], point[5]))
+    return [buckets[start] for start in sorted(buckets)]
+
+async def read_history(series_names: List[str], step: int, start: float, end: float) -> Dict[str, list]:
+    """Range of each series at the given step: raw (ts, value) samples when step is 0, else buckets"""
+    tier = _source_tier(step)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for series in series_names:
+            pipe.zrangebyscore(_series_key(series, tier), start, end)
+        results = await pipe.execute()
+    if not step:
+        return {series: [_RAW_SAMPLE.unpack(member) for member in members]
+                for series, members in zip(series_names, results)}
+    return {series: _aggregate(members, tier, step) for series, members in zip(series_names, results)}
+
+async def apply_section_history(section: str, items: list, now: Optional[float] = None, pending: bool = False):
+    """Derive trend_data/change and base_score/variance/first_seen from recorded history
+
+    With pending, the section's samples are about to be recorded at now, and are
+    folded in as if they already were, so the result matches the snapshot written after.
+    """
+    samples = section_history_samples(section, items)
+    if not samples:
+        return
+    now = now or time.time()
+    step = parse_resolution(TIMESERIES_TREND_RESOLUTION) or 86400
+    series_names = list(samples)
+    window = await read_history(series_names, step, now - now % step - (TIMESERIES_TREND_POINTS - 1) * step, now)
+    first_seen = await redis_client.hmget(f"{TIMESERIES_KEY_PREFIX}:first_seen", series_names)
+    first_seen = dict(zip(series_names, first_seen))
+    if pending:
+        bucket = now - now % step
+        for series, value in samples.items():
+            points = window[series]
+            if points and points[-1][0] == bucket:
+                points[-1] = _merge_bucket(points[-1], bucket, float(value))
+            else:
+                points.append(_merge_bucket(None, bucket, float(value)))
+            first_seen[series] = first_seen[series] or now
+    
+    metrics = items if section == "metrics" else []
+    trends = items if section == "trends" else []
+    for metric in metrics:
+        points = window.get(f"metric:{_series_slug(metric.name)}") or []
+        # With fewer than two buckets there is no history yet to replace the parsed values
+        if len(points) >= 2:
+            means = [total / count for _, count, total, _, _, _ in points]
+            metric.trend_data = [round(mean, 2) for mean in means]
+            metric.change = round((means[-1] - means[0]) / abs(means[0]) * 100, 1) if means[0] else 0.0
+    for trend in trends:
+        series = f"trend:{_series_slug(trend.title)}"
+        points = window.get(series) or []
+        count = sum(point[1] for point in points)
+        if count:
+            mean = sum(point[2] for point in points) / count
+            trend.base_score = round(mean, 2)
+            trend.variance = round(max(sum(point[3] for point in points) / count - mean * mean, 0.0), 4)
+        if first_seen.get(series):
+            trend.first_seen = datetime.fromtimestamp(float(first_seen[series]))
+
+# Full-text search: an in-process BM25 inverted index per worker. The refresher
+# folds each snapshot into it and persists it to Redis; other workers reload it
+# when they hear about the update.
+# Indexed text fields and (title field, category field) per section
+SEARCH_FIELDS = {
+    "news": ("headline", "summary", "business_impact", "category", "source"),
+    "tools": ("name", "company", "description", "category", "key_features", "target_audience"),
+    "case_studies": ("title", "company", "industry", "challenge", "solution", "results", "metrics"),
+}
+SEARCH_KEYS = {"news": ("headline", "category"), "tools": ("name", "category"), "case_studies": ("title", "industry")}
+_SEARCH_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the their this to was were will with".split()
+)
+
+def search_terms(text: str) -> List[str]:
+    """Lowercased tokens without stopwords, with plural 's' folded"""
+    terms = []
+    for token in _SEARCH_TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+def _search_text(kind: str, item: dict) -> str:
+    parts = []
+    for name in SEARCH_FIELDS[kind]:
+        value = item.get(name)
+        parts.extend(value if isinstance(value, list) else [value or ""])
+    return " ".join(str(part) for part in parts)
+
+class SearchIndex:
+    """Incremental BM25 inverted index; documents are updated in place as snapshots arrive"""
+    K1 = 1.2
+    B = 0.75
+    
+    def __init__(self):
+        self.docs: Dict[str, dict] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+        self.revision: Optional[int] = None
+    
+    def upsert(self, kind: str, item: dict, seen: float) -> str:
+        """Add an item, or refresh it if an item with the same title was indexed before; returns its ID"""
+        title_field, _ = SEARCH_KEYS[kind]
+        doc_id = f"{kind}:{_series_slug(item[title_field])}"
+        text = _search_text(kind, item)
+        checksum = zlib.crc32(text.encode())
+        doc = self.docs.get(doc_id)
+        if doc is not None and doc["checksum"] == checksum:
+            doc["item"], doc["last_seen"] = item, seen
+            return doc_id
+        if doc is not None:
+            self._remove_postings(doc_id, doc)
+        dated = item.get("published_date") or item.get("launch_date")
+        terms = Counter(search_terms(text))
+        self.docs[doc_id] = {
+            "kind": kind,
+            # The date an item was first reported is kept across re-indexing
+            "date": doc["date"] if doc else (datetime.fromisoformat(dated).timestamp() if dated else seen),
+            "first_seen": doc["first_seen"] if doc else seen,
+            "last_seen": seen,
+            "length": sum(terms.values()),
+            "checksum": checksum,
+            "item": item,
+        }
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        self.total_length += self.docs[doc_id]["length"]
+        return doc_id
+    
+    def _remove_postings(self, doc_id: str, doc: dict):
+        for term in set(search_terms(_search_text(doc["kind"], doc["item"]))):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= doc["length"]
+    
+    def prune(self, cutoff: float) -> List[str]:
+        """Drop items not returned by any refresh since cutoff, returning their IDs"""
+        expired = [doc_id for doc_id, doc in self.docs.items() if doc["last_seen"] < cutoff]
+        for doc_id in expired:
+            self._remove_postings(doc_id, self.docs.pop(doc_id))
+        return expired
+    
+    def search(self, query: str, kinds: Optional[List[str]] = None, category: Optional[str] = None,
+               since: Optional[float] = None, until: Optional[float] = None, limit: int = 20) -> tuple:
+        """Top matches as (total, [(score, doc_id)]), touching only the query terms' postings"""
+        terms = set(search_terms(query))
+        if not terms or not self.docs:
+            return 0, []
+        count = len(self.docs)
+        average_length = self.total_length / count
+        scores: Dict[str, float] = defaultdict(float)
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = 1 - self.B + self.B * self.docs[doc_id]["length"] / average_length
+                scores[doc_id] += idf * frequency * (self.K1 + 1) / (frequency + self.K1 * norm)
+        category = category.lower() if category else None
+        matches = []
+        for doc_id, score in scores.items():
+            doc = self.docs[doc_id]
+            if kinds and doc["kind"] not in kinds:
+                continue
+            if category and str(doc["item"].get(SEARCH_KEYS[doc["kind"]][1], "")).lower() != category:
+                continue
+            if (since is not None and doc["date"] < since) or (until is not None and doc["date"] > until):
+                continue
+            matches.append((score, doc_id))
+        return len(matches), heapq.nlargest(limit, matches)
+    
+    def record(self, doc_id: str) -> bytes:
+        """One document as persisted, with its term frequencies so loading skips tokenizing"""
+        doc = self.docs[doc_id]
+        terms = Counter(search_terms(_search_text(doc["kind"], doc["item"])))
+        return orjson.dumps([doc["kind"], doc["date"], doc["first_seen"], doc["last_seen"], doc["length"],
+                             doc["checksum"], doc["item"], terms])
+    
+    def apply(self, doc_id: str, record: Optional[bytes]):
+        """Replace a document with its persisted record, or drop it if the record is gone"""
+        doc = self.docs.pop(doc_id, None)
+        if doc is not None:
+            self._remove_postings(doc_id, doc)
+        if record is None:
+            return
+        kind, date, first_seen, last_seen, length, checksum, item, terms = orjson.loads(record)
+        self.docs[doc_id] = {"kind": kind, "date": date, "first_seen": first_seen, "last_seen": last_seen,
+                             "length": length, "checksum": checksum, "item": item}
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        self.total_length += length
+    
+    @classmethod
+    def load_blob(cls, blob: bytes) -> "SearchIndex":
+        """Rebuild from the whole-index blob older deploys stored, positions and flat postings"""
+        snapshot = orjson.loads(zlib.decompress(blob))
+        index = cls()
+        ids = []
+        for doc_id, kind, date, first_seen, last_seen, length, checksum, item in snapshot["docs"]:
+            ids.append(doc_id)
+            index.docs[doc_id] = {"kind": kind, "date": date, "first_seen": first_seen, "last_seen": last_seen,
+                                  "length": length, "checksum": checksum, "item": item}
+            index.total_length += length
+        for term, flat in snapshot["postings"].items():
+            index.postings[term] = {ids[flat[i]]: flat[i + 1] for i in range(0, len(flat), 2)}
+        return index
+    
+    @classmethod
+    def load(cls, records: Dict[bytes, bytes], revision: int) -> "SearchIndex":
+        """Rebuild from every persisted record"""
+        index = cls()
+        for doc_id, record in records.items():
+            index.apply(doc_id.decode(), record)
+        index.revision = revision
+        return index
+
+search_index = SearchIndex()
+
+async def _catch_up_search_index(client, index: SearchIndex) -> SearchIndex:
+    """Apply the documents other workers changed since the index's revision
+
+    client is redis_client, or a pipeline watching SEARCH_INDEX_KEY. Returns a new
+    index if this one is too far behind the change log to catch up.
+    """
+    revision, floor, blob = await client.hmget(SEARCH_INDEX_KEY, ["revision", "floor", "blob"])
+    if revision is None:
+        if blob is not None and index.revision is None and not index.docs:
+            # Written by an older deploy; the next update persists it document by document
+            return await asyncio.to_thread(SearchIndex.load_blob, blob)
+        return index
+    if int(revision) == index.revision:
+        return index
+    revision = int(revision)
+    if index.revision is None or index.revision < int(floor or 0):
+        records = await client.hgetall(SEARCH_DOCS_KEY)
+        # Decoding every document shouldn't stall the event loop
+        return await asyncio.to_thread(SearchIndex.load, records, revision)
+    doc_ids = await client.zrangebyscore(SEARCH_CHANGES_KEY, f"({index.revision}", revision)
+    if doc_ids:
+        for doc_id, record in zip(doc_ids, await client.hmget(SEARCH_DOCS_KEY, doc_ids)):
+            index.apply(doc_id.decode(), record)
+    index.revision = revision
+    return index
+
+async def sync_search_index():
+    """Catch up with the documents other workers have written"""
+    global search_index
+    try:
+        search_index = await _catch_up_search_index(redis_client, search_index)
+    except Exception as e:
+        logging.warning(f"Failed to load search index: {str(e)}")
+
+async def update_search_index(data: MarketIntelligenceResponse, now: float):
+    """Fold a fresh snapshot into the index in place and persist only the documents it changed
+
+    Refreshes of different scopes can run at once on different workers, so the write
+    is a compare-and-set on the stored revision: if another worker wrote in between,
+    its changes are applied and this snapshot folded in again.
+    """
+    global search_index
+    items = {kind: [item.model_dump(mode="json") for item in getattr(data, kind)] for kind in SEARCH_FIELDS}
+    removed = set()
+    for _ in range(SEARCH_WRITE_RETRIES):
+        async with redis_client.pipeline(transaction=True) as pipe:
+            await pipe.watch(SEARCH_INDEX_KEY)
+            search_index = await _catch_up_search_index(pipe, search_index)
+            changed = {search_index.upsert(kind, item, now) for kind, dumped in items.items() for item in dumped}
+            removed.update(search_index.prune(now - SEARCH_RETENTION))
+            if search_index.revision is None:
+                # First write: nothing is persisted per document yet
+                changed = set(search_index.docs)
+            removed -= changed
+            revision = (search_index.revision or 0) + 1
+            pipe.multi()
+            if changed:
+                pipe.hset(SEARCH_DOCS_KEY, mapping={doc_id: search_index.record(doc_id) for doc_id in changed})
+            if removed:
+                pipe.hdel(SEARCH_DOCS_KEY, *removed)
+            if changed or removed:
+                pipe.zadd(SEARCH_CHANGES_KEY, {doc_id: revision for doc_id in changed | removed})
+            pipe.zremrangebyscore(SEARCH_CHANGES_KEY, "-inf", revision - SEARCH_CHANGE_LOG)
+            pipe.hset(SEARCH_INDEX_KEY, mapping={"revision": revision, "floor": revision - SEARCH_CHANGE_LOG})
+            # Whole-index blob written by older deploys
+            pipe.hdel(SEARCH_INDEX_KEY, "blob", "version")
+            try:
+                await pipe.execute()
+            except WatchError:
+                continue
+            search_index.revision = revision
+            return
+    raise RuntimeError("Search index kept changing while it was written")
+
+# Refresh single-flight: a Redis lease elects one refresher across workers,
+# and a shared task coalesces concurrent misses inside each worker
+_RENEW_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+def render_section_record(section: str, data) -> bytes:
+    """Render one NDJSON record for the streaming endpoint"""
+    return orjson.dumps({"section": section, "data": data}) + b"\n"
+
+class RefreshProgress:
+    """Sections parsed so far by an in-flight refresh, readable while it runs"""
+
+    def __init__(self):
+        self.records: Dict[str, bytes] = {}
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def add_section(self, section: str, items: list):
+        self.records[section] = render_section_record(section, [item.model_dump() for item in items])
+        self._notify()
+
+    def close(self):
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        """Yield (section, record) for every section, including ones added before we joined"""
+        seen = 0
+        while True:
+            changed = self._changed
+            records = list(self.records.items())
+            for section, record in records[seen:]:
+                yield section, record
+            seen = len(records)
+            if self.done:
+                return
+            await changed.wait()
+
+_refresh_tasks: Dict[IntelligenceScope, asyncio.Task] = {}
+_refresh_progress: Dict[IntelligenceScope, RefreshProgress] = {}
+
+def _refresh_lock_key(scope: IntelligenceScope) -> str:
+    return f"{scope.cache_key}:refresh_lock"
+
+async def _renew_refresh_lock(token: str, lock_key: str):
+    """Extend the refresh lease until cancelled or ownership is lost"""
+    while True:
+        await asyncio.sleep(REFRESH_LOCK_TTL / 3)
+        renewed = await redis_client.eval(
+            _RENEW_LOCK_SCRIPT, 1, lock_key, token, REFRESH_LOCK_TTL * 1000
+        )
+        if not renewed:
+            logging.warning("Lost market intelligence refresh lock lease")
+            return
+
+async def _wait_for_refresh(scope: IntelligenceScope) -> Optional[CacheEntry]:
+    """Poll the cache while another worker holds the refresh lock"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + REFRESH_WAIT_TIMEOUT
+    while loop.time() < deadline:
+        await asyncio.sleep(REFRESH_POLL_INTERVAL)
+        cached = await read_cache_entry(key=scope.cache_key)
+        if cached is not None:
+            return cached
+        if not await redis_client.exists(_refresh_lock_key(scope)):
+            # Lock released without a write: the other refresh failed
+            break
+    logging.warning("No market intelligence refresh result from lock holder")
+    return None
+
+async def _refresh_market_intelligence(scope: IntelligenceScope = DEFAULT_SCOPE,
+                                       progress: Optional[RefreshProgress] = None) -> Optional[CacheEntry]:
+    """Refresh the cache if this worker wins the lock, otherwise wait for the winner"""
+    token = uuid.uuid4().hex
+    lock_key = _refresh_lock_key(scope)
+    acquired = await redis_client.set(
+        lock_key, token, nx=True, px=REFRESH_LOCK_TTL * 1000
+    )
+    if not acquired:
+        return await _wait_for_refresh(scope)
+    
+    renewer = asyncio.create_task(_renew_refresh_lock(token, lock_key))
+    try:
+        if scope.id:
+            # If the scope was evicted since it was requested, don't spend Sonar calls on it
+            if await redis_client.zscore(SCOPE_REGISTRY_KEY, scope.id) is None:
+                logging.info("Market intelligence scope is not registered, skipping its refresh")
+                return None
+        previous = await redis_client.hget(scope.cache_key, "written_at")
+        now = time.time()
+        data = await build_market_intelligence(
+            on_section=progress.add_section if progress else None, scope=scope,
+            since=float(previous) if previous is not None else None, now=now
+        )
+        if data is None:
+            # Nothing was refetched: keep the snapshot, its ETag and its history samples
+            entry = await touch_cache_entries(scope)
+            if entry is not None:
+                l1_cache.clear()
+                await publish_update(entry, scope)
+                return entry
+            # It expired or was evicted meanwhile; the due categories are cached, so this costs no Sonar calls
+            data = await build_market_intelligence(scope=scope, now=now)
+        if not scope.id:
+            # The sections already include these samples. Scopes share the
+            # same curated metrics, so only the default scope records them
+            try:
+                with STAGE_SECONDS.labels(stage="history_record").time():
+                    await record_history(history_samples(data), now)
+            except Exception as e:
+                logging.error(f"Failed to update metric history: {str(e)}")
+        try:
+            with STAGE_SECONDS.labels(stage="search_index").time():
+                await update_search_index(data, now)
+        except Exception as e:
+            logging.error(f"Failed to update search index: {str(e)}")
+        with STAGE_SECONDS.labels(stage="serialize").time():
+            # Compressing seven bodies at maximum ratio takes tens of milliseconds; keep it off the event loop
+            entries = await asyncio.to_thread(render_cache_entries, data, scope)
+            entry = entries[scope.cache_key]
+        if not scope.id:
+            # Kept in memory first so a failed write still leaves this worker something fresh to serve
+            last_known_good.update(entry)
+        with STAGE_SECONDS.labels(stage="redis_write").time():
+            written = await write_cache_entries(entries, scope)
+        if not written:
+            logging.info("Market intelligence scope was evicted during its refresh, dropping its cache entries")
+            return entry
+        # Other workers drop theirs when the update is published
+        l1_cache.clear()
+        await publish_update(entry, scope)
+        return entry
+    finally:
+        renewer.cancel()
+        try:
+            await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+        except Exception as e:
+            logging.warning(f"Failed to release refresh lock: {str(e)}")
+
+def _log_refresh_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logging.error(f"Background market intelligence refresh failed: {str(task.exception())}")
+
+def _refresh_done(scope: IntelligenceScope, task: asyncio.Task):
+    _refresh_progress.pop(scope).close()
+    del _refresh_tasks[scope]
+
+def schedule_refresh(scope: IntelligenceScope = DEFAULT_SCOPE) -> asyncio.Task:
+    """Start a refresh of the scope unless one is already running in this worker"""
+    task = _refresh_tasks.get(scope)
+    if task is None:
+        _refresh_progress[scope] = RefreshProgress()
+        task = _refresh_tasks[scope] = asyncio.create_task(
+            _refresh_market_intelligence(scope, _refresh_progress[scope])
+        )
+        task.add_done_callback(_log_refresh_failure)
+        task.add_done_callback(lambda task: _refresh_done(scope, task))
+    return task
+
+async def refresh_market_intelligence(scope: IntelligenceScope = DEFAULT_SCOPE) -> Optional[CacheEntry]:
+    """Coalesce concurrent refreshes of a scope in this worker onto one shared task"""
+    # Shield so a disconnecting client doesn't cancel the refresh for everyone else
+    return await asyncio.shield(schedule_refresh(scope))
+
+# Background refresher: one leader per deployment keeps the cache warm so
+# user requests are served from Redis instead of waiting on Sonar
+async def _hold_refresh_leadership(token: str) -> bool:
+    """Acquire or renew the refresher leadership lease"""
+    if await redis_client.eval(
+        _RENEW_LOCK_SCRIPT, 1, REFRESH_LEADER_KEY, token, REFRESH_LEADER_TTL * 1000
+    ):
+        return True
+    return bool(await redis_client.set(
+        REFRESH_LEADER_KEY, token, nx=True, px=REFRESH_LEADER_TTL * 1000
+    ))
+
+def _refresh_backoff(failures: int) -> float:
+    """Exponential backoff with full jitter after consecutive refresh failures"""
+    return random.uniform(0, min(REFRESH_BACKOFF_MAX, REFRESH_BACKOFF_BASE * 2 ** failures))
+
+async def refresh_top_scopes(token: str):
+    """Admit candidate scopes that outrank the least used ones, then keep the most requested warm"""
+    if await sonar_budget_level() != "ok":
+        return
+    promoted = await scope_tracker.promote(SCOPE_PROMOTIONS_PER_REFRESH)
+    for scope in promoted + [scope for scope in await top_scopes(SCOPE_BACKGROUND_REFRESH) if scope not in promoted]:
+        cached = await read_cache_entry(key=scope.cache_key)
+        if cached is not None and cached.age < REFRESH_INTERVAL:
+            continue
+        # Refreshes run one at a time, so keep the lease alive between them
+        if not await _hold_refresh_leadership(token):
+            return
+        await refresh_market_intelligence(scope)
+
+async def run_background_refresher():
+    """Pre-warm the cache on startup and refresh it ahead of CACHE_TTL"""
+    token = uuid.uuid4().hex
+    check_interval = max(1, min(REFRESH_INTERVAL, REFRESH_LEADER_TTL // 3))
+    failures = 0
+    try:
+        while True:
+            delay = check_interval
+            try:
+                if await _hold_refresh_leadership(token):
+                    cached = await read_cache_entry()
+                    if cached is None or cached.age >= REFRESH_INTERVAL:
+                        await refresh_market_intelligence()
+                        logging.info("Background refresh of market intelligence completed")
+                    await refresh_top_scopes(token)
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                delay = _refresh_backoff(failures)
+                logging.error(f"Background refresh failed ({failures} in a row), retrying in {delay:.1f}s: {str(e)}")
+            await asyncio.sleep(delay)
+    finally:
+        # Hand leadership to another worker right away instead of waiting for the lease to lapse
+        try:
+            await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, REFRESH_LEADER_KEY, token)
+        except Exception:
+            pass
+
+def _cache_headers(status: str, age: float = 0) -> dict:
+    """Freshness headers the frontend reads to show how old the data is"""
+    return {"X-Cache-Status": status, "X-Cache-Age": str(int(age))}
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against our ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    quoted = f'"{etag}"'
+    return any(tag.strip().removeprefix("W/") == quoted for tag in if_none_match.split(","))
+
+def cached_payload_response(request: Request, entry: CacheEntry, status: str, encoding: str = "identity") -> Response:
+    """Serve a cache entry with validators, or 304 if the client already has it"""
+    CACHE_RESPONSES.labels(status=status).inc()
+    encoding, body = entry.variant(encoding)
+    # Browsers and CDNs may reuse the body until the soft TTL, then serve it stale
+    # while revalidating until the hard TTL evicts it
+    fresh_for = max(0, int(CACHE_TTL - entry.age))
+    stale_for = max(0, int(CACHE_HARD_TTL - entry.age)) - fresh_for
+    # Each encoding is a distinct representation, so it gets its own ETag
+    etag = entry.etag if encoding == "identity" else f"{entry.etag}-{encoding}"
+    headers = {
+        **_cache_headers(status, entry.age),
+        "ETag": f'"{etag}"',
+        "Last-Modified": formatdate(entry.written_at, usegmt=True),
+        "Cache-Control": f"public, max-age={fresh_for}, stale-while-revalidate={stale_for}",
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return payload_response(body, headers)
+
+def fallback_response(sections: Optional[List[str]] = None) -> Response:
+    """Serve fallback data; never let browsers or CDNs keep it"""
+    CACHE_RESPONSES.labels(status="fallback").inc()
+    headers = {**_cache_headers("fallback"), "Cache-Control": "no-store"}
+    return payload_response(render_fallback(sections), headers)
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Normalize ?fields= into sections in canonical order; None means the full document"""
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = requested - set(SECTION_PARSERS) - {"generated_at"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    sections = [section for section in SECTION_PARSERS if section in requested]
+    if not sections or len(sections) == len(SECTION_PARSERS):
+        return None
+    return sections
+
+async def read_view(sections: Optional[List[str]], encoding: str,
+                    scope: IntelligenceScope = DEFAULT_SCOPE) -> Optional[CacheEntry]:
+    """Read the full document, a single section, or a multi-section projection"""
+    if sections is None:
+        return await read_cache_entry(encoding, scope.cache_key)
+    if len(sections) == 1:
+        return await read_cache_entry(encoding, section_key(sections[0], scope))
+    # Projections are spliced from the section entries and compressed once per worker (L1 keeps them)
+    return await read_projection(sections, encoding, scope)
+
+def snapshot_view(sections: Optional[List[str]], scope: IntelligenceScope) -> Optional[CacheEntry]:
+    # Only the default scope is kept in memory; scoped requests get fallback data in an outage
+    return None if scope.id else last_known_good.view(sections)
+
+async def read_view_or_snapshot(sections: Optional[List[str]], encoding: str,
+                                scope: IntelligenceScope = DEFAULT_SCOPE) -> tuple:
+    """Read a view from the L1 cache or Redis; while Redis is down, use the in-memory snapshot
+
+    Returns (entry, live), where live is False if the entry came from memory.
+    """
+    if redis_health.available:
+        key = (scope, tuple(sections) if sections else None, encoding)
+        cached = l1_cache.get(key)
+        if cached is not None:
+            return cached, True
+        generation = l1_cache.generation
+        try:
+            with STAGE_SECONDS.labels(stage="redis_read").time():
+                cached = await asyncio.wait_for(read_view(sections, encoding, scope), REDIS_REQUEST_TIMEOUT)
+            redis_health.record_success()
+            l1_cache.count("l2", "hit" if cached is not None else "miss")
+            if cached is not None:
+                l1_cache.put(key, cached, generation)
+            return cached, True
+        except REDIS_OUTAGE_ERRORS as e:
+            redis_health.record_failure(e)
+            logging.warning(f"Redis unavailable, serving last known good payload: {str(e) or type(e).__name__}")
+    return snapshot_view(sections, scope), False
+
+def snapshot_response(request: Request, sections: Optional[List[str]], encoding: str,
+                      scope: IntelligenceScope = DEFAULT_SCOPE) -> Response:
+    """Serve the last known good payload, or fallback data if this worker never saw one"""
+    snapshot = snapshot_view(sections, scope)
+    if snapshot is None:
+        return fallback_response(sections)
+    return cached_payload_response(request, snapshot, "stale", encoding)
+
+async def serve_market_intelligence(request: Request, sections: Optional[List[str]] = None,
+                                    scope: IntelligenceScope = DEFAULT_SCOPE) -> Response:
+    """Serve cached market intelligence (or the requested sections of it) for a scope"""
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    # Tenants asking for the same scope share its cache entries; the tenant only weighs its priority
+    scope_tracker.touch(scope, request_tenant(request))
+    try:
+        # Check cache first
+        cached, live = await read_view_or_snapshot(sections, encoding, scope)
+        if not live:
+            # Redis is down: answer from memory instead of waiting on it or refreshing
+            return snapshot_response(request, sections, encoding, scope)
+        if cached is None:
+            if scope.id and not await scope_tracker.admitted(scope):
+                # At capacity: a new scope waits for the background refresher to admit it
+                return fallback_response(sections)
+            # Past the hard TTL (or never cached): this request has to wait
+            cached = await refresh_market_intelligence(scope)
+            if cached is not None and sections is not None:
+                cached = await read_view(sections, encoding, scope)
+            status = "miss"
+        elif cached.is_stale:
+            # Past the soft TTL: serve the stale payload and revalidate in the background
+            schedule_refresh(scope)
+            status = "stale"
+        else:
+            status = "hit"
+        
+        if cached is not None:
+            return cached_payload_response(request, cached, status, encoding)
         
+        return fallback_response(sections)
+        
+    except REDIS_OUTAGE_ERRORS as e:
+        # Redis went away during a refresh
+        redis_health.record_failure(e)
+        logging.error(f"Redis unavailable while refreshing market intelligence: {str(e) or type(e).__name__}")
+        return snapshot_response(request, sections, encoding, scope)
     except Exception as e:
         logging.error(f"Error generating market intelligence: {str(e)}")
         # Return fallback data on error
-        return generate_fallback_data()
+        return fallback_response(sections)
+
+@app.get("/api/market-intelligence", response_model=MarketIntelligenceResponse)
+async def get_market_intelligence(request: Request, fields: Optional[str] = None, industry: Optional[str] = None,
+                                  region: Optional[str] = None, topic: Optional[str] = None):
+    """Get real-time market intelligence using Perplexity Sonar Pro
+
+    ?fields=tools,trends returns only those sections plus generated_at.
+    ?industry=retail&region=emea&topic=retail media narrows every Sonar query.
+    """
+    return await serve_market_intelligence(request, parse_fields(fields), parse_scope(industry, region, topic))
+
+async def _ndjson_sections(cached: Optional[CacheEntry], refresh: bool = True,
+                           scope: IntelligenceScope = DEFAULT_SCOPE):
+    sent = set()
+    if cached is None and refresh:
+        # Cold path: emit each section the moment the in-flight refresh parses it
+        task = schedule_refresh(scope)
+        async for section, record in _refresh_progress[scope].follow():
+            sent.add(section)
+            yield record
+        try:
+            cached = await asyncio.shield(task)
+        except Exception as e:
+            logging.error(f"Streaming market intelligence refresh failed: {str(e)}")
+    
+    # Whatever wasn't streamed (cache hits, another worker's refresh, fallback) comes from the full payload
+    payload = orjson.loads(cached.variant("identity")[1] if cached else render_fallback())
+    for section in SECTION_PARSERS:
+        if section not in sent:
+            yield render_section_record(section, payload[section])
+    # Not a section: its own record type, last, once the snapshot it dates is complete
+    yield orjson.dumps({"generated_at": payload["generated_at"]}) + b"\n"
+
+@app.get("/api/market-intelligence/stream")
+async def stream_market_intelligence(request: Request, industry: Optional[str] = None, region: Optional[str] = None,
+                                     topic: Optional[str] = None):
+    """Stream market intelligence as NDJSON, one record per section as soon as it is ready"""
+    scope = parse_scope(industry, region, topic)
+    scope_tracker.touch(scope, request_tenant(request))
+    try:
+        cached, live = await read_view_or_snapshot(None, "identity", scope)
+    except Exception as e:
+        logging.error(f"Error reading market intelligence cache: {str(e)}")
+        cached, live = None, True
+    refresh = live
+    if live and cached is None and scope.id:
+        try:
+            refresh = await scope_tracker.admitted(scope)
+        except Exception as e:
+            logging.error(f"Error admitting market intelligence scope: {str(e)}")
+            refresh = False
+    if not live:
+        # Redis is down: stream the snapshot (or fallback data) without refreshing
+        status = "stale" if cached else "fallback"
+    elif not refresh:
+        # At capacity: a new scope waits for the background refresher to admit it
+        status = "fallback"
+    elif cached is None:
+        status = "miss"
+    elif cached.is_stale:
+        schedule_refresh(scope)
+        status = "stale"
+    else:
+        status = "hit"
+    CACHE_RESPONSES.labels(status=status).inc()
+    return StreamingResponse(
+        _ndjson_sections(cached, refresh=refresh, scope=scope),
+        media_type="application/x-ndjson",
+        headers={**_cache_headers(status, cached.age if cached else 0), "X-Accel-Buffering": "no"}
+    )
+
+# Server-Sent Events: every worker subscribes once to the updates channel and
+# fans each new cache entry out to its own connected clients
+class UpdateBroadcaster:
+    """Hands pre-rendered SSE events to this worker's connected clients"""
+
+    def __init__(self, max_clients: int):
+        self.max_clients = max_clients
+        self.clients = set()
+
+    @property
+    def full(self) -> bool:
+        return len(self.clients) >= self.max_clients
+
+    def subscribe(self) -> Optional[asyncio.Queue]:
+        if self.full:
+            return None
+        # Clients only ever need the newest snapshot, so one slot is enough
+        queue = asyncio.Queue(maxsize=1)
+        self.clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.clients.discard(queue)
+
+    def publish(self, event: bytes):
+        for queue in self.clients:
+            if queue.full():
+                queue.get_nowait()  # Slow client: drop the superseded event
+            queue.put_nowait(event)
+
+update_broadcaster = UpdateBroadcaster(SSE_MAX_CONNECTIONS)
+
+def render_sse_event(entry: CacheEntry) -> bytes:
+    """Render a cache entry as one SSE event, using its ETag as the event id"""
+    return b"id: %s\nevent: market-intelligence\ndata: %s\n\n" % (
+        entry.etag.encode(), entry.variant("identity")[1]
+    )
+
+async def publish_update(entry: CacheEntry, scope: IntelligenceScope = DEFAULT_SCOPE):
+    """Announce a freshly written cache entry to every worker"""
+    try:
+        await redis_client.publish(UPDATES_CHANNEL, f"{scope.id}:{entry.etag}" if scope.id else entry.etag)
+    except Exception as e:
+        logging.warning(f"Failed to publish market intelligence update: {str(e)}")
+
+async def run_update_listener():
+    """Relay update notifications from Redis pub/sub to local SSE clients and the search index"""
+    failures = 0
+    pushed_etag = None
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(UPDATES_CHANNEL)
+            # Updates published while we were unsubscribed were missed
+            l1_cache.clear()
+            failures = 0
+            while True:
+                # Explicit timeout so an idle channel isn't treated as a socket timeout
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                l1_cache.clear()
+                await sync_search_index()
+                if b":" in message["data"]:
+                    # A scoped update: SSE clients and the snapshot only follow the default scope
+                    continue
+                # Read even without SSE clients: it keeps the last known good snapshot current
+                entry = await read_cache_entry()
+                # A renewed snapshot keeps its ETag; clients already have it
+                if entry is not None and entry.etag != pushed_etag:
+                    pushed_etag = entry.etag
+                    if update_broadcaster.clients:
+                        update_broadcaster.publish(render_sse_event(entry))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, REDIS_OUTAGE_ERRORS):
+                redis_health.record_failure(e)
+            failures += 1
+            delay = _refresh_backoff(failures)
+            logging.warning(f"Update listener disconnected, resubscribing in {delay:.1f}s: {str(e)}")
+            await asyncio.sleep(delay)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+async def _sse_stream(request: Request, last_event_id: Optional[str]):
+    # Subscribed only once the body is being sent, next to the unsubscribe, so a
+    # client that disconnects before then never holds a slot
+    queue = update_broadcaster.subscribe()
+    if queue is None:
+        # Filled up since the handler checked; the client reconnects after the retry delay
+        yield b"retry: %d\n\n" % SSE_RETRY_MS
+        return
+    try:
+        yield b"retry: %d\n\n" % SSE_RETRY_MS
+        # Catch the client up unless it reconnected already holding the current entry
+        try:
+            current, _ = await read_view_or_snapshot(None, "identity")
+        except Exception as e:
+            logging.warning(f"SSE initial cache read failed: {str(e)}")
+            current = None
+        if current is not None and current.etag != last_event_id:
+            yield render_sse_event(current)
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield b": heartbeat\n\n"
+    finally:
+        update_broadcaster.unsubscribe(queue)
+
+@app.get("/api/market-intelligence/events")
+async def market_intelligence_events(request: Request):
+    """Push market intelligence to the client whenever the cache is refreshed"""
+    if update_broadcaster.full:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many live connections, retry shortly",
+            headers={"Retry-After": str(SSE_RETRY_MS // 1000)}
+        )
+    return StreamingResponse(
+        _sse_stream(request, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/market-intelligence/history")
+async def list_history_series():
+    """Series with recorded history, most recently updated first"""
+    index = await redis_client.zrevrange(f"{TIMESERIES_KEY_PREFIX}:index", 0, -1, withscores=True)
+    return {
+        "series": [
+            {"series": series.decode(), "last_updated": datetime.fromtimestamp(updated).isoformat()}
+            for series, updated in index
+        ]
+    }
+
+@app.get("/api/market-intelligence/history/{series}")
+async def get_history(series: str, resolution: str = "1h", start: Optional[datetime] = None,
+                      end: Optional[datetime] = None):
+    """Range query over one series (e.g. metric:ai-campaign-roi-improvement) at a resolution"""
+    step = parse_resolution(resolution)
+    if step is None:
+        raise HTTPException(status_code=400, detail=f"Invalid resolution: {resolution}")
+    if await redis_client.zscore(f"{TIMESERIES_KEY_PREFIX}:index", series) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown series: {series}")
+    end_ts = end.timestamp() if end else time.time()
+    start_ts = start.timestamp() if start else end_ts - (step or 3600) * 24
+    if start_ts > end_ts or (step and (end_ts - start_ts) / step > TIMESERIES_MAX_POINTS):
+        raise HTTPException(status_code=400, detail="Range is empty or too large for this resolution")
+    
+    points = (await read_history([series], step, start_ts, end_ts))[series]
+    if not step:
+        rows = [{"t": datetime.fromtimestamp(ts).isoformat(), "value": value} for ts, value in points]
+    else:
+        rows = [
+            {
+                "t": datetime.fromtimestamp(bucket).isoformat(),
+                "count": int(count),
+                "mean": total / count,
+                "min": low,
+                "max": high,
+            }
+            for bucket, count, total, _, low, high in points
+        ]
+    return {"series": series, "resolution": resolution, "points": rows[-TIMESERIES_MAX_POINTS:]}
+
+@app.get("/api/search")
+async def search(q: str, type: Optional[str] = None, category: Optional[str] = None,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None, limit: int = 20):
+    """Full-text search over every news item, tool and case study returned so far"""
+    kinds = [kind.strip() for kind in type.split(",") if kind.strip()] if type else None
+    if kinds and any(kind not in SEARCH_FIELDS for kind in kinds):
+        raise HTTPException(status_code=400, detail=f"type must be one of: {', '.join(SEARCH_FIELDS)}")
+    total, matches = search_index.search(
+        q, kinds, category,
+        since.timestamp() if since else None,
+        until.timestamp() if until else None,
+        max(1, min(limit, SEARCH_MAX_RESULTS))
+    )
+    results = []
+    for score, doc_id in matches:
+        doc = search_index.docs[doc_id]
+        results.append({
+            "type": doc["kind"],
+            "score": round(score, 4),
+            "first_seen": datetime.fromtimestamp(doc["first_seen"]).isoformat(),
+            "last_seen": datetime.fromtimestamp(doc["last_seen"]).isoformat(),
+            "item": doc["item"],
+        })
+    return {"query": q, "total": total, "results": results}
+
+@app.get("/api/sonar/usage")
+async def sonar_usage(days: int = 7):
+    """Sonar Pro calls and tokens per day and category, with the current budget state"""
+    today = datetime.utcnow().date()
+    dates = [(today - timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(max(1, min(days, 35)))]
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for date in dates:
+            pipe.hgetall(f"{SONAR_USAGE_KEY_PREFIX}:{date}")
+        counters = await pipe.execute()
+    usage = []
+    for date, fields in zip(dates, counters):
+        day = {"date": date, "requests": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+               "total_tokens": 0, "categories": {}}
+        for name, value in fields.items():
+            category, _, counter = name.decode().rpartition(":")
+            target = day["categories"].setdefault(category, {}) if category else day
+            target[counter] = int(value)
+        usage.append(day)
+    remaining = await _daily_tokens_left()
+    return {
+        "limits": {"requests_per_minute": SONAR_RPM_LIMIT, "daily_token_budget": SONAR_DAILY_TOKEN_BUDGET or None},
+        "budget": {"level": await sonar_budget_level(), "tokens_remaining": remaining},
+        "days": usage,
+    }
+
+@app.get("/api/market-intelligence/{section}")
+async def get_market_intelligence_section(request: Request, section: str, industry: Optional[str] = None,
+                                          region: Optional[str] = None, topic: Optional[str] = None):
+    """Get a single section (e.g. tools) from its own pre-rendered cache entry"""
+    if section not in SECTION_PARSERS:
+        raise HTTPException(status_code=404, detail=f"Unknown section: {section}")
+    return await serve_market_intelligence(request, [section], parse_scope(industry, region, topic))
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics, aggregated across workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = prom.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prom.REGISTRY
+    # Collecting reads every worker's metric files, so keep it off the event loop
+    body = await asyncio.to_thread(prom.generate_latest, registry)
+    return Response(content=body, headers={"Content-Type": prom.CONTENT_TYPE_LATEST})
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     perplexity_status = "configured" if PERPLEXITY_API_KEY else "not configured"
     
-    # Try Redis ping safely
+    # Try Redis ping safely, without waiting on it through a known outage
     try:
-        redis_status = "connected" if redis_client.ping() else "disconnected"
+        pong = redis_health.available and await asyncio.wait_for(redis_client.ping(), REDIS_SOCKET_TIMEOUT)
+        redis_status = "connected" if pong else "disconnected"
     except Exception:
         redis_status = "disconnected"
     
@@ -798,7 +3691,22 @@ async def health_check():
         "status": "ok",
         "version": "2.0.0",
         "perplexity": perplexity_status,
-        "redis": redis_status
+        "redis": redis_status,
+        "redis_health": redis_health.snapshot(),
+        "cache_tiers": l1_cache.snapshot(),
+        "scopes": scope_tracker.snapshot(),
+        "last_known_good": {
+            "etag": last_known_good.entry.etag,
+            "age": int(last_known_good.entry.age),
+        } if last_known_good.entry else None,
+        "sonar_query_mode": SONAR_QUERY_MODE,
+        "sonar_circuit": sonar_breaker.snapshot(),
+        "sonar_latency": {
+            "p50": sonar_latency.percentile(0.5),
+            "p95": sonar_latency.percentile(0.95),
+            "samples": len(sonar_latency.samples),
+        },
+        "last_sonar_fetch": last_sonar_fetch
     }
 
 # CORS middleware
@@ -808,4 +3716,5 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache-Status", "X-Cache-Age", "ETag", "Last-Modified"],
 ) 
\ No newline at end of file
@@ -1,11 +1,17 @@
 import { MarketIntelligenceData } from '@/types/api';
+import { getCacheAge } from '@/lib/utils';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000';
 
-export async function fetchMarketIntelligence(): Promise<MarketIntelligenceData> {
+export type MarketSection = 'trends' | 'news' | 'tools' | 'case_studies' | 'search_trends' | 'metrics';
+
+// Pass the sections a page renders to skip transferring and parsing the rest;
+// sections that weren't requested come back as empty lists
+export async function fetchMarketIntelligence(fields?: MarketSection[]): Promise<MarketIntelligenceData> {
   try {
     // Use absolute URL for server-side fetching
-    const url = `${API_BASE_URL}/api/market-intelligence`;
+    const query = fields?.length ? `?fields=${fields.join(',')}` : '';
+    const url = `${API_BASE_URL}/api/market-intelligence${query}`;
     
     const response = await fetch(url, {
       // Enable caching for better performance
@@ -26,7 +32,15 @@ export async function fetchMarketIntelligence(): Promise<MarketIntelligenceData>
       throw new Error('Invalid API response format');
     }
 
-    return data as MarketIntelligenceData;
+    const result = (fields?.length ? { ...getFallbackData(), ...data } : data) as MarketIntelligenceData;
+
+    // Surface how fresh the backend cache was (stale data is served while it refreshes)
+    const cacheAge = getCacheAge(response);
+    if (cacheAge !== undefined) {
+      return { ...result, cache_age: cacheAge };
+    }
+
+    return result;
   } catch (error) {
     console.error('Failed to fetch market intelligence:', error);
     
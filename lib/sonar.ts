@@ -1,7 +1,10 @@
 import { MarketIntelligenceData } from "@/types/api";
+import { getCacheAge } from "@/lib/utils";
 import { useState, useEffect } from "react";
 
 const MARKET_INTEL_ENDPOINT = `${process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000'}/api/market-intelligence`;
+const MARKET_INTEL_EVENTS_ENDPOINT = `${MARKET_INTEL_ENDPOINT}/events`;
+const MARKET_INTEL_STREAM_ENDPOINT = `${MARKET_INTEL_ENDPOINT}/stream`;
 
 // Add full response validation
 function validateMarketData(data: any): data is MarketIntelligenceData {
@@ -13,6 +16,23 @@ function validateMarketData(data: any): data is MarketIntelligenceData {
   );
 }
 
+function toMarketData(responseData: any, cacheAge?: number): MarketIntelligenceData {
+  if (!validateMarketData(responseData)) {
+    console.error('Invalid API response structure:', responseData);
+    throw new Error('Invalid API response structure');
+  }
+
+  const generatedAt = typeof responseData.generated_at === 'string'
+    ? new Date(responseData.generated_at as string)
+    : new Date(responseData.generated_at);
+
+  return {
+    ...responseData,
+    generated_at: generatedAt,
+    ...(cacheAge !== undefined && { cache_age: cacheAge })
+  } as MarketIntelligenceData;
+}
+
 export async function fetchMarketInsights() {
   try {
     const response = await fetch(MARKET_INTEL_ENDPOINT);
@@ -24,26 +44,49 @@ export async function fetchMarketInsights() {
     }
 
     const responseData = await response.json();
-    
-    if (!validateMarketData(responseData)) {
-      console.error('Invalid API response structure:', responseData);
-      throw new Error('Invalid API response structure');
-    }
-    
-    const generatedAt = typeof responseData.generated_at === 'string'
-      ? new Date(responseData.generated_at as string)
-      : new Date(responseData.generated_at);
-
-    return {
-      ...responseData,
-      generated_at: generatedAt
-    } as MarketIntelligenceData;
+    return toMarketData(responseData, getCacheAge(response));
   } catch (error) {
     console.error('Network error:', error);
     throw new Error(error instanceof Error ? error.message : 'Failed to fetch market data');
   }
 }
 
+// Read the NDJSON stream, handing each section over as soon as the backend has it,
+// so a cold backend cache doesn't hold the whole page until every section is ready
+export async function streamMarketInsights(
+  onSection: (section: keyof MarketIntelligenceData, data: unknown) => void,
+  onGeneratedAt?: (generatedAt: string) => void
+): Promise<void> {
+  const response = await fetch(MARKET_INTEL_STREAM_ENDPOINT);
+  if (!response.ok || !response.body) {
+    throw new Error(`API Error ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { done, value } = await reader.read();
+    buffer += decoder.decode(value, { stream: !done });
+
+    let newline: number;
+    while ((newline = buffer.indexOf('\n')) >= 0) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      if (line) {
+        const record = JSON.parse(line);
+        if (record.section) {
+          onSection(record.section, record.data);
+        } else if (record.generated_at) {
+          // Sent last, once every section is in
+          onGeneratedAt?.(record.generated_at);
+        }
+      }
+    }
+    if (done) break;
+  }
+}
+
 export function useLiveMarketData() {
   const [data, setData] = useState<MarketIntelligenceData | null>(null);
   const [error, setError] = useState<string | null>(null);
@@ -74,18 +117,86 @@ export function useLiveMarketData() {
       }
     };
 
-    fetchData(); // Fetch immediately
-
-    // Set up interval for every 60 seconds (not too frequent)
-    const interval = setInterval(() => {
-      if (isMounted && !isLoading) {
-        fetchData();
+    // First load: show sections as the backend streams them in, so a cold cache
+    // doesn't keep the page empty until every Sonar category has answered.
+    // Sections still on their way render as empty lists meanwhile.
+    let pushed = false;
+    const streamData = async () => {
+      const partial: Record<string, unknown> = {
+        trends: [], news: [], tools: [], case_studies: [], search_trends: [], metrics: [],
+        generated_at: new Date()
+      };
+      const render = () => {
+        if (!isMounted || pushed) return;
+        setData(toMarketData({ ...partial }));
+        setError(null);
+        setIsLoading(false);
+      };
+      try {
+        await streamMarketInsights(
+          (section, value) => {
+            partial[section] = value;
+            render();
+          },
+          (generatedAt) => {
+            partial.generated_at = generatedAt;
+            render();
+          }
+        );
+      } catch (err) {
+        if (isMounted && !pushed) {
+          // The event stream or polling will still deliver the data
+          console.error('Market data stream failed:', err);
+        }
       }
-    }, 60000);
+    };
+
+    let interval: ReturnType<typeof setInterval> | undefined;
+    const startPolling = () => {
+      if (interval) return;
+      fetchData(); // Fetch immediately
+
+      // Set up interval for every 60 seconds (not too frequent)
+      interval = setInterval(() => {
+        if (isMounted && !isLoading) {
+          fetchData();
+        }
+      }, 60000);
+    };
+
+    // Prefer server push: the backend sends the current data on connect and
+    // one event per cache refresh, instead of a poll every minute per tab
+    let source: EventSource | undefined;
+    if (typeof EventSource !== 'undefined') {
+      streamData();
+      source = new EventSource(MARKET_INTEL_EVENTS_ENDPOINT);
+      source.addEventListener('market-intelligence', (event) => {
+        if (!isMounted) return;
+        pushed = true;
+        try {
+          setData(toMarketData(JSON.parse((event as MessageEvent).data)));
+          setError(null);
+        } catch (err) {
+          setError(err instanceof Error ? err.message : 'Failed to load market data');
+        } finally {
+          setIsLoading(false);
+        }
+      });
+      source.onerror = () => {
+        // EventSource retries on its own (resuming via Last-Event-ID); fall back
+        // to polling only once it gives up, e.g. when the server is at capacity
+        if (source?.readyState === EventSource.CLOSED) {
+          startPolling();
+        }
+      };
+    } else {
+      startPolling();
+    }
     
     return () => {
       isMounted = false;
-      clearInterval(interval);
+      source?.close();
+      if (interval) clearInterval(interval);
     };
   }, []);
 
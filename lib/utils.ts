@@ -15,4 +15,13 @@ export const formatPercentage = (value: string | number) => {
     : value;
     
   return !isNaN(num) ? num.toFixed(1) + '%' : '0.0%';
-};
\ No newline at end of file
+};
+
+// Seconds since the backend generated the payload, read from the X-Cache-Age header
+export function getCacheAge(response: Response): number | undefined {
+  const header = response.headers?.get('X-Cache-Age');
+  if (header == null) return undefined;
+
+  const age = Number(header);
+  return Number.isFinite(age) ? age : undefined;
+}
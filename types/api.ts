@@ -41,6 +41,7 @@ export interface NewsArticle {
   business_impact: string;
   published_date: Date;
   category: string;
+  sources?: string[]; // Outlets that reported the story, merged across near-duplicates
 }
 
 export interface Tool {
@@ -53,6 +54,7 @@ export interface Tool {
   target_audience: string;
   launch_date?: Date;
   website_url?: string;
+  sources?: string[];
 }
 
 export interface CaseStudy {
@@ -74,6 +76,7 @@ export interface MarketIntelligenceData {
   search_trends: SearchTrend[];
   metrics: Metric[];
   generated_at: Date;
+  cache_age?: number; // Seconds since the backend generated this payload (X-Cache-Age)
 }
 
 